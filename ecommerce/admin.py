@@ -1,12 +1,13 @@
 # admin.py - Enhanced admin for payment management
 from django.contrib import admin
+from django.utils import timezone
 from django.utils.html import format_html
 from .models import Category, Product, Cart, CartItem, Order, OrderItem, PaymentTransaction
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'slug', 'created_at']
+    list_display = ['name', 'slug', 'available_product_count', 'created_at']
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ['name']
 
@@ -124,19 +125,20 @@ class OrderAdmin(admin.ModelAdmin):
     
     actions = ['mark_as_paid', 'mark_as_shipped', 'mark_as_delivered']
     
+    # queryset.update() skips auto_now, and updated_at drives the order pages' ETag and Last-Modified
     def mark_as_paid(self, request, queryset):
-        from django.utils import timezone
-        updated = queryset.update(status='paid', paid_at=timezone.now())
+        now = timezone.now()
+        updated = queryset.update(status='paid', paid_at=now, updated_at=now)
         self.message_user(request, f'{updated} order(s) marked as paid.')
     mark_as_paid.short_description = 'Mark selected orders as paid'
     
     def mark_as_shipped(self, request, queryset):
-        updated = queryset.update(status='shipped')
+        updated = queryset.update(status='shipped', updated_at=timezone.now())
         self.message_user(request, f'{updated} order(s) marked as shipped.')
     mark_as_shipped.short_description = 'Mark selected orders as shipped'
     
     def mark_as_delivered(self, request, queryset):
-        updated = queryset.update(status='delivered')
+        updated = queryset.update(status='delivered', updated_at=timezone.now())
         self.message_user(request, f'{updated} order(s) marked as delivered.')
     mark_as_delivered.short_description = 'Mark selected orders as delivered'
 
@@ -209,9 +211,9 @@ class CartAdmin(admin.ModelAdmin):
     inlines = [CartItemInline]
     
     def items_count(self, obj):
-        return obj.items.count()
+        return obj.item_count
     items_count.short_description = 'Items'
     
     def total(self, obj):
-        return f"${obj.get_total()}"
+        return f"${obj.subtotal}"
     total.short_description = 'Total'
\ No newline at end of file
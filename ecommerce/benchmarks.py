@@ -0,0 +1,299 @@
+# benchmarks.py - Micro benchmarks run through `manage.py benchmark`
+import statistics
+import time
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Register a benchmark; it receives the parsed options and returns a dict of results"""
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+class Rollback(Exception):
+    """Raised to discard the fixture rows a scenario created"""
+
+
+def run_in_rollback(func, *args, **kwargs):
+    """Run func inside a transaction that is always rolled back"""
+    result = {}
+    try:
+        with transaction.atomic():
+            result.update(func(*args, **kwargs))
+            raise Rollback
+    except Rollback:
+        pass
+    return result
+
+
+def timed(func, repeat):
+    """Return the per-call timings of func in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summarize(timings):
+    return {
+        'mean_ms': round(statistics.mean(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+    }
+
+
+def create_products(count, prefix='bench', categories=1):
+    """Bulk insert throwaway products for a scenario, spread over a few categories"""
+    from .models import Category, Product
+    created = [
+        Category.objects.create(name=f'{prefix} category {n}', slug=f'{prefix}-category-{n}-{time.time_ns()}')
+        for n in range(categories)
+    ]
+    batch = []
+    for i in range(count):
+        category = created[i % categories]
+        batch.append(Product(
+            name=f'{prefix} product {i}', slug=f'{prefix}-{category.id}-{i}', category=category,
+            description=f'Benchmark product number {i}', price=Decimal('0.99') + (i * 7) % 400,
+            stock=i % 60, available=True,
+        ))
+        if len(batch) >= 1000:
+            Product.objects.bulk_create(batch)
+            batch = []
+    Product.objects.bulk_create(batch)
+    return Product.objects.filter(category__in=created).select_related('category')
+
+
+@scenario('card_grid')
+def card_grid(options):
+    """Render a grid of product cards with and without per-product fragment caching"""
+    size, repeat = options['size'], options['repeat']
+    template_name = 'includes/product_card_list.html'
+    uncached = Template(
+        "{% for product in products %}{% include '" + template_name + "' %}{% endfor %}"
+    )
+    cached = Template(
+        "{% load catalog_tags %}{% product_cards products '" + template_name + "' %}"
+    )
+
+    def measure():
+        products = list(create_products(size, prefix='card-grid'))
+        context = Context({'products': products})
+        baseline = timed(lambda: uncached.render(context), repeat)
+        cold = timed(lambda: cached.render(context), 1)
+        warm = timed(lambda: cached.render(context), repeat)
+        return {
+            'cards': size,
+            'uncached': summarize(baseline),
+            'fragment_cache_cold': summarize(cold),
+            'fragment_cache_warm': summarize(warm),
+            'speedup_warm': round(statistics.median(baseline) / statistics.median(warm), 1),
+        }
+
+    return run_in_rollback(measure)
+
+
+@scenario('facets')
+def facets(options):
+    """Compare single-query facet counts against one COUNT per facet value"""
+    from .facets import PRICE_RANGES, FacetEngine, FacetSelection, price_q
+    from .models import Category, Product
+
+    size, repeat = options['size'], max(1, options['repeat'] // 4)
+
+    def measure():
+        create_products(size, prefix='facets', categories=10)
+        categories = list(Category.objects.all())
+        products = Product.objects.filter(available=True)
+        selection = FacetSelection(price_ranges=['25-50', '50-100'], in_stock=True)
+        engine = FacetEngine(selection, categories)
+
+        def per_value_counts():
+            counts = [engine.apply(products).count()]
+            for category in categories:
+                counts.append(products.filter(price_q(25, 100), stock__gt=0, category=category).count())
+            for _, _, low, high in PRICE_RANGES:
+                counts.append(products.filter(price_q(low, high), stock__gt=0).count())
+            counts.append(products.filter(price_q(25, 100), stock__gt=0).count())
+            return counts
+
+        with CaptureQueriesContext(connection) as naive_queries:
+            per_value_counts()
+        with CaptureQueriesContext(connection) as engine_queries:
+            engine.counts(products)
+        naive = timed(per_value_counts, repeat)
+        single = timed(lambda: engine.counts(products), repeat)
+        return {
+            'products': Product.objects.count(),
+            'facet_values': len(categories) + len(PRICE_RANGES) + 1,
+            'per_value_counts': dict(summarize(naive), queries=len(naive_queries)),
+            'single_query_engine': dict(summarize(single), queries=len(engine_queries)),
+            'speedup': round(statistics.median(naive) / statistics.median(single), 1),
+        }
+
+    return run_in_rollback(measure)
+
+
+@scenario('anonymous_carts')
+def anonymous_carts(options):
+    """DB writes made by anonymous sessions with database-backed versus cookie carts"""
+    from django.test import Client
+    from django.test.utils import override_settings
+    from django.urls import reverse
+
+    sessions = options['size']
+    writes = ('INSERT', 'UPDATE', 'DELETE')
+
+    def browse(products):
+        # Everyone looks around and opens the cart; one visitor in four adds something
+        for n in range(sessions):
+            client = Client()
+            product = products[n % len(products)]
+            client.get(reverse('home'))
+            client.get(reverse('product_detail', args=[product.slug]))
+            client.get(reverse('cart'))
+            if n % 4 == 0:
+                client.get(reverse('add_to_cart', args=[product.id]))
+                client.get(reverse('cart'))
+
+    def measure(mode):
+        products = list(create_products(20, prefix=f'carts-{mode}'))
+        with override_settings(ANONYMOUS_CART_STORAGE=mode, REQUEST_METRICS_SAMPLE_RATE=0), \
+                CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            browse(products)
+            elapsed = time.perf_counter() - started
+        write_count = sum(1 for query in queries.captured_queries if query['sql'].lstrip().upper().startswith(writes))
+        return {
+            'writes': write_count,
+            'writes_per_1000_sessions': round(write_count * 1000 / sessions),
+            'queries_per_session': round(len(queries) / sessions, 1),
+            'ms_per_session': round(elapsed * 1000 / sessions, 2),
+        }
+
+    db = run_in_rollback(measure, 'db')
+    cookie = run_in_rollback(measure, 'cookie')
+    return {
+        'sessions': sessions,
+        'db_carts': db,
+        'cookie_carts': cookie,
+        'writes_saved_per_1000_sessions': db['writes_per_1000_sessions'] - cookie['writes_per_1000_sessions'],
+    }
+
+
+def _legacy_checkout(cart):
+    """create_order before it was made atomic: row-by-row inserts and read-modify-write stock"""
+    from .models import Order, OrderItem
+    items = cart.get_items()
+    order = Order.objects.create(
+        first_name='Bench', last_name='Buyer', email='bench@example.com', address='1 Bench Rd',
+        postal_code='00100', city='Nairobi', payment_method='card', total_amount=cart.get_total(),
+        status='processing',
+    )
+    for item in items:
+        OrderItem.objects.create(order=order, product=item.product, price=item.product.price, quantity=item.quantity)
+    order.status = 'paid'
+    order.save()
+    for item in items:
+        item.product.stock -= item.quantity
+        item.product.save()
+    cart.items.all().delete()
+    return order
+
+
+def _atomic_checkout(cart):
+    from .orders import place_order
+    return place_order(cart, None, {
+        'first_name': 'Bench', 'last_name': 'Buyer', 'email': 'bench@example.com', 'address': '1 Bench Rd',
+        'postal_code': '00100', 'city': 'Nairobi', 'payment_method': 'card', 'status': 'paid',
+    })
+
+
+@scenario('parallel_checkout')
+def parallel_checkout(options):
+    """Concurrent checkouts of carts sharing one scarce product, old create_order versus place_order"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.db import connections
+
+    from .cart import add_items
+    from . import search
+    from .models import Cart, CartItem, Category, Order, OrderItem
+    from .orders import OutOfStock
+
+    checkouts, threads = options['size'], 8
+    scarce_stock = checkouts // 2
+
+    def run(mode, checkout):
+        # Threads use their own connections, so the fixture is committed and removed afterwards
+        products = list(create_products(4, prefix=f'checkout-{mode}'))
+        scarce = products[0]
+        type(scarce).objects.filter(pk=scarce.pk).update(stock=scarce_stock)
+        type(scarce).objects.filter(pk__in=[p.pk for p in products[1:]]).update(stock=checkouts * 10)
+        carts = Cart.objects.bulk_create([Cart(session_key=f'checkout-{mode}-{n}') for n in range(checkouts)])
+        for cart in carts:
+            add_items(cart, {product.pk: 1 for product in products})
+        outcome = {'orders': 0, 'out_of_stock': 0, 'errors': 0}
+
+        def attempt(cart):
+            try:
+                checkout(Cart.objects.get(pk=cart.pk))
+                return 'orders'
+            except OutOfStock:
+                return 'out_of_stock'
+            except Exception:
+                return 'errors'
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            for result in pool.map(attempt, carts):
+                outcome[result] += 1
+        elapsed = time.perf_counter() - started
+
+        sold = sum(OrderItem.objects.filter(product=scarce).values_list('quantity', flat=True))
+        left = type(scarce).objects.get(pk=scarce.pk).stock
+        outcome.update({
+            'seconds': round(elapsed, 2),
+            'checkouts_per_second': round(checkouts / elapsed, 1),
+            'scarce_stock': scarce_stock,
+            'scarce_units_sold': sold,
+            'oversold_units': max(0, sold - scarce_stock),
+            'stock_left': left,
+            'lost_stock_updates': left - (scarce_stock - sold),
+        })
+
+        # The fixture was bulk inserted without signals, so it is removed the same way
+        order_ids = OrderItem.objects.filter(product__in=products).values_list('order_id', flat=True)
+        Order.objects.filter(pk__in=list(order_ids)).delete()
+        cart_ids = [cart.pk for cart in carts]
+        product_ids = [product.pk for product in products]
+        with connection.cursor() as cursor:
+            for model, column, ids in ((CartItem, 'cart_id', cart_ids), (Cart, 'id', cart_ids),
+                                       (type(scarce), 'id', product_ids), (Category, 'id', [scarce.category_id])):
+                placeholders = ', '.join(['%s'] * len(ids))
+                cursor.execute(f'DELETE FROM {model._meta.db_table} WHERE {column} IN ({placeholders})', ids)
+        for product_id in product_ids:
+            search.remove_product(product_id)
+        return outcome
+
+    legacy = run('legacy', _legacy_checkout)
+    atomic = run('atomic', _atomic_checkout)
+    return {
+        'checkouts': checkouts,
+        'threads': threads,
+        'legacy_create_order': legacy,
+        'atomic_place_order': atomic,
+        'speedup': round(atomic['checkouts_per_second'] / legacy['checkouts_per_second'], 1),
+    }
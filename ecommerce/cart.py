@@ -0,0 +1,293 @@
+# cart.py - Anonymous carts kept in a signed cookie, and the header cart summary
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from . import counters
+from .models import Cart, CartItem, Product
+
+COOKIE_NAME = 'cart'
+COOKIE_SALT = 'ecommerce.cart'
+# Session entry naming the anonymous stored cart; it survives the session key change at login
+SESSION_CART_KEY = 'cart_id'
+
+
+def cookie_mode(request):
+    """
+    Whether this visitor's cart lives in a cookie instead of Cart rows. Once
+    checkout has moved it into a stored Cart (named in the session), it
+    stays there. Visitors without a session cookie cost no query here.
+    """
+    return (
+        settings.ANONYMOUS_CART_STORAGE == 'cookie' and not request.user.is_authenticated
+        and SESSION_CART_KEY not in request.session
+    )
+
+
+class CookieCartItem:
+    """Quacks like a CartItem for the templates; its id is the product id"""
+
+    def __init__(self, product, quantity):
+        self.id = product.id
+        self.product = product
+        self.quantity = quantity
+
+    def get_subtotal(self):
+        return self.product.price * self.quantity
+
+
+class CookieCart:
+    """
+    A cart of {product id: quantity} carried in a signed cookie, so anonymous
+    browsing never creates session or Cart rows. It is copied into a Cart
+    with move_to() at checkout or login; CartMiddleware writes the
+    cookie back when the cart changed.
+    """
+
+    def __init__(self, lines=None):
+        self.lines = lines or {}
+        self.modified = False
+        self._items = None
+
+    @classmethod
+    def for_request(cls, request):
+        """The request's cookie cart, loaded once per request"""
+        cart = getattr(request, '_cookie_cart', None)
+        if cart is None:
+            cart = cls(cls._load(request))
+            request._cookie_cart = cart
+        return cart
+
+    @staticmethod
+    def _load(request):
+        try:
+            raw = request.get_signed_cookie(COOKIE_NAME, salt=COOKIE_SALT, max_age=settings.CART_COOKIE_AGE)
+            lines = json.loads(raw)
+            return {int(pk): int(qty) for pk, qty in lines.items() if int(qty) > 0}
+        except (KeyError, signing.BadSignature, ValueError, AttributeError):
+            return {}
+
+    def dumps(self):
+        return json.dumps({str(pk): qty for pk, qty in self.lines.items()}, separators=(',', ':'))
+
+    def _changed(self):
+        self.modified = True
+        self._items = None
+
+    def add(self, product, quantity=1):
+        if product.id not in self.lines and len(self.lines) >= settings.CART_COOKIE_MAX_LINES:
+            return False
+        self.lines[product.id] = self.lines.get(product.id, 0) + quantity
+        self._changed()
+        return True
+
+    def update(self, product_id, quantity):
+        if product_id in self.lines:
+            self.lines[product_id] = quantity
+            self._changed()
+
+    def remove(self, product_id):
+        if self.lines.pop(product_id, None) is not None:
+            self._changed()
+
+    def clear(self):
+        if self.lines:
+            self.lines = {}
+            self._changed()
+
+    def get_items(self):
+        """The cart lines with their products, skipping products that no longer exist"""
+        if self._items is None:
+            products = Product.objects.select_related('category').in_bulk(list(self.lines))
+            self._items = [
+                CookieCartItem(products[pk], qty) for pk, qty in self.lines.items() if pk in products
+            ]
+        return self._items
+
+    def get_total(self):
+        return sum((item.get_subtotal() for item in self.get_items()), Decimal('0.00'))
+
+    @property
+    def item_count(self):
+        return sum(self.lines.values())
+
+    @property
+    def subtotal(self):
+        return self.get_total()
+
+    def move_to(self, cart):
+        """Add the cookie lines to a Cart's rows and empty the cookie"""
+        if not self.lines:
+            return
+        existing = set(Product.objects.filter(id__in=list(self.lines)).values_list('id', flat=True))
+        add_items(cart, {pk: qty for pk, qty in self.lines.items() if pk in existing})
+        self.clear()
+
+
+def _upsert_sql(rows, replace):
+    table = connection.ops.quote_name(CartItem._meta.db_table)
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(rows))
+    quantity = 'excluded.quantity' if replace else f'{table}.quantity + excluded.quantity'
+    sql = (
+        f'INSERT INTO {table} (cart_id, product_id, quantity, added_at) VALUES {values} '
+        f'ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {quantity}'
+    )
+    return sql, [value for row in rows for value in row]
+
+
+def _upsert_portable(cart, quantities, replace):
+    """UPDATE-then-INSERT per line for databases without ON CONFLICT; the unique constraint settles races"""
+    for product_id, quantity in quantities.items():
+        items = CartItem.objects.filter(cart=cart, product_id=product_id)
+        change = {'quantity': quantity if replace else F('quantity') + quantity}
+        if items.update(**change):
+            continue
+        try:
+            with transaction.atomic():
+                CartItem.objects.bulk_create([CartItem(cart=cart, product_id=product_id, quantity=quantity)])
+        except IntegrityError:
+            items.update(**change)
+
+
+def add_items(cart, quantities, replace=False):
+    """
+    Add {product id: quantity} to a Cart's rows as one atomic upsert: the
+    quantities are added to existing lines (or replace them with
+    replace=True; a quantity of 0 then removes the line). Concurrent adds
+    of the same product cannot lose an increment, and the cart summary is
+    recalculated in the same transaction.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity or replace}
+    if not quantities:
+        return
+    removed = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+    upserts = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with transaction.atomic():
+        if removed:
+            CartItem.objects.filter(cart=cart, product_id__in=removed).delete()
+        if upserts and connection.vendor in ('sqlite', 'postgresql'):
+            rows = [(cart.pk, product_id, quantity, now) for product_id, quantity in upserts.items()]
+            with connection.cursor() as cursor:
+                cursor.execute(*_upsert_sql(rows, replace))
+        elif upserts:
+            _upsert_portable(cart, upserts, replace)
+        # The upsert bypasses the CartItem signals
+        counters.recalculate_carts(Cart.objects.filter(pk=cart.pk), touch=True)
+    cart.refresh_from_db(fields=['item_count', 'subtotal', 'updated_at'])
+    cart.forget_items()
+
+
+def merge_carts(source, target):
+    """
+    Fold every line of source into target and delete source, with a fixed
+    number of set-based statements however many lines there are: lines both
+    carts hold are summed into target, the rest are moved over.
+    """
+    source_lines = CartItem.objects.filter(cart=source)
+    shared = CartItem.objects.filter(cart=target, product_id__in=source_lines.values('product_id'))
+    with transaction.atomic():
+        Cart.objects.select_for_update().filter(pk=target.pk).first()
+        source_quantity = source_lines.filter(product_id=OuterRef('product_id')).values('quantity')[:1]
+        shared.update(quantity=F('quantity') + Subquery(source_quantity))
+        source_lines.exclude(product_id__in=CartItem.objects.filter(cart=target).values('product_id')).update(cart=target)
+        with connection.cursor() as cursor:
+            # What is left is already counted in target; delete it without per-row signals
+            cursor.execute(
+                f'DELETE FROM {connection.ops.quote_name(CartItem._meta.db_table)} WHERE cart_id = %s', [source.pk]
+            )
+        Cart.objects.filter(pk=source.pk).delete()
+        counters.recalculate_carts(Cart.objects.filter(pk=target.pk), touch=True)
+    target.refresh_from_db(fields=['item_count', 'subtotal', 'updated_at'])
+    target.forget_items()
+
+
+def remove_ordered(cart, lines):
+    """
+    Take an order's [(product_id, quantity), ...] out of a stored Cart: each
+    line is reduced by the ordered quantity and dropped once nothing is left,
+    so products added after the order was placed stay in the cart.
+    """
+    ordered = {}
+    for product_id, quantity in lines:
+        ordered[product_id] = ordered.get(product_id, 0) + quantity
+    with transaction.atomic():
+        Cart.objects.select_for_update().filter(pk=cart.pk).first()
+        held = CartItem.objects.filter(cart=cart, product_id__in=list(ordered)).values_list('product_id', 'quantity')
+        add_items(cart, {product_id: max(quantity - ordered[product_id], 0) for product_id, quantity in held}, replace=True)
+
+
+def clear_cart(cart):
+    """Delete every line of a stored Cart with one statement, without per-row signals"""
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {connection.ops.quote_name(CartItem._meta.db_table)} WHERE cart_id = %s', [cart.pk]
+            )
+        counters.recalculate_carts(Cart.objects.filter(pk=cart.pk), touch=True)
+    cart.refresh_from_db(fields=['item_count', 'subtotal', 'updated_at'])
+    cart.forget_items()
+
+
+def _get_or_create_stored_cart(request):
+    if request.user.is_authenticated:
+        cart, created = Cart.objects.get_or_create(user=request.user)
+    else:
+        cart_id = request.session.get(SESSION_CART_KEY)
+        cart = Cart.objects.filter(pk=cart_id, user__isnull=True).first() if cart_id else None
+        if cart is None:
+            session_key = request.session.session_key
+            if not session_key:
+                request.session.create()
+                session_key = request.session.session_key
+            cart, created = Cart.objects.get_or_create(session_key=session_key)
+        if request.session.get(SESSION_CART_KEY) != cart.pk:
+            request.session[SESSION_CART_KEY] = cart.pk
+        if settings.ANONYMOUS_CART_STORAGE == 'cookie':
+            # Checking out needs real rows: move the cookie cart into this Cart
+            CookieCart.for_request(request).move_to(cart)
+    return cart
+
+
+def resolve_cart(request, create=False):
+    """
+    The visitor's cart, resolved once per request (request.cart is a lazy
+    call of this). Anonymous visitors in cookie mode get their CookieCart;
+    create=True swaps it for a stored Cart holding its lines, for checkout.
+    From then on the Cart named in the session is resolved, never the
+    now empty cookie.
+    """
+    cart = getattr(request, '_cart', None)
+    if cart is None or (create and isinstance(cart, CookieCart)):
+        if cookie_mode(request) and not create:
+            cart = CookieCart.for_request(request)
+        else:
+            cart = _get_or_create_stored_cart(request)
+        request._cart = cart
+    return cart
+
+
+def get_cart_summary(request):
+    """
+    Something with item_count and subtotal for the visitor's cart, memoized on
+    the request: the cart the view already resolved, their CookieCart, their
+    stored Cart, or an empty CookieCart. Never loads cart items.
+    """
+    summary = getattr(request, '_cart_summary', None) or getattr(request, '_cart', None)
+    if summary is None:
+        if cookie_mode(request):
+            summary = CookieCart.for_request(request)
+        else:
+            carts = Cart.objects.only('id', 'item_count', 'subtotal', 'updated_at')
+            if request.user.is_authenticated:
+                summary = carts.filter(user=request.user).first()
+            elif request.session.session_key:
+                summary = carts.filter(session_key=request.session.session_key).first()
+            summary = summary or CookieCart()
+        request._cart_summary = summary
+    return summary
@@ -0,0 +1,66 @@
+# catalog_cache.py - Versioned read-through cache for catalog data
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .stats import StatCounters
+
+VERSION_KEY = 'catalog:version'
+
+_MISSING = object()
+_stats = StatCounters('hits', 'misses', 'bumps')
+
+
+def get_stats():
+    """Hit/miss counters for this process"""
+    stats = _stats.snapshot()
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+def reset_stats():
+    _stats.reset()
+
+
+def get_version():
+    """
+    Current catalog version. It is seeded from the clock so that a version
+    lost to eviction or a cache restart never collides with an older one.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """Invalidate every cached catalog entry at once"""
+    _stats.count('bumps')
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(VERSION_KEY, version, None)
+        return version
+
+
+def make_key(name, *parts):
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'catalog:{get_version()}:{name}:{digest}'
+
+
+def read_through(name, builder, *parts, timeout=None):
+    """Return the cached value for (name, parts), building and storing it on a miss"""
+    key = make_key(name, *parts)
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _stats.count('hits')
+        return value
+    _stats.count('misses')
+    value = builder()
+    cache.set(key, value, settings.CATALOG_CACHE_TIMEOUT if timeout is None else timeout)
+    return value
@@ -0,0 +1,133 @@
+# cleanup.py - Chunked deletion of expired sessions, idempotency keys, finished jobs and abandoned carts
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.contrib.sessions.models import Session
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Cart, CartItem, IdempotencyKey, Job, Order
+
+
+@dataclass
+class PurgeStats:
+    table: str
+    rows: int = 0
+    batches: int = 0
+    seconds: float = 0.0  # time spent finding and deleting rows, not the pauses between batches
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def _delete_ids(model, column, ids):
+    """Delete rows by key with one plain DELETE, skipping ORM cascades and per-row signals"""
+    table = connection.ops.quote_name(model._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {connection.ops.quote_name(column)} IN ({placeholders})', ids)
+        return cursor.rowcount
+
+
+def purge_expired_sessions(chunk_size=1000, pause=0.1, now=None):
+    """
+    Delete expired DB sessions in key-ordered batches of at most chunk_size,
+    one short transaction per batch, sleeping `pause` seconds in between.
+    """
+    now = now or timezone.now()
+    stats = PurgeStats('django_session')
+    last_key = ''
+    while True:
+        started = time.perf_counter()
+        keys = list(
+            Session.objects.filter(expire_date__lt=now, session_key__gt=last_key)
+            .order_by('session_key').values_list('session_key', flat=True)[:chunk_size]
+        )
+        if not keys:
+            break
+        with transaction.atomic():
+            stats.rows += _delete_ids(Session, 'session_key', keys)
+        stats.seconds += time.perf_counter() - started
+        stats.batches += 1
+        last_key = keys[-1]
+        time.sleep(pause)
+    return stats
+
+
+def _purge_by_id(model, expired, chunk_size, pause):
+    """Delete the rows of an expired queryset in id-ordered batches"""
+    stats = PurgeStats(model._meta.db_table)
+    last_id = 0
+    while True:
+        started = time.perf_counter()
+        ids = list(expired.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            stats.rows += _delete_ids(model, 'id', ids)
+        stats.seconds += time.perf_counter() - started
+        stats.batches += 1
+        last_id = ids[-1]
+        time.sleep(pause)
+    return stats
+
+
+def purge_expired_idempotency_keys(chunk_size=1000, pause=0.1, now=None):
+    """Delete expired stored Idempotency-Key responses"""
+    expired = IdempotencyKey.objects.filter(expires_at__lte=now or timezone.now())
+    return _purge_by_id(IdempotencyKey, expired, chunk_size, pause)
+
+
+def purge_finished_jobs(days=7, chunk_size=1000, pause=0.1, now=None):
+    """Delete jobs that finished successfully more than `days` ago; dead jobs are kept for inspection"""
+    finished = Job.objects.filter(status='done', finished_at__lt=(now or timezone.now()) - timedelta(days=days))
+    return _purge_by_id(Job, finished, chunk_size, pause)
+
+
+def stale_carts(idle_days, user_idle_days=None, now=None):
+    """
+    Anonymous carts whose session is gone or that have been idle for
+    idle_days, plus user carts idle for user_idle_days when given.
+    """
+    now = now or timezone.now()
+    session_alive = Exists(Session.objects.filter(session_key=OuterRef('session_key'), expire_date__gte=now))
+    stale = Q(user__isnull=True) & (
+        Q(session_key__isnull=True) | ~session_alive | Q(updated_at__lt=now - timedelta(days=idle_days))
+    )
+    if user_idle_days is not None:
+        stale |= Q(user__isnull=False, updated_at__lt=now - timedelta(days=user_idle_days))
+    return Cart.objects.filter(stale)
+
+
+def purge_stale_carts(idle_days=30, user_idle_days=None, chunk_size=1000, pause=0.1, now=None):
+    """
+    Delete stale carts and their items walking the cart id range in windows
+    of chunk_size ids, one short transaction per window. Returns the
+    (carts, items) PurgeStats.
+    """
+    carts = PurgeStats('ecommerce_cart')
+    items = PurgeStats('ecommerce_cartitem')
+    started = time.perf_counter()
+    candidates = stale_carts(idle_days, user_idle_days, now)
+    bounds = Cart.objects.order_by('id').values_list('id', flat=True)
+    low, high = bounds.first(), bounds.last()
+    if low is not None:
+        for window in range(low, high + 1, chunk_size):
+            ids = list(candidates.filter(id__gte=window, id__lt=window + chunk_size).values_list('id', flat=True))
+            if ids:
+                with transaction.atomic():
+                    items.rows += _delete_ids(CartItem, 'cart_id', ids)
+                    # The plain DELETE skips Order.cart's SET_NULL
+                    Order.objects.filter(cart_id__in=ids).update(cart=None)
+                    carts.rows += _delete_ids(Cart, 'id', ids)
+                carts.batches += 1
+                carts.seconds += time.perf_counter() - started
+                time.sleep(pause)
+                started = time.perf_counter()
+    carts.seconds += time.perf_counter() - started
+    items.seconds = carts.seconds
+    items.batches = carts.batches
+    return carts, items
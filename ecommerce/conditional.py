@@ -0,0 +1,124 @@
+# conditional.py - ETag / Last-Modified validators for conditional GET
+import hashlib
+from functools import wraps
+
+from django.contrib import messages
+from django.db.models import Max
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from . import catalog_cache
+from .cart import get_cart_summary
+from .models import Order, Product
+
+
+def _viewer(request):
+    """The per-visitor bits the shared page chrome depends on, including the cart badge"""
+    user = getattr(request, 'user', None)
+    items = get_cart_summary(request).item_count
+    if user is not None and user.is_authenticated:
+        return f'u{user.pk}:c{items}', user.last_login
+    return f'anon:c{items}', None
+
+
+def _has_pending_messages(request):
+    # len() loads queued messages without marking them as shown
+    return len(messages.get_messages(request)) > 0
+
+
+def _etag(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _catalog_modified(request):
+    """
+    The latest Product.updated_at, read through the catalog cache once per
+    request for both validators. It expires with the cached pages, so a
+    validator is never valid for longer than the data it stands for.
+    """
+    if not hasattr(request, '_catalog_modified'):
+        request._catalog_modified = catalog_cache.read_through(
+            'last_modified',
+            lambda: Product.objects.aggregate(latest=Max('updated_at'))['latest'],
+        )
+    return request._catalog_modified
+
+
+def catalog_etag(request, *args, **kwargs):
+    if _has_pending_messages(request):
+        return None
+    viewer, _ = _viewer(request)
+    modified = _catalog_modified(request)
+    return _etag(
+        'catalog', catalog_cache.get_version(), modified.timestamp() if modified else '',
+        request.get_full_path(), viewer,
+    )
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    if _has_pending_messages(request):
+        return None
+    modified = _catalog_modified(request)
+    _, last_login = _viewer(request)
+    if modified and last_login:
+        return max(modified, last_login)
+    return modified
+
+
+def _order_updated_at(request, order_id, owner_only):
+    """The order's updated_at, read once per request for both validators"""
+    cache = request.__dict__.setdefault('_order_updated_at', {})
+    key = (order_id, owner_only)
+    if key not in cache:
+        orders = Order.objects.filter(id=order_id)
+        if owner_only:
+            if not request.user.is_authenticated:
+                return None
+            orders = orders.filter(user=request.user)
+        cache[key] = orders.values_list('updated_at', flat=True).first()
+    return cache[key]
+
+
+def order_validators(owner_only):
+    """Build ETag and Last-Modified functions for a view taking order_id"""
+    def etag(request, order_id, *args, **kwargs):
+        if _has_pending_messages(request):
+            return None
+        updated_at = _order_updated_at(request, order_id, owner_only)
+        if updated_at is None:
+            return None
+        viewer, _ = _viewer(request)
+        return _etag('order', order_id, updated_at.timestamp(), viewer)
+
+    def last_modified(request, order_id, *args, **kwargs):
+        if _has_pending_messages(request):
+            return None
+        updated_at = _order_updated_at(request, order_id, owner_only)
+        _, last_login = _viewer(request)
+        if updated_at and last_login:
+            return max(updated_at, last_login)
+        return updated_at
+
+    return etag, last_modified
+
+
+def conditional_page(etag_func, last_modified_func):
+    """
+    Answer If-None-Match / If-Modified-Since with 304 before the view renders,
+    and make browsers revalidate instead of reusing pages heuristically.
+    """
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+catalog_conditional = conditional_page(catalog_etag, catalog_last_modified)
+order_conditional = conditional_page(*order_validators(owner_only=True))
+order_success_conditional = conditional_page(*order_validators(owner_only=False))
@@ -0,0 +1,9 @@
+# context_processors.py - Template context shared by every page
+from django.utils.functional import SimpleLazyObject
+
+from .cart import get_cart_summary
+
+
+def cart_summary(request):
+    """The header cart badge: item_count and subtotal, looked up only if a template uses them"""
+    return {'cart_summary': SimpleLazyObject(lambda: get_cart_summary(request))}
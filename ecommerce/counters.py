@@ -0,0 +1,132 @@
+# counters.py - Denormalized per-category product counters and cart summaries
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Cart, CartItem, Category, Product
+
+
+def counted_state(product):
+    """The (category, is counted) pair a product contributes to the counters"""
+    return product.category_id, bool(product.available)
+
+
+def apply_delta(category_id, delta):
+    if category_id and delta:
+        Category.objects.filter(pk=category_id).update(
+            available_product_count=F('available_product_count') + delta
+        )
+
+
+def product_changed(old_state, new_state):
+    """Move a product's contribution from its previous state to its new one"""
+    if old_state == new_state:
+        return
+    old_category, old_counted = old_state
+    new_category, new_counted = new_state
+    if old_counted:
+        apply_delta(old_category, -1)
+    if new_counted:
+        apply_delta(new_category, 1)
+
+
+def catalog_total(categories):
+    """Global available-product total, summed from already loaded categories"""
+    return sum(category.available_product_count for category in categories)
+
+
+def reconcile():
+    """
+    Recount available products per category in a single grouped query and
+    fix any drifted counters. Returns a list of (category, stored, actual).
+    """
+    actual = dict(
+        Product.objects.filter(available=True)
+        .values('category_id')
+        .annotate(n=Count('id'))
+        .values_list('category_id', 'n')
+    )
+    drifted = []
+    for category in Category.objects.all():
+        expected = actual.get(category.id, 0)
+        if category.available_product_count != expected:
+            drifted.append((category, category.available_product_count, expected))
+            Category.objects.filter(pk=category.pk).update(available_product_count=expected)
+    return drifted
+
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def cart_line_state(item):
+    """The (cart, product, quantity) a cart item contributes to its cart summary"""
+    return item.cart_id, item.product_id, item.quantity
+
+
+def apply_cart_delta(cart_id, product_id, quantity):
+    """Add quantity units of a product to a cart summary in one UPDATE, priced in SQL"""
+    if not (cart_id and product_id and quantity):
+        return
+    price = Product.objects.filter(pk=product_id).values('price')[:1]
+    Cart.objects.filter(pk=cart_id).update(
+        item_count=F('item_count') + quantity,
+        subtotal=ExpressionWrapper(F('subtotal') + Subquery(price) * quantity, output_field=MONEY),
+        updated_at=timezone.now(),
+    )
+
+
+def cart_item_changed(old_state, new_state):
+    """Move a cart item's contribution from its previous state to its new one"""
+    if old_state == new_state:
+        return
+    old_cart, old_product, old_quantity = old_state
+    new_cart, new_product, new_quantity = new_state
+    if (old_cart, old_product) == (new_cart, new_product):
+        apply_cart_delta(new_cart, new_product, new_quantity - old_quantity)
+    else:
+        apply_cart_delta(old_cart, old_product, -old_quantity)
+        apply_cart_delta(new_cart, new_product, new_quantity)
+
+
+def _summary_expressions():
+    """Correlated subqueries for a cart's actual item count and subtotal"""
+    items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    quantity = items.annotate(n=Sum('quantity')).values('n')
+    total = items.annotate(total=Sum(F('quantity') * F('product__price'), output_field=MONEY)).values('total')
+    return {
+        'item_count': Coalesce(Subquery(quantity), 0),
+        'subtotal': Coalesce(Subquery(total), Value(Decimal('0.00')), output_field=MONEY),
+    }
+
+
+def recalculate_carts(carts, touch=False):
+    """
+    Recompute item_count and subtotal of the given carts from their items in
+    one UPDATE; touch=True also marks them as updated by their owner.
+    """
+    changes = _summary_expressions()
+    if touch:
+        changes['updated_at'] = timezone.now()
+    carts.update(**changes)
+
+
+def product_repriced(product_id):
+    """A product's price changed: reprice the carts that hold it"""
+    recalculate_carts(Cart.objects.filter(id__in=CartItem.objects.filter(product_id=product_id).values('cart')))
+
+
+def reconcile_carts():
+    """Fix carts whose stored summary drifted from their items. Returns the number fixed"""
+    expressions = _summary_expressions()
+    rows = Cart.objects.annotate(
+        actual_count=expressions['item_count'], actual_subtotal=expressions['subtotal'],
+    ).values_list('id', 'item_count', 'subtotal', 'actual_count', 'actual_subtotal')
+    drifted = [
+        cart_id for cart_id, count, subtotal, actual_count, actual_subtotal in rows.iterator()
+        if count != actual_count or subtotal != actual_subtotal
+    ]
+    for start in range(0, len(drifted), 500):
+        recalculate_carts(Cart.objects.filter(id__in=drifted[start:start + 500]))
+    return len(drifted)
@@ -0,0 +1,142 @@
+# facets.py - Faceted filtering with all facet counts from one grouped query
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db.models import BooleanField, Case, CharField, Count, Q, Value, When
+from django.http import Http404
+
+# (key, label, min price inclusive, max price exclusive)
+PRICE_RANGES = [
+    ('0-25', 'Under $25', Decimal('0'), Decimal('25')),
+    ('25-50', '$25 - $50', Decimal('25'), Decimal('50')),
+    ('50-100', '$50 - $100', Decimal('50'), Decimal('100')),
+    ('100-250', '$100 - $250', Decimal('100'), Decimal('250')),
+    ('250+', '$250 & above', Decimal('250'), None),
+]
+PRICE_RANGE_KEYS = [key for key, _, _, _ in PRICE_RANGES]
+
+
+def price_q(low, high):
+    q = Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+@dataclass
+class FacetSelection:
+    """The facet values picked in the query string"""
+    category_ids: list = field(default_factory=list)
+    price_ranges: list = field(default_factory=list)
+    in_stock: bool = False
+
+    @classmethod
+    def from_request(cls, request, categories):
+        by_slug = {category.slug: category.id for category in categories}
+        slugs = request.GET.getlist('category')
+        unknown = [slug for slug in slugs if slug and slug not in by_slug]
+        if unknown:
+            raise Http404(f'Unknown category: {unknown[0]}')
+        return cls(
+            category_ids=[by_slug[slug] for slug in slugs if slug],
+            price_ranges=[key for key in request.GET.getlist('price') if key in PRICE_RANGE_KEYS],
+            in_stock=request.GET.get('in_stock') in ('1', 'true', 'on'),
+        )
+
+    @property
+    def active(self):
+        return bool(self.category_ids or self.price_ranges or self.in_stock)
+
+
+class FacetEngine:
+    """
+    Computes disjunctive facet counts: each value is counted with the filters
+    of every *other* facet applied, so picking a category still shows how many
+    products the other categories would add.
+
+    Every facet is a function of (category, price bucket, in stock), so a
+    single GROUP BY over those three keys returns a small cube of counts from
+    which all facet counts and the filtered total are derived in Python.
+    """
+
+    def __init__(self, selection, categories):
+        self.selection = selection
+        self.categories = list(categories)
+
+    def _facet_filters(self):
+        filters = {}
+        if self.selection.category_ids:
+            filters['category'] = Q(category_id__in=self.selection.category_ids)
+        if self.selection.price_ranges:
+            q = Q()
+            for key, _, low, high in PRICE_RANGES:
+                if key in self.selection.price_ranges:
+                    q |= price_q(low, high)
+            filters['price'] = q
+        if self.selection.in_stock:
+            filters['in_stock'] = Q(stock__gt=0)
+        return filters
+
+    def apply(self, queryset):
+        """Restrict the queryset to the selected facet values"""
+        for facet_q in self._facet_filters().values():
+            queryset = queryset.filter(facet_q)
+        return queryset
+
+    def cube(self, queryset):
+        """Product counts grouped by (category id, price range key, in stock)"""
+        bucket = Case(
+            *[When(price_q(low, high), then=Value(key)) for key, _, low, high in PRICE_RANGES],
+            output_field=CharField(),
+        )
+        in_stock = Case(When(stock__gt=0, then=Value(True)), default=Value(False), output_field=BooleanField())
+        rows = (
+            queryset.order_by()
+            .annotate(facet_price=bucket, facet_in_stock=in_stock)
+            .values('category_id', 'facet_price', 'facet_in_stock')
+            .annotate(n=Count('id'))
+            .values_list('category_id', 'facet_price', 'facet_in_stock', 'n')
+        )
+        return list(rows)
+
+    def counts(self, queryset):
+        """Return (facets, total) for the queryset, in one query"""
+        selection = self.selection
+        category_counts = {category.id: 0 for category in self.categories}
+        price_counts = {key: 0 for key in PRICE_RANGE_KEYS}
+        in_stock_count = total = 0
+
+        for category_id, price_key, in_stock, n in self.cube(queryset):
+            category_ok = not selection.category_ids or category_id in selection.category_ids
+            price_ok = not selection.price_ranges or price_key in selection.price_ranges
+            stock_ok = not selection.in_stock or in_stock
+            if price_ok and stock_ok and category_id in category_counts:
+                category_counts[category_id] += n
+            if category_ok and stock_ok and price_key in price_counts:
+                price_counts[price_key] += n
+            if category_ok and price_ok and in_stock:
+                in_stock_count += n
+            if category_ok and price_ok and stock_ok:
+                total += n
+
+        facets = {
+            'categories': [
+                {
+                    'category': category,
+                    'count': category_counts[category.id],
+                    'selected': category.id in selection.category_ids,
+                }
+                for category in self.categories
+            ],
+            'price': [
+                {
+                    'key': key,
+                    'label': label,
+                    'count': price_counts[key],
+                    'selected': key in selection.price_ranges,
+                }
+                for key, label, _, _ in PRICE_RANGES
+            ],
+            'in_stock': {'count': in_stock_count, 'selected': selection.in_stock},
+        }
+        return facets, total
@@ -0,0 +1,126 @@
+# idempotency.py - Replay the first response to requests retried with the same Idempotency-Key
+import hashlib
+import zlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+from .stats import StatCounters
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+# A claim without a stored response after this long belongs to a request that died
+IN_FLIGHT_TIMEOUT = timedelta(minutes=2)
+
+_stats = StatCounters('keyed', 'unkeyed', 'stored', 'replays', 'in_flight', 'mismatches')
+
+
+def get_stats():
+    """Idempotency counters for this process; hit_rate is the share of keyed requests that were replays"""
+    stats = _stats.snapshot()
+    stats['hit_rate'] = stats['replays'] / stats['keyed'] if stats['keyed'] else 0.0
+    return stats
+
+
+def reset_stats():
+    _stats.reset()
+
+
+def request_hash(request):
+    digest = hashlib.sha256()
+    for part in (request.method, request.path, str(request.user.pk or '')):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _live(record, now):
+    """Whether a stored record still answers for its key; claims left in flight by a worker that died do not"""
+    abandoned = record.status_code is None and record.created_at <= now - IN_FLIGHT_TIMEOUT
+    return record.expires_at > now and not abandoned
+
+
+def claim(scope, key, digest, now=None):
+    """
+    Record that the request is being handled. Returns (record, created); a
+    record that already existed belongs to an earlier request with the same
+    key. Retries cost one lookup; the unique constraint settles races
+    between concurrent first attempts.
+    """
+    now = now or timezone.now()
+    expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_SECONDS)
+    for _ in range(2):
+        record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+        if record is not None:
+            if _live(record, now):
+                return record, False
+            IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    scope=scope, key=key, request_hash=digest, expires_at=expires_at,
+                ), True
+        except IntegrityError:
+            continue
+    raise IntegrityError(f'Could not claim idempotency key {key!r}')
+
+
+def replay(record):
+    response = HttpResponse(
+        zlib.decompress(bytes(record.response_body)), status=record.status_code, content_type='application/json',
+    )
+    response[REPLAY_HEADER] = 'true'
+    return response
+
+
+def idempotent(scope):
+    """
+    Decorator for JSON POST views that clients may retry. The first response
+    to a request carrying an Idempotency-Key header is stored and replayed to
+    retries with the same key and body, without running the view again.
+    Server errors are not stored, so those requests can be retried for real.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                _stats.count('unkeyed')
+                return view(request, *args, **kwargs)
+            if len(key) > 255:
+                return JsonResponse({'error': f'{HEADER} must be at most 255 characters'}, status=400)
+            _stats.count('keyed')
+
+            digest = request_hash(request)
+            record, created = claim(scope, key, digest)
+            if not created:
+                if record.request_hash != digest:
+                    _stats.count('mismatches')
+                    return JsonResponse({'error': f'{HEADER} was already used for a different request'}, status=422)
+                if record.status_code is None:
+                    _stats.count('in_flight')
+                    return JsonResponse({'error': f'A request with this {HEADER} is still being processed'}, status=409)
+                _stats.count('replays')
+                return replay(record)
+
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+            if response.status_code >= 500:
+                record.delete()
+            else:
+                _stats.count('stored')
+                IdempotencyKey.objects.filter(pk=record.pk).update(
+                    status_code=response.status_code, response_body=zlib.compress(response.content),
+                )
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,103 @@
+# instrumentation.py - Per-request SQL, gateway and render timings
+import contextvars
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from django.template.backends.django import DjangoTemplates, Template
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+@dataclass
+class RequestMetrics:
+    """Everything measured while one sampled request was handled"""
+    started: float = field(default_factory=time.perf_counter)
+    queries: list = field(default_factory=list)  # (sql, params, seconds)
+    gateway_seconds: float = 0.0
+    gateway_calls: int = 0
+    render_seconds: float = 0.0
+    _render_depth: int = 0
+
+    @property
+    def db_seconds(self):
+        return sum(seconds for _, _, seconds in self.queries)
+
+    def duplicates(self):
+        """Identical statements (same SQL and parameters) issued more than once"""
+        counts = Counter((sql, repr(params)) for sql, params, _ in self.queries)
+        return {sql: n for (sql, _), n in counts.items() if n > 1}
+
+    def repeated(self, threshold):
+        """SQL shapes run at least `threshold` times with varying parameters: likely N+1"""
+        counts = Counter(sql for sql, _, _ in self.queries)
+        distinct = Counter(sql for sql, _ in {(sql, repr(params)) for sql, params, _ in self.queries})
+        return {sql: n for sql, n in counts.items() if n >= threshold and distinct[sql] > 1}
+
+
+def current():
+    """Metrics of the request being handled, or None when it is not sampled"""
+    return _current.get()
+
+
+def start():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """connection.execute_wrapper hook"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    began = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries.append((sql, params, time.perf_counter() - began))
+
+
+@contextmanager
+def gateway_call():
+    """Time an outbound payment gateway request"""
+    metrics = _current.get()
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.gateway_seconds += time.perf_counter() - began
+            metrics.gateway_calls += 1
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        # Templates rendered from inside another one (render_to_string in a tag) are
+        # already part of the outer timing
+        metrics._render_depth += 1
+        began = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics._render_depth -= 1
+            if not metrics._render_depth:
+                metrics.render_seconds += time.perf_counter() - began
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for RequestMetricsMiddleware"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
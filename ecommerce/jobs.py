@@ -0,0 +1,143 @@
+# jobs.py - Database-backed job queue worked by `manage.py run_jobs`
+import logging
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger('ecommerce.jobs')
+
+TASKS = {}
+
+
+def task(name):
+    """Register a function as the handler for jobs of this kind; it receives the payload as keyword arguments"""
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+class PermanentFailure(Exception):
+    """Raised by a task that must not be retried; the job goes straight to the dead-letter state"""
+
+
+def enqueue(kind, payload=None, delay=0, max_attempts=None):
+    """
+    Queue a job. Call it inside the transaction that makes the job necessary
+    so the job exists exactly when that work was committed.
+    """
+    return Job.objects.create(
+        kind=kind, payload=payload or {},
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def claim(worker, limit=1):
+    """
+    Mark up to `limit` ready jobs as running for this worker and return
+    them. Uses SELECT ... FOR UPDATE SKIP LOCKED where the database has it,
+    so workers never wait on each other's rows; elsewhere (SQLite) one
+    UPDATE ... WHERE id IN (SELECT ... LIMIT n) claims atomically.
+    """
+    now = timezone.now()
+    ready = Job.objects.filter(status='queued', run_at__lte=now).order_by('run_at', 'id')
+    token = f'{worker}:{uuid.uuid4().hex[:12]}'
+    changes = {'status': 'running', 'locked_by': token, 'locked_at': now, 'attempts': F('attempts') + 1}
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            ids = list(ready.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Job.objects.filter(id__in=ids).update(**changes)
+        else:
+            Job.objects.filter(id__in=ready.values('id')[:limit]).update(**changes)
+    return list(Job.objects.filter(locked_by=token, status='running').order_by('run_at', 'id'))
+
+
+def backoff(attempts):
+    return min(settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_SECONDS)
+
+
+def run(job):
+    """
+    Run one claimed job. Its database work and the 'done' mark commit
+    together; on failure both roll back and the job is retried with
+    exponential backoff, or dead-lettered after max_attempts.
+    """
+    started = time.perf_counter()
+    wait = (job.locked_at - job.run_at).total_seconds()
+    handler = TASKS.get(job.kind)
+    try:
+        if handler is None:
+            raise PermanentFailure(f'No task registered for {job.kind!r}')
+        with transaction.atomic():
+            handler(**job.payload)
+            Job.objects.filter(pk=job.pk).update(status='done', finished_at=timezone.now(), last_error='')
+        job.status = 'done'
+    except Exception as e:
+        error = traceback.format_exc(limit=5)
+        if isinstance(e, PermanentFailure) or job.attempts >= job.max_attempts:
+            job.status = 'dead'
+            Job.objects.filter(pk=job.pk).update(status='dead', finished_at=timezone.now(), last_error=error)
+        else:
+            job.status = 'queued'
+            Job.objects.filter(pk=job.pk).update(
+                status='queued', locked_by='', locked_at=None, last_error=error,
+                run_at=timezone.now() + timedelta(seconds=backoff(job.attempts)),
+            )
+        logger.warning(f'Job {job.pk} {job.kind} failed (attempt {job.attempts}/{job.max_attempts}, now {job.status}): {e}')
+    else:
+        logger.info(
+            f'Job {job.pk} {job.kind} done: waited {wait * 1000:.0f}ms, ran {(time.perf_counter() - started) * 1000:.0f}ms'
+        )
+    return job.status
+
+
+def requeue_stale(now=None):
+    """Put back jobs left running by a worker that died; returns how many"""
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.JOB_LOCK_TIMEOUT_SECONDS)
+    return Job.objects.filter(status='running', locked_at__lt=cutoff).update(
+        status='queued', locked_by='', locked_at=None, run_at=now or timezone.now(),
+    )
+
+
+def retry_dead(ids=None):
+    """Send dead-lettered jobs back to the queue with fresh attempts"""
+    dead = Job.objects.filter(status='dead')
+    if ids:
+        dead = dead.filter(id__in=ids)
+    return dead.update(status='queued', attempts=0, run_at=timezone.now(), locked_by='', locked_at=None, finished_at=None)
+
+
+def queue_stats(window=timedelta(hours=1)):
+    """
+    Queue depth by status, the age of the oldest ready job, and for jobs
+    finished within `window` the mean wait (ready to claimed) and mean
+    end-to-end latency (queued to finished).
+    """
+    now = timezone.now()
+    depth = dict(Job.objects.order_by().values_list('status').annotate(n=Count('id')))
+    oldest = Job.objects.filter(status='queued', run_at__lte=now).aggregate(oldest=Min('run_at'))['oldest']
+    finished = Job.objects.filter(status='done', finished_at__gte=now - window).aggregate(
+        count=Count('id'),
+        wait=Avg(ExpressionWrapper(F('locked_at') - F('run_at'), output_field=DurationField())),
+        latency=Avg(ExpressionWrapper(F('finished_at') - F('created_at'), output_field=DurationField())),
+    )
+    return {
+        'queued': depth.get('queued', 0),
+        'running': depth.get('running', 0),
+        'done': depth.get('done', 0),
+        'dead': depth.get('dead', 0),
+        'ready': Job.objects.filter(status='queued', run_at__lte=now).count(),
+        'oldest_ready_seconds': round((now - oldest).total_seconds(), 1) if oldest else 0.0,
+        'finished_in_window': finished['count'],
+        'mean_wait_seconds': round(finished['wait'].total_seconds(), 3) if finished['wait'] else 0.0,
+        'mean_latency_seconds': round(finished['latency'].total_seconds(), 3) if finished['latency'] else 0.0,
+    }
@@ -0,0 +1,249 @@
+# loadtest.py - End-to-end load test of the shopping and M-Pesa checkout flow, run through `manage.py loadtest`
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import jobs
+from .benchmarks import create_products
+
+STEPS = ('browse', 'product_detail', 'add_to_cart', 'checkout', 'create_order', 'mpesa_callback', 'mpesa_job')
+
+ORDER_FORM = {
+    'first_name': 'Load', 'last_name': 'Tester', 'email': 'load@example.com', 'phone': '254700000000',
+    'address': '1 Load Test Rd', 'postal_code': '00100', 'city': 'Nairobi', 'country': 'KE',
+}
+
+# How long the worker keeps waiting for retried jobs once shopping is over
+DRAIN_SECONDS = 120
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class Recorder:
+    """Latency, query count and outcome of every step, collected from all shopper threads"""
+
+    def __init__(self):
+        self.samples = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self.lock = threading.Lock()
+
+    def measure(self, step, func):
+        """Run one step, recording its wall time and queries; returns func's result or None when it failed"""
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            try:
+                result = func()
+                ok = result is not None and getattr(result, 'status_code', 200) < 400
+            except Exception:
+                result, ok = None, False
+            elapsed = (time.perf_counter() - started) * 1000
+        with self.lock:
+            if ok:
+                self.samples[step].append((elapsed, len(queries)))
+            else:
+                self.errors[step] += 1
+        return result if ok else None
+
+    def summary(self):
+        steps = {}
+        for step in STEPS:
+            timings = [ms for ms, _ in self.samples[step]]
+            queries = [n for _, n in self.samples[step]]
+            steps[step] = {
+                'count': len(timings),
+                'errors': self.errors[step],
+                'p50_ms': round(percentile(timings, 50), 2),
+                'p95_ms': round(percentile(timings, 95), 2),
+                'p99_ms': round(percentile(timings, 99), 2),
+                'mean_queries': round(sum(queries) / len(queries), 1) if queries else 0.0,
+                'max_queries': max(queries, default=0),
+            }
+        return steps
+
+
+def shop(recorder, products, rng):
+    """
+    One shopper: browse, open a product, add it to the cart, check out and
+    pay with M-Pesa. The STK push itself needs the real gateway, so its
+    pending PaymentTransaction is written directly before the callback; the
+    job the callback queues is left to work().
+    """
+    from .models import Order, PaymentTransaction
+
+    client = Client()
+    product = rng.choice(products)
+    if recorder.measure('browse', lambda: client.get(reverse('product_list'))) is None:
+        return client
+    recorder.measure('product_detail', lambda: client.get(reverse('product_detail', args=[product.slug])))
+    if recorder.measure('add_to_cart', lambda: client.get(reverse('add_to_cart', args=[product.id]))) is None:
+        return client
+    recorder.measure('checkout', lambda: client.get(reverse('checkout')))
+
+    checkout_id = f'ws_CO_load_{uuid.uuid4().hex[:16]}'
+    response = recorder.measure('create_order', lambda: client.post(
+        reverse('create_order'),
+        json.dumps(dict(ORDER_FORM, payment_method='mpesa', currency='KES', checkout_request_id=checkout_id)),
+        content_type='application/json', headers={'idempotency-key': checkout_id},
+    ))
+    if response is None:
+        return client
+    order = Order.objects.get(pk=response.json()['order_id'])
+    PaymentTransaction.objects.create(
+        order=order, payment_method='mpesa', transaction_id=checkout_id, amount=order.total_amount,
+        currency='KES', status='pending',
+    )
+    recorder.measure('mpesa_callback', lambda: client.post(
+        reverse('mpesa_callback'),
+        json.dumps({'Body': {'stkCallback': {
+            'ResultCode': 0, 'CheckoutRequestID': checkout_id,
+            'CallbackMetadata': {'Item': [{'Name': 'MpesaReceiptNumber', 'Value': checkout_id[-10:].upper()}]},
+        }}}),
+        content_type='application/json',
+    ))
+    return client
+
+
+def work(recorder, shopping_done, since, poll=0.05, drain_seconds=DRAIN_SECONDS):
+    """
+    The `run_jobs` worker running alongside the shoppers: each job the
+    callbacks queue is one 'mpesa_job' sample. Once shopping is over it
+    keeps going until no job queued since `since` is queued or running,
+    retries included, or until drain_seconds have passed.
+    """
+    from .models import Job
+
+    worker = f'loadtest-{threading.get_ident()}'
+    pending = Job.objects.filter(kind='mpesa_payment_result', created_at__gte=since, status__in=['queued', 'running'])
+    deadline = None
+    try:
+        while True:
+            claimed = jobs.claim(worker, 10)
+            for job in claimed:
+                recorder.measure('mpesa_job', lambda: jobs.run(job) == 'done' or None)
+            if not claimed:
+                if shopping_done.is_set():
+                    deadline = deadline or time.monotonic() + drain_seconds
+                    if time.monotonic() > deadline or not pending.exists():
+                        return
+                time.sleep(poll)
+    finally:
+        connections.close_all()
+
+
+def _cleanup(products, order_ids, session_keys):
+    """Remove what a run created; the fixture products were bulk inserted, so they go the same way"""
+    from . import search
+    from django.contrib.sessions.models import Session
+
+    from .models import Cart, CartItem, Category, IdempotencyKey, Job, Order, PaymentTransaction
+
+    payment_ids = list(PaymentTransaction.objects.filter(order__in=order_ids).values_list('id', flat=True))
+    Job.objects.filter(kind='mpesa_payment_result', payload__transaction_id__in=payment_ids).delete()
+    Order.objects.filter(pk__in=order_ids).delete()
+    IdempotencyKey.objects.filter(key__startswith='ws_CO_load_').delete()
+    cart_ids = list(Cart.objects.filter(session_key__in=session_keys).values_list('id', flat=True))
+    product_ids = [product.pk for product in products]
+    with connection.cursor() as cursor:
+        for model, column, ids in ((CartItem, 'cart_id', cart_ids), (CartItem, 'product_id', product_ids),
+                                   (Cart, 'id', cart_ids), (type(products[0]), 'id', product_ids),
+                                   (Category, 'id', list({product.category_id for product in products}))):
+            if ids:
+                placeholders = ', '.join(['%s'] * len(ids))
+                cursor.execute(f'DELETE FROM {model._meta.db_table} WHERE {column} IN ({placeholders})', ids)
+    Session.objects.filter(session_key__in=session_keys).delete()
+    for product_id in product_ids:
+        search.remove_product(product_id)
+
+
+def run_load_test(shoppers=100, concurrency=8, products=50, seed=1):
+    """
+    Run `shoppers` complete shopping flows on `concurrency` threads against
+    the current database and return the results. The fixture products and
+    everything the flows create are removed afterwards. With concurrency=1
+    the flows run on the calling thread (and inside its transaction).
+    """
+    from .models import Order
+
+    catalog = list(create_products(products, prefix=f'loadtest-{seed}'))
+    type(catalog[0]).objects.filter(pk__in=[p.pk for p in catalog]).update(stock=shoppers * 10, price=Decimal('25.00'))
+    recorder = Recorder()
+    clients = []
+    started_ids = Order.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    since = timezone.now()
+
+    def flow(n):
+        try:
+            clients.append(shop(recorder, catalog, random.Random(seed * 100003 + n)))
+        finally:
+            if concurrency > 1:
+                connections.close_all()
+
+    shopping_done = threading.Event()
+    with override_settings(REQUEST_METRICS_SAMPLE_RATE=0):
+        started = time.perf_counter()
+        if concurrency > 1:
+            worker = threading.Thread(target=work, args=(recorder, shopping_done, since), daemon=True)
+            worker.start()
+            with ThreadPoolExecutor(concurrency) as pool:
+                list(pool.map(flow, range(shoppers)))
+            shopping_done.set()
+            worker.join()
+        else:
+            for n in range(shoppers):
+                flow(n)
+            shopping_done.set()
+            # Same thread, so same connection: close_all() would end the caller's transaction
+            for job in jobs.claim('loadtest', shoppers):
+                recorder.measure('mpesa_job', lambda: jobs.run(job) == 'done' or None)
+        wall = time.perf_counter() - started
+
+    steps = recorder.summary()
+    requests = sum(step['count'] + step['errors'] for name, step in steps.items() if name != 'mpesa_job')
+    completed = steps['mpesa_job']['count']
+    results = {
+        'config': {'shoppers': shoppers, 'concurrency': concurrency, 'products': products, 'seed': seed,
+                   'database': connection.vendor},
+        'wall_seconds': round(wall, 2),
+        'completed_flows': completed,
+        'flows_per_second': round(completed / wall, 2) if wall else 0.0,
+        'requests_per_second': round(requests / wall, 1) if wall else 0.0,
+        'errors': sum(step['errors'] for step in steps.values()),
+        'steps': steps,
+    }
+
+    order_ids = list(Order.objects.filter(pk__gt=started_ids, email=ORDER_FORM['email']).values_list('id', flat=True))
+    cookies = [client.cookies.get(settings.SESSION_COOKIE_NAME) for client in clients]
+    session_keys = [cookie.value for cookie in cookies if cookie]
+    _cleanup(catalog, order_ids, session_keys)
+    return results
+
+
+def compare(baseline, results):
+    """Per-step (step, metric, baseline, current, change %) rows for p95 latency and queries"""
+    rows = []
+    for step in STEPS:
+        old, new = baseline.get('steps', {}).get(step), results['steps'][step]
+        if not old:
+            continue
+        for metric in ('p95_ms', 'mean_queries'):
+            change = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            rows.append((step, metric, old[metric], new[metric], round(change, 1)))
+    return rows
@@ -0,0 +1,45 @@
+"""
+Django management command to EXPLAIN the queries every view issues.
+Usage: python manage.py audit_queries [--view cart_view ...] [--verbose-plans] [--fail-on-scan]
+
+Requests are replayed against the configured database inside a transaction
+that is rolled back. Use --fail-on-scan in CI to catch missing indexes.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.query_audit import run_audit
+
+
+class Command(BaseCommand):
+    help = 'Replays the shop views, runs EXPLAIN on their queries and flags full scans and in-memory sorts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', action='append', help='Only audit views whose name starts with this')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every query plan')
+        parser.add_argument('--fail-on-scan', action='store_true', help='Exit with an error if anything is flagged')
+
+    def handle(self, *args, **options):
+        reports = run_audit(only=options['view'])
+        findings = []
+        for report in reports:
+            style = self.style.WARNING if report.findings else self.style.SUCCESS
+            self.stdout.write(style(
+                f'{report.view}: HTTP {report.status}, {report.queries} queries, '
+                f'{len(report.findings)} finding(s)'
+            ))
+            if options['verbose_plans']:
+                for sql, plan in report.plans:
+                    self.stdout.write(f'    {sql[:160]}')
+                    for line in plan:
+                        self.stdout.write(f'      -> {line}')
+            for finding in report.findings:
+                label = 'full scan of' if finding.kind == 'scan' else 'in-memory sort of'
+                self.stdout.write(f'    ! {label} {finding.table}: {finding.sql[:160]}')
+                if finding.suggestion:
+                    self.stdout.write(f'      suggestion: {finding.suggestion}')
+            findings.extend(report.findings)
+
+        if findings and options['fail_on_scan']:
+            raise CommandError(f'{len(findings)} query plan finding(s)')
+        self.stdout.write(self.style.SUCCESS(f'Audited {len(reports)} views, {len(findings)} finding(s)'))
@@ -0,0 +1,42 @@
+"""
+Django management command to run the performance micro benchmarks.
+Usage: python manage.py benchmark card_grid [--size 500] [--repeat 20] [--json]
+
+Fixture rows created by a scenario are rolled back when it finishes.
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = 'Runs a named performance benchmark scenario and prints its results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', help=f'One of: {", ".join(sorted(SCENARIOS))}')
+        parser.add_argument('--size', type=int, default=500, help='Scenario size (default: 500)')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed repetitions (default: 20)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        if options['scenario'] not in SCENARIOS:
+            raise CommandError(
+                f'Unknown scenario "{options["scenario"]}". Choose from: {", ".join(sorted(SCENARIOS))}'
+            )
+        results = SCENARIOS[options['scenario']](options)
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Benchmark: {options["scenario"]}'))
+        self._write(results)
+
+    def _write(self, results, indent=2):
+        for key, value in results.items():
+            if isinstance(value, dict):
+                self.stdout.write(f'{" " * indent}{key}:')
+                self._write(value, indent + 2)
+            else:
+                self.stdout.write(f'{" " * indent}{key}: {value}')
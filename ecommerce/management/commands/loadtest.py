@@ -0,0 +1,78 @@
+"""
+Django management command to load test the shopping and checkout flow end to end.
+Usage: python manage.py loadtest [--shoppers 200] [--concurrency 8] [--products 50] [--seed 1]
+                                 [--save loadtest_baseline.json] [--compare loadtest_baseline.json] [--json]
+
+Each shopper browses, opens a product, adds it to the cart, checks out, places
+an M-Pesa order and receives the payment callback, which a worker then
+processes. No external service is contacted. Fixture rows and everything the
+run creates are removed at the end.
+"""
+
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.loadtest import STEPS, compare, run_load_test
+
+
+class Command(BaseCommand):
+    help = 'Drives concurrent shoppers through browse to M-Pesa callback and reports latency percentiles and queries per step'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shoppers', type=int, default=200, help='Complete shopping flows to run (default: 200)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Shopper threads (default: 8)')
+        parser.add_argument('--products', type=int, default=50, help='Fixture products to shop from (default: 50)')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for product choices (default: 1)')
+        parser.add_argument('--save', metavar='PATH', help='Write the results as a baseline JSON file')
+        parser.add_argument('--compare', metavar='PATH', help='Show the change against a saved baseline')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                baseline = json.loads(Path(options['compare']).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Cannot read baseline {options["compare"]}: {e}')
+
+        results = run_load_test(
+            shoppers=options['shoppers'], concurrency=options['concurrency'],
+            products=options['products'], seed=options['seed'],
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self._write(results)
+        if baseline is not None:
+            self._write_comparison(baseline, results)
+        if options['save']:
+            # Stable key order and formatting so a committed baseline diffs cleanly
+            Path(options['save']).write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {options["save"]}'))
+
+    def _write(self, results):
+        config = results['config']
+        self.stdout.write(self.style.SUCCESS(
+            f'{config["shoppers"]} shoppers on {config["concurrency"]} threads ({config["database"]}): '
+            f'{results["completed_flows"]} flows completed in {results["wall_seconds"]}s, '
+            f'{results["flows_per_second"]} flows/sec, {results["requests_per_second"]} requests/sec, '
+            f'{results["errors"]} errors'
+        ))
+        self.stdout.write(f'  {"step":<16}{"count":>7}{"errors":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"queries":>9}')
+        for step in STEPS:
+            row = results['steps'][step]
+            self.stdout.write(
+                f'  {step:<16}{row["count"]:>7}{row["errors"]:>8}{row["p50_ms"]:>10}{row["p95_ms"]:>10}'
+                f'{row["p99_ms"]:>10}{row["mean_queries"]:>9}'
+            )
+
+    def _write_comparison(self, baseline, results):
+        self.stdout.write('Against baseline:')
+        for step, metric, old, new, change in compare(baseline, results):
+            line = f'  {step:<16}{metric:<14}{old:>10} -> {new:<10} ({change:+.1f}%)'
+            # Latency is noisy between runs; query counts are not
+            worse = change > 0 and (metric == 'mean_queries' or change > 20)
+            self.stdout.write(self.style.WARNING(line) if worse else line)
@@ -0,0 +1,46 @@
+"""
+Django management command to delete expired sessions, expired idempotency keys, finished jobs and abandoned carts.
+Usage: python manage.py purge_stale_carts [--idle-days 30] [--user-idle-days 180] [--job-days 7] [--chunk-size 1000] [--pause 0.1]
+
+Rows are deleted in bounded batches, each in its own short transaction with a
+pause in between, so the command can run while the shop is busy.
+"""
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.cleanup import (
+    purge_expired_idempotency_keys, purge_expired_sessions, purge_finished_jobs, purge_stale_carts,
+)
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired sessions, idempotency keys, finished jobs and stale carts in small batches and reports rows per second'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--idle-days', type=int, default=30,
+                            help='Delete anonymous carts untouched for this many days (default: 30)')
+        parser.add_argument('--user-idle-days', type=int, default=None,
+                            help='Also delete signed-in users\' carts untouched for this many days')
+        parser.add_argument('--job-days', type=int, default=7,
+                            help='Delete jobs that finished successfully this many days ago (default: 7)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows or ids per batch (default: 1000)')
+        parser.add_argument('--pause', type=float, default=0.1, help='Seconds to sleep between batches (default: 0.1)')
+        parser.add_argument('--skip-sessions', action='store_true', help='Leave expired sessions alone')
+
+    def handle(self, *args, **options):
+        results = []
+        if not options['skip_sessions']:
+            results.append(purge_expired_sessions(options['chunk_size'], options['pause']))
+        results.append(purge_expired_idempotency_keys(options['chunk_size'], options['pause']))
+        results.append(purge_finished_jobs(options['job_days'], options['chunk_size'], options['pause']))
+        results.extend(purge_stale_carts(
+            idle_days=options['idle_days'],
+            user_idle_days=options['user_idle_days'],
+            chunk_size=options['chunk_size'],
+            pause=options['pause'],
+        ))
+        for stats in results:
+            self.stdout.write(self.style.SUCCESS(
+                f'{stats.table}: deleted {stats.rows} rows in {stats.batches} batches, '
+                f'{stats.seconds:.1f}s ({stats.rows_per_second:.0f} rows/sec)'
+            ))
@@ -0,0 +1,32 @@
+"""
+Django management command to rebuild the product search index.
+Usage: python manage.py rebuild_search_index [--chunk-size 1000]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text product search index from the Product table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of products indexed per batch (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        self.stdout.write(f'Rebuilding search index using {backend.__class__.__name__}...')
+        started = time.monotonic()
+        indexed = search.rebuild_index(chunk_size=options['chunk_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {indexed} products in {elapsed:.2f}s'
+        ))
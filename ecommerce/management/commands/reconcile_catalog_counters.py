@@ -0,0 +1,30 @@
+"""
+Django management command to repair drift in the denormalized category counters
+and cart summaries.
+Usage: python manage.py reconcile_catalog_counters
+"""
+
+from django.core.management.base import BaseCommand
+
+from ecommerce import counters
+
+
+class Command(BaseCommand):
+    help = 'Recounts available products per category and cart items, fixing drifted counters'
+
+    def handle(self, *args, **options):
+        drifted = counters.reconcile()
+        for category, stored, actual in drifted:
+            self.stdout.write(self.style.WARNING(
+                f'  ! {category.name}: stored {stored}, actual {actual}'
+            ))
+        if drifted:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {len(drifted)} drifted counter(s)'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All category counters are accurate'))
+
+        carts = counters.reconcile_carts()
+        if carts:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {carts} drifted cart summar{"y" if carts == 1 else "ies"}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All cart summaries are accurate'))
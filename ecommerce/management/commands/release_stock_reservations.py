@@ -0,0 +1,22 @@
+"""
+Django management command to delete expired stock reservations.
+Usage: python manage.py release_stock_reservations [--batch-size 1000]
+
+Expired holds already stop counting against availability; this sweeper
+just keeps the reservations table small. Run it every few minutes.
+"""
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Deletes stock reservations whose hold has expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Reservations per delete (default: 1000)')
+
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired stock reservations'))
@@ -0,0 +1,78 @@
+"""
+Django management command to work the background job queue.
+Usage: python manage.py run_jobs [--once] [--batch-size 10] [--poll 1.0] [--max-jobs N]
+       python manage.py run_jobs --stats
+       python manage.py run_jobs --retry-dead [JOB_ID ...]
+
+Run as many workers as needed; they never claim the same job.
+"""
+
+import json
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce import jobs
+
+
+class Command(BaseCommand):
+    help = 'Claims and runs queued background jobs, with retries and a dead-letter state'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when no job is ready instead of polling')
+        parser.add_argument('--batch-size', type=int, default=10, help='Jobs claimed at a time (default: 10)')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to wait when the queue is empty (default: 1)')
+        parser.add_argument('--max-jobs', type=int, default=None, help='Exit after running this many jobs')
+        parser.add_argument('--stats', action='store_true', help='Print queue depth and latency as JSON and exit')
+        parser.add_argument('--retry-dead', nargs='*', type=int, metavar='JOB_ID',
+                            help='Requeue dead-lettered jobs (all of them when no id is given) and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(jobs.queue_stats(), indent=2))
+            return
+        if options['retry_dead'] is not None:
+            count = jobs.retry_dead(options['retry_dead'])
+            self.stdout.write(self.style.SUCCESS(f'Requeued {count} dead jobs'))
+            return
+
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        outcome = {'done': 0, 'queued': 0, 'dead': 0}
+        started = time.perf_counter()
+        last_sweep = 0.0
+        self.stdout.write(f'Worker {worker} started')
+        while not self.stopping:
+            if time.perf_counter() - last_sweep > 60:
+                requeued = jobs.requeue_stale()
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f'Requeued {requeued} jobs abandoned by dead workers'))
+                last_sweep = time.perf_counter()
+
+            claimed = jobs.claim(worker, options['batch_size'])
+            if not claimed:
+                if options['once']:
+                    break
+                time.sleep(options['poll'])
+                continue
+            for job in claimed:
+                outcome[jobs.run(job)] += 1
+            if options['max_jobs'] and sum(outcome.values()) >= options['max_jobs']:
+                break
+
+        elapsed = time.perf_counter() - started
+        total = sum(outcome.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Ran {total} jobs in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f} jobs/sec): '
+            f'{outcome["done"]} done, {outcome["queued"]} to retry, {outcome["dead"]} dead'
+        ))
+
+    def stop(self, signum, frame):
+        # Finish the jobs already claimed, then exit
+        self.stopping = True
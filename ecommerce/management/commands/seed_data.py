@@ -1,19 +1,24 @@
 """
 Django management command to seed the database with sample data.
-Usage: python manage.py seed_data
+Usage: python manage.py seed_data [--clear] [--images-path PATH]
+       python manage.py seed_data --users 100000 --products 1000000 --orders 2000000 --carts 50000 [--seed 42]
+
+Without counts it creates the small hand-written sample catalogue. With any of
+--users, --products, --orders or --carts it generates that many synthetic rows
+instead, in chunked bulk inserts, reproducibly from --seed.
 """
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.core.files import File
 from ecommerce.models import Category, Product
-from django.contrib.auth.models import User
+from ecommerce.seeding import SAMPLE_CATEGORIES, SEEDED_PASSWORD, seed
 import random
-import os
+import time
 from pathlib import Path
 
 
 class Command(BaseCommand):
-    help = 'Seeds the database with sample categories and products'
+    help = 'Seeds the database with sample categories and products, or synthetic data at benchmark scale'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -24,9 +29,15 @@ class Command(BaseCommand):
         parser.add_argument(
             '--images-path',
             type=str,
-            default=r'C:\Users\gadaf\OneDrive\Pictures',
-            help='Path to images folder (default: C:\\Users\\gadaf\\OneDrive\\Pictures)',
+            default=None,
+            help='Folder of images to attach to the sample products (default: none)',
         )
+        parser.add_argument('--users', type=int, default=0, help='Synthetic shopper accounts to create')
+        parser.add_argument('--products', type=int, default=0, help='Synthetic products to create')
+        parser.add_argument('--orders', type=int, default=0, help='Synthetic orders to create, with 1-4 items each')
+        parser.add_argument('--carts', type=int, default=0, help='Synthetic carts to create, with 1-5 items each')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed reproduces the same data (default: 0)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per bulk insert (default: 1000)')
 
     def handle(self, *args, **options):
         # Clear existing data if requested
@@ -36,59 +47,28 @@ class Command(BaseCommand):
             Category.objects.all().delete()
             self.stdout.write(self.style.SUCCESS('Data cleared!'))
 
-        # Get images path
-        images_path = Path(options['images_path'])
-        
-        # Get list of image files if path exists
+        counts = {name: options[name] for name in ('users', 'products', 'orders', 'carts')}
+        if any(counts.values()):
+            return self.generate(counts, options)
+
+        # Get list of image files if an images path was given and exists
         image_files = []
-        if images_path.exists() and images_path.is_dir():
+        images_path = Path(options['images_path']) if options['images_path'] else None
+        if images_path and images_path.exists() and images_path.is_dir():
             image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
             image_files = [
                 f for f in images_path.iterdir() 
                 if f.is_file() and f.suffix.lower() in image_extensions
             ]
             self.stdout.write(f'Found {len(image_files)} images in {images_path}')
-        else:
+        elif images_path:
             self.stdout.write(self.style.WARNING(
                 f'Images path not found: {images_path}\n'
                 f'Products will be created without images.'
             ))
 
         # Sample data
-        categories_data = [
-            {
-                'name': 'Electronics',
-                'description': 'Latest gadgets and electronic devices'
-            },
-            {
-                'name': 'Clothing',
-                'description': 'Fashion and apparel for everyone'
-            },
-            {
-                'name': 'Books',
-                'description': 'Books for all interests and ages'
-            },
-            {
-                'name': 'Home & Kitchen',
-                'description': 'Everything you need for your home'
-            },
-            {
-                'name': 'Sports & Outdoors',
-                'description': 'Gear for your active lifestyle'
-            },
-            {
-                'name': 'Beauty & Personal Care',
-                'description': 'Beauty products and personal care items'
-            },
-            {
-                'name': 'Toys & Games',
-                'description': 'Fun for kids and adults'
-            },
-            {
-                'name': 'Automotive',
-                'description': 'Parts and accessories for your vehicle'
-            },
-        ]
+        categories_data = SAMPLE_CATEGORIES
 
         products_data = {
             'Electronics': [
@@ -214,4 +194,33 @@ class Command(BaseCommand):
         self.stdout.write(f'Products created: {products_created}')
         self.stdout.write(f'Total products in database: {Product.objects.count()}')
         self.stdout.write('\n' + self.style.SUCCESS('✓ Your e-commerce store is ready to use!'))
-        self.stdout.write('  Visit http://localhost:8000/ to see your products\n')
\ No newline at end of file
+        self.stdout.write('  Visit http://localhost:8000/ to see your products\n')
+
+    def generate(self, counts, options):
+        started = time.monotonic()
+        reported = {}
+
+        def progress(stats):
+            # One line per 100k rows keeps long runs visibly alive without flooding the console
+            if stats.rows // 100000 > reported.get(stats.table, 0):
+                reported[stats.table] = stats.rows // 100000
+                self.stdout.write(f'  {stats.table}: {stats.rows} rows ({stats.rows_per_second:.0f} rows/sec)')
+
+        try:
+            results = seed(seed=options['seed'], chunk_size=options['chunk_size'], progress=progress, **counts)
+        except ValueError as e:
+            raise CommandError(str(e))
+        for stats in results:
+            self.stdout.write(self.style.SUCCESS(
+                f'{stats.table}: inserted {stats.rows} rows in {stats.seconds:.1f}s ({stats.rows_per_second:.0f} rows/sec)'
+            ))
+        rows = sum(stats.rows for stats in results)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/sec overall, '
+            f'including search indexing and counters)'
+        ))
+        if counts['users']:
+            self.stdout.write(f'  Seeded shoppers sign in with the password {SEEDED_PASSWORD!r}')
+        if counts['orders']:
+            self.stdout.write('  Run build_related_products to compute recommendations from the new orders')
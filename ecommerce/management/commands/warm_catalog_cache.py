@@ -0,0 +1,55 @@
+"""
+Django management command to pre-populate the catalog cache after a deploy.
+Usage: python manage.py warm_catalog_cache [--products 100]
+
+Only useful with a cache shared between processes (e.g. CACHE_BACKEND=file);
+the local-memory backend is private to the process that warms it.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from ecommerce import catalog_cache
+from ecommerce.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = 'Warms the catalog cache by rendering home, listing, category and product pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--products',
+            type=int,
+            default=100,
+            help='Number of newest product detail pages to warm (default: 100)',
+        )
+
+    def handle(self, *args, **options):
+        client = Client()
+        urls = [reverse('home'), reverse('product_list'), reverse('product_feed')]
+        urls += [reverse('category_detail', args=[slug]) for slug in Category.objects.values_list('slug', flat=True)]
+        urls += [
+            reverse('product_detail', args=[slug])
+            for slug in Product.objects.filter(available=True)
+            .values_list('slug', flat=True)[:options['products']]
+        ]
+
+        catalog_cache.reset_stats()
+        started = time.monotonic()
+        failed = 0
+        for url in urls:
+            response = client.get(url)
+            if response.status_code != 200:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'  ! {url} returned {response.status_code}'))
+        elapsed = time.monotonic() - started
+
+        stats = catalog_cache.get_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f'Warmed {len(urls) - failed}/{len(urls)} pages in {elapsed:.2f}s '
+            f'(catalog version {catalog_cache.get_version()}, '
+            f'{stats["misses"]} misses, {stats["hits"]} hits)'
+        ))
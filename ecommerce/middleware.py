@@ -0,0 +1,107 @@
+# middleware.py - Request-level middleware for the shop
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils.functional import SimpleLazyObject
+
+from . import instrumentation
+from .cart import COOKIE_NAME, COOKIE_SALT, resolve_cart
+from .idempotency import REPLAY_HEADER
+
+logger = logging.getLogger('ecommerce.requests')
+
+
+class RequestMetricsMiddleware:
+    """
+    Measures SQL queries, DB time, payment gateway time and template render
+    time for a sample of requests (REQUEST_METRICS_SAMPLE_RATE). Results go
+    to a Server-Timing header and one JSON log line on 'ecommerce.requests';
+    requests with duplicate or N+1 query patterns are logged as warnings.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.REQUEST_METRICS_SAMPLE_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return self.get_response(request)
+
+        metrics, token = instrumentation.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(instrumentation.record_query))
+                response = self.get_response(request)
+        finally:
+            instrumentation.stop(token)
+        total = time.perf_counter() - metrics.started
+        response['Server-Timing'] = self.server_timing(metrics, total)
+        self.log(request, response, metrics, total)
+        return response
+
+    def server_timing(self, metrics, total):
+        entries = [
+            f'db;dur={metrics.db_seconds * 1000:.1f};desc="{len(metrics.queries)} queries"',
+            f'render;dur={metrics.render_seconds * 1000:.1f}',
+        ]
+        if metrics.gateway_calls:
+            entries.append(f'gateway;dur={metrics.gateway_seconds * 1000:.1f};desc="{metrics.gateway_calls} calls"')
+        entries.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+    def log(self, request, response, metrics, total):
+        duplicates = metrics.duplicates()
+        repeated = metrics.repeated(settings.REQUEST_METRICS_N_PLUS_ONE_THRESHOLD)
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(metrics.db_seconds * 1000, 1),
+            'queries': len(metrics.queries),
+            'duplicate_queries': sum(n - 1 for n in duplicates.values()),
+            'gateway_ms': round(metrics.gateway_seconds * 1000, 1),
+            'gateway_calls': metrics.gateway_calls,
+            'render_ms': round(metrics.render_seconds * 1000, 1),
+        }
+        if response.has_header(REPLAY_HEADER):
+            record['idempotent_replay'] = True
+        if repeated:
+            record['n_plus_one'] = [
+                {'sql': sql[:200], 'count': n}
+                for sql, n in sorted(repeated.items(), key=lambda item: -item[1])[:3]
+            ]
+        level = logging.WARNING if repeated or duplicates else logging.INFO
+        logger.log(level, json.dumps(record))
+
+
+class CartMiddleware:
+    """
+    Gives views a lazy request.cart, resolved at most once per request, and
+    writes an anonymous CookieCart back to its signed cookie when it changed.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.cart = SimpleLazyObject(lambda: resolve_cart(request))
+        response = self.get_response(request)
+        cart = getattr(request, '_cookie_cart', None)
+        if cart is not None and cart.modified:
+            if cart.lines:
+                response.set_signed_cookie(
+                    COOKIE_NAME, cart.dumps(), salt=COOKIE_SALT, max_age=settings.CART_COOKIE_AGE,
+                    httponly=True, samesite='Lax', secure=request.is_secure(),
+                )
+            else:
+                response.delete_cookie(COOKIE_NAME, samesite='Lax')
+        return response
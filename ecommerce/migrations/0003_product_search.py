@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_fts_table(apps, schema_editor):
+    """Create the FTS5 index on SQLite builds that support it and fill it"""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS ecommerce_product_fts "
+                "USING fts5(name, description, category, tokenize='unicode61 remove_diacritics 2')"
+            )
+        except Exception:
+            # No FTS5 in this SQLite build, search falls back to ProductSearchTerm
+            return
+        cursor.execute(
+            "INSERT INTO ecommerce_product_fts (rowid, name, description, category) "
+            "SELECT p.id, p.name, p.description, c.name FROM ecommerce_product p "
+            "JOIN ecommerce_category c ON c.id = p.category_id"
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS ecommerce_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0002_order_country_order_currency_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='ecommerce.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'product'], name='search_term_product_idx')],
+            },
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:26
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def populate_counts(apps, schema_editor):
+    Category = apps.get_model('ecommerce', 'Category')
+    counts = Category.objects.annotate(n=Count('products', filter=Q(products__available=True)))
+    for category in counts:
+        Category.objects.filter(pk=category.pk).update(available_product_count=category.n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0003_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='available_product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:57
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_summaries(apps, schema_editor):
+    Order = apps.get_model('ecommerce', 'Order')
+    OrderItem = apps.get_model('ecommerce', 'OrderItem')
+    items = OrderItem.objects.filter(order=OuterRef('pk')).order_by()
+    Order.objects.update(
+        item_count=Coalesce(Subquery(items.values('order').annotate(n=Sum('quantity')).values('n')), 0),
+        first_item_name=Coalesce(Subquery(items.order_by('id').values('product__name')[:1]), models.Value('')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0012_job_queue'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_user_created_idx',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='first_item_name',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_idx'),
+        ),
+    ]
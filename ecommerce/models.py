@@ -8,6 +8,8 @@ class Category(models.Model):
     name = models.CharField(max_length=200)
     slug = models.SlugField(unique=True, blank=True)
     description = models.TextField(blank=True)
+    # Denormalized count of available products, maintained by ecommerce.counters
+    available_product_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -17,6 +19,12 @@ class Category(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back a stale counter; it is only changed through F() updates
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'available_product_count'
+            ]
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -37,6 +45,18 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Newest-first listings (home, product_list, category_detail); see audit_queries.
+            # Partial, because a boolean filter compiles to a bare WHERE "available" that
+            # SQLite cannot seek on as the leading column of a composite index.
+            models.Index(
+                fields=['created_at', 'id'], condition=models.Q(available=True), name='product_newest_idx'
+            ),
+            models.Index(
+                fields=['category', 'created_at', 'id'], condition=models.Q(available=True),
+                name='product_cat_newest_idx'
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -50,14 +70,40 @@ class Product(models.Model):
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     session_key = models.CharField(max_length=40, null=True, blank=True)
+    # Denormalized summary of the items, maintained by ecommerce.counters
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['session_key'], name='cart_session_key_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back a stale summary; it is only changed through F() updates
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in ('item_count', 'subtotal')
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Cart {self.id}"
 
     def get_total(self):
-        return sum(item.get_subtotal() for item in self.items.all())
+        return self.subtotal
+
+    def get_items(self):
+        """The cart's items with their products and categories, loaded once"""
+        if not hasattr(self, '_items'):
+            self._items = list(self.items.select_related('product__category'))
+        return self._items
+
+    def forget_items(self):
+        self.__dict__.pop('_items', None)
 
 
 class CartItem(models.Model):
@@ -66,6 +112,12 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # One line per product; adding again increments it (see ecommerce.cart.add_items)
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
@@ -117,8 +169,17 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     paid_at = models.DateTimeField(null=True, blank=True)
 
+    # Stored when the order is placed so order history never loads items
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    first_item_name = models.CharField(max_length=200, blank=True, editable=False)
+    # The cart the order was placed from; its lines are taken out once payment is confirmed
+    cart = models.ForeignKey(Cart, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+')
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.id} - {self.get_payment_method_display()}"
@@ -137,6 +198,25 @@ class OrderItem(models.Model):
         return self.price * self.quantity
 
 
+class StockReservation(models.Model):
+    """Stock held for an unpaid order until its payment is confirmed or the hold expires"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Covers SUM(quantity) of a product's active holds without touching the table
+            models.Index(fields=['product', 'expires_at', 'quantity'], name='reservation_active_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for order {self.order_id}"
+
+
 class PaymentTransaction(models.Model):
     """Track all payment transactions"""
     TRANSACTION_STATUS = [
@@ -158,4 +238,112 @@ class PaymentTransaction(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.payment_method} - {self.transaction_id}"
\ No newline at end of file
+        return f"{self.payment_method} - {self.transaction_id}"
+
+
+class IdempotencyKey(models.Model):
+    """The stored outcome of a request sent with an Idempotency-Key header, replayed on retries"""
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # null while in flight
+    response_body = models.BinaryField(null=True, blank=True)  # zlib compressed
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
+
+
+class Job(models.Model):
+    """A unit of deferred work for the run_jobs worker"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('dead', 'Dead'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField()
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The workers' claim query: oldest ready job first
+            models.Index(fields=['run_at', 'id'], name='job_ready_idx', condition=models.Q(status='queued')),
+            models.Index(fields=['status', 'locked_at'], name='job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+
+class ProductSearchTerm(models.Model):
+    """Inverted index entry used by the portable product search backend"""
+    term = models.CharField(max_length=64)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'product'], name='search_term_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.product_id}"
+
+
+class RelatedProduct(models.Model):
+    """Precomputed "customers also bought" neighbours, rebuilt by build_related_products"""
+    SOURCE_CHOICES = [
+        ('copurchase', 'Bought together'),
+        ('category', 'Same category'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.PositiveIntegerField(default=0)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default='copurchase')
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'related'], name='unique_related_product'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'rank'], name='related_product_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.source})"
+
+
+class RelatedProductsRun(models.Model):
+    """One execution of build_related_products; the latest watermark drives incremental runs"""
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    watermark = models.DateTimeField(help_text='Orders paid up to this time have been counted')
+    full_rebuild = models.BooleanField(default=False)
+    orders_processed = models.PositiveIntegerField(default=0)
+    products_updated = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"Related products run {self.id} ({self.orders_processed} orders)"
@@ -5,6 +5,9 @@ from datetime import datetime
 from django.conf import settings
 import logging
 
+from . import oauth_tokens
+from .instrumentation import gateway_call
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,9 +22,15 @@ class MPesaService:
         self.passkey = settings.MPESA_PASSKEY
         self.callback_url = settings.MPESA_CALLBACK_URL
         self.access_token = None
+        self.token_key = oauth_tokens.token_key('mpesa', self.api_url, self.consumer_key)
 
     def get_access_token(self):
-        """Get M-Pesa OAuth access token"""
+        """M-Pesa OAuth access token, shared by all workers until shortly before it expires"""
+        self.access_token = oauth_tokens.get_token(self.token_key, self.fetch_access_token)
+        return self.access_token
+
+    def fetch_access_token(self):
+        """Request a new M-Pesa OAuth access token; returns (token, expires_in seconds)"""
         url = f"{self.api_url}/oauth/v1/generate?grant_type=client_credentials"
         
         auth = base64.b64encode(
@@ -33,14 +42,21 @@ class MPesaService:
         }
         
         try:
-            response = requests.get(url, headers=headers)
+            with gateway_call():
+                response = requests.get(url, headers=headers)
             response.raise_for_status()
-            self.access_token = response.json()['access_token']
-            return self.access_token
+            token = response.json()
+            return token['access_token'], token['expires_in']
         except Exception as e:
             logger.error(f"Error getting M-Pesa access token: {str(e)}")
             raise
 
+    def _raise_for_status(self, response):
+        if response.status_code == 401:
+            # Revoked or rotated credentials: the next call fetches a new token
+            oauth_tokens.invalidate(self.token_key)
+        response.raise_for_status()
+
     def generate_password(self):
         """Generate password for STK push"""
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
@@ -50,8 +66,7 @@ class MPesaService:
 
     def stk_push(self, phone_number, amount, account_reference, transaction_desc):
         """Initiate STK Push (Lipa Na M-Pesa Online)"""
-        if not self.access_token:
-            self.get_access_token()
+        self.get_access_token()
         
         url = f"{self.api_url}/mpesa/stkpush/v1/processrequest"
         
@@ -85,8 +100,9 @@ class MPesaService:
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
+            with gateway_call():
+                response = requests.post(url, json=payload, headers=headers)
+            self._raise_for_status(response)
             return response.json()
         except Exception as e:
             logger.error(f"Error initiating M-Pesa STK push: {str(e)}")
@@ -94,8 +110,7 @@ class MPesaService:
 
     def query_stk_push(self, checkout_request_id):
         """Query the status of an STK push transaction"""
-        if not self.access_token:
-            self.get_access_token()
+        self.get_access_token()
         
         url = f"{self.api_url}/mpesa/stkpushquery/v1/query"
         
@@ -114,8 +129,9 @@ class MPesaService:
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
+            with gateway_call():
+                response = requests.post(url, json=payload, headers=headers)
+            self._raise_for_status(response)
             return response.json()
         except Exception as e:
             logger.error(f"Error querying M-Pesa STK push: {str(e)}")
@@ -123,8 +139,7 @@ class MPesaService:
 
     def b2c_payment(self, phone_number, amount, occasion, remarks):
         """Make B2C payment (Business to Customer)"""
-        if not self.access_token:
-            self.get_access_token()
+        self.get_access_token()
         
         url = f"{self.api_url}/mpesa/b2c/v1/paymentrequest"
         
@@ -153,8 +168,9 @@ class MPesaService:
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
+            with gateway_call():
+                response = requests.post(url, json=payload, headers=headers)
+            self._raise_for_status(response)
             return response.json()
         except Exception as e:
             logger.error(f"Error initiating M-Pesa B2C payment: {str(e)}")
@@ -0,0 +1,110 @@
+# oauth_tokens.py - Payment gateway OAuth tokens shared through the Django cache
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .stats import StatCounters
+
+# Never refresh more than this share of a token's life ahead of its expiry
+MAX_EARLY_FRACTION = 0.5
+
+_local_lock = threading.Lock()
+_local = {}  # cache key -> entry, so a process does not read the cache on every call
+_stats = StatCounters('local_hits', 'cache_hits', 'refreshes', 'waits', 'early_refreshes')
+
+
+def get_stats():
+    """Token counters for this process; hit_rate is the share of lookups that needed no OAuth request"""
+    stats = _stats.snapshot()
+    lookups = stats['local_hits'] + stats['cache_hits'] + stats['refreshes']
+    stats['hit_rate'] = (lookups - stats['refreshes']) / lookups if lookups else 0.0
+    return stats
+
+
+def reset_stats():
+    _stats.reset()
+
+
+def token_key(provider, api_url, client_id):
+    """Cache key for one set of credentials; the client id is hashed, never stored"""
+    digest = hashlib.md5(f'{api_url}\0{client_id}'.encode()).hexdigest()
+    return f'oauth:{provider}:{digest}'
+
+
+def _entry(token, expires_in, now):
+    early = min(settings.OAUTH_TOKEN_REFRESH_MARGIN, expires_in * MAX_EARLY_FRACTION)
+    return {'token': token, 'expires_at': now + expires_in, 'refresh_at': now + expires_in - early}
+
+
+def _remember(key, entry):
+    with _local_lock:
+        _local[key] = entry
+
+
+def get_token(key, fetch):
+    """
+    A valid access token for `key`. fetch() performs the OAuth request and
+    returns (access_token, expires_in seconds); it runs only when no cached
+    token is usable, and then in one worker at a time (single flight, using
+    cache.add as the lock; atomic on Redis and Memcached, while the file
+    cache can occasionally let a second worker through). Within
+    OAUTH_TOKEN_REFRESH_MARGIN of expiry the lock holder refreshes while
+    everyone else keeps using the current token.
+    Callers that find no valid token wait for the holder, up to
+    OAUTH_TOKEN_LOCK_SECONDS, and then fetch for themselves.
+    """
+    now = time.time()
+    with _local_lock:
+        entry = _local.get(key)
+    if entry and now < entry['refresh_at']:
+        _stats.count('local_hits')
+        return entry['token']
+
+    entry = cache.get(key)
+    if entry and now < entry['refresh_at']:
+        _stats.count('cache_hits')
+        _remember(key, entry)
+        return entry['token']
+
+    lock_key, holder = f'{key}:refresh', uuid.uuid4().hex
+    if not cache.add(lock_key, holder, settings.OAUTH_TOKEN_LOCK_SECONDS):
+        if entry and now < entry['expires_at']:
+            # Another worker is refreshing ahead of expiry; this token still works
+            _stats.count('cache_hits')
+            return entry['token']
+        _stats.count('waits')
+        deadline = now + settings.OAUTH_TOKEN_LOCK_SECONDS
+        delay = 0.05
+        while time.time() < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+            entry = cache.get(key)
+            if entry and time.time() < entry['expires_at']:
+                _remember(key, entry)
+                return entry['token']
+            if cache.add(lock_key, holder, settings.OAUTH_TOKEN_LOCK_SECONDS):
+                break  # the holder gave up or died
+    try:
+        if entry and now < entry['expires_at']:
+            _stats.count('early_refreshes')
+        _stats.count('refreshes')
+        token, expires_in = fetch()
+        entry = _entry(token, int(expires_in), time.time())
+        # Evicted a little before expiry, so a cached token is never an expired one
+        cache.set(key, entry, max(1, int(entry['expires_at'] - time.time()) - 1))
+        _remember(key, entry)
+        return token
+    finally:
+        if cache.get(lock_key) == holder:
+            cache.delete(lock_key)
+
+
+def invalidate(key):
+    """Drop a token the gateway rejected (revoked or rotated credentials) so the next call fetches a new one"""
+    with _local_lock:
+        _local.pop(key, None)
+    cache.delete(key)
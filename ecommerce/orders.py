@@ -0,0 +1,97 @@
+# orders.py - Turning a cart into an order in one transaction
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import catalog_cache
+from .cart import clear_cart, remove_ordered
+from .jobs import enqueue
+from .models import Cart, Order, OrderItem, PaymentTransaction, Product
+from .reservations import OutOfStock, held_quantity, release, reserve
+
+
+def take_stock(lines):
+    """
+    Decrement stock for [(product_id, quantity), ...] with one conditional
+    UPDATE ... WHERE stock - held >= quantity per product, where held is what
+    active reservations hold, so concurrent checkouts can never oversell.
+    Raises OutOfStock on the first short line; call it inside a transaction
+    so earlier decrements are rolled back with it.
+    """
+    now = timezone.now()
+    lines = sorted(lines)
+    # A fixed product order keeps concurrent checkouts from deadlocking on each other's rows
+    for product_id, quantity in lines:
+        taken = Product.objects.filter(pk=product_id, stock__gte=held_quantity(now) + quantity).update(
+            stock=F('stock') - quantity, updated_at=now,
+        )
+        if not taken:
+            raise OutOfStock(product_id, quantity)
+    # updated_at reaches the catalog validators once the cached pages expire, so
+    # a stock count is at most CATALOG_CACHE_TIMEOUT old; a sold-out product
+    # changes the in-stock facet and listings, so that is shown straight away
+    if Product.objects.filter(pk__in=[product_id for product_id, _ in lines], stock__lte=0).exists():
+        transaction.on_commit(catalog_cache.bump_version)
+
+
+def place_order(cart, user, fields, payment=None):
+    """
+    Create an Order with its items from a stored Cart as one atomic unit.
+    Items are written with a single bulk insert. When the order is already
+    paid, stock is taken, the optional PaymentTransaction (a dict of its
+    fields) is recorded and the cart is emptied; otherwise the stock is
+    reserved until confirm_payment(). If any line is short nothing is
+    written and OutOfStock is raised.
+    """
+    items = cart.get_items()
+    lines = [(item.product_id, item.quantity) for item in items]
+    with transaction.atomic():
+        order = Order.objects.create(
+            user=user, cart=cart, total_amount=cart.get_total(),
+            item_count=sum(item.quantity for item in items),
+            first_item_name=items[0].product.name[:200] if items else '',
+            **fields,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=item.product, price=item.product.price, quantity=item.quantity)
+            for item in items
+        ])
+        if payment is not None:
+            PaymentTransaction.objects.create(order=order, **payment)
+        if order.status == 'paid':
+            take_stock(lines)
+            clear_cart(cart)
+        else:
+            reserve(order, lines)
+    return order
+
+
+def confirm_payment(order):
+    """
+    Turn an order's stock reservations into a real decrement once its
+    payment is confirmed, and take the ordered lines out of the customer's
+    cart. Raises OutOfStock if the reservations had expired and the stock
+    was sold meanwhile.
+    """
+    with transaction.atomic():
+        release(order)
+        lines = list(order.items.values_list('product_id', 'quantity'))
+        take_stock(lines)
+        # Orders placed before Order.cart was recorded fall back to the customer's cart
+        cart = Cart.objects.filter(pk=order.cart_id).first() if order.cart_id else None
+        if cart is None and order.user_id:
+            cart = Cart.objects.filter(user=order.user).first()
+        if cart is not None:
+            remove_ordered(cart, lines)
+
+
+def record_mpesa_callback(payment, result_code, receipt, data):
+    """
+    Persist an M-Pesa callback and queue the order work it implies
+    (tasks.apply_mpesa_result), so the gateway is answered right away.
+    """
+    with transaction.atomic():
+        PaymentTransaction.objects.filter(pk=payment.pk).update(
+            status='completed' if result_code == 0 else 'failed', response_data=data, updated_at=timezone.now(),
+        )
+        enqueue('mpesa_payment_result', {'transaction_id': payment.pk, 'result_code': result_code, 'receipt': receipt})
@@ -0,0 +1,168 @@
+# pagination.py - Keyset (cursor) pagination for catalog listings
+import base64
+import json
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor token cannot be decoded"""
+
+
+def encode_cursor(values, direction):
+    """Pack the key values of a boundary row into an opaque URL-safe token"""
+    payload = json.dumps({'v': values, 'd': direction}, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, fields=None):
+    """
+    Unpack a cursor token. With `fields` (the model fields of the key), each
+    value is converted and validated by its field, so a tampered cursor
+    raises InvalidCursor instead of failing inside the query.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        values, direction = payload['v'], payload['d']
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(str(e))
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise InvalidCursor('Malformed cursor')
+    if fields is not None:
+        if len(values) != len(fields):
+            raise InvalidCursor('Cursor does not match ordering')
+        try:
+            values = [field.to_python(value) for field, value in zip(fields, values)]
+            for field, value in zip(fields, values):
+                if value is None:
+                    raise ValidationError('Cursor values cannot be null')
+                # SQLite reports no integer range for run_validators; no key column holds more than 64 bits
+                if isinstance(value, int) and not -2 ** 63 <= value < 2 ** 63:
+                    raise ValidationError('Cursor value out of range')
+                field.run_validators(value)
+        except ValidationError as e:
+            raise InvalidCursor(str(e))
+    return values, direction
+
+
+def get_page_size(request, default=None):
+    """Read ?page_size= from the request, capped at CATALOG_PAGE_SIZE_MAX"""
+    default = default or settings.CATALOG_PAGE_SIZE
+    try:
+        page_size = int(request.GET.get('page_size', default))
+    except (TypeError, ValueError):
+        page_size = default
+    return max(1, min(page_size, settings.CATALOG_PAGE_SIZE_MAX))
+
+
+def cursor_url(request, cursor):
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return f'{request.path}?{params.urlencode()}'
+
+
+@dataclass
+class KeysetPage:
+    items: list
+    next_cursor: str = None
+    prev_cursor: str = None
+    page_size: int = 0
+    next_url: str = None
+    prev_url: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def build_urls(self, request):
+        """Attach next/prev links that keep the other query parameters"""
+        self.next_url = cursor_url(request, self.next_cursor) if self.next_cursor else None
+        self.prev_url = cursor_url(request, self.prev_cursor) if self.prev_cursor else None
+        return self
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by seeking past the last seen row instead of using OFFSET.
+
+    ``ordering`` lists the key fields the way order_by() takes them, e.g.
+    ('-created_at', '-id'). The last field must be unique so the key is total.
+    """
+
+    def __init__(self, queryset, ordering=('-created_at', '-id'), page_size=None):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.page_size = page_size or settings.CATALOG_PAGE_SIZE
+
+    def _keys(self, reverse=False):
+        keys = []
+        for key in self.ordering:
+            descending = key.startswith('-')
+            keys.append((key.lstrip('-'), descending != reverse))
+        return keys
+
+    def _seek(self, values, reverse):
+        """Build the lexicographic "strictly after values" filter"""
+        keys = self._keys(reverse)
+        condition = Q()
+        for i, (name, descending) in enumerate(keys):
+            clause = Q(**{f'{name}__{"lt" if descending else "gt"}': values[i]})
+            for j in range(i):
+                clause &= Q(**{keys[j][0]: values[j]})
+            condition |= clause
+        return condition
+
+    def _fields(self):
+        """The model field, or annotation output field, behind each key"""
+        fields = []
+        for name, _ in self._keys():
+            try:
+                fields.append(self.queryset.model._meta.get_field(name))
+            except FieldDoesNotExist:
+                fields.append(self.queryset.query.annotations[name].output_field)
+        return fields
+
+    def _order_by(self, reverse):
+        return [f'-{name}' if descending else name for name, descending in self._keys(reverse)]
+
+    def _values(self, obj):
+        return [getattr(obj, name) for name, _ in self._keys()]
+
+    def page(self, cursor=None):
+        reverse = False
+        queryset = self.queryset
+        if cursor:
+            values, direction = decode_cursor(cursor, self._fields())
+            reverse = direction == 'prev'
+            queryset = queryset.filter(self._seek(values, reverse))
+
+        rows = list(queryset.order_by(*self._order_by(reverse))[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        page = KeysetPage(items=rows, page_size=self.page_size)
+        if rows:
+            first, last = self._values(rows[0]), self._values(rows[-1])
+            if reverse:
+                page.next_cursor = encode_cursor(last, 'next')
+                page.prev_cursor = encode_cursor(first, 'prev') if has_more else None
+            else:
+                page.next_cursor = encode_cursor(last, 'next') if has_more else None
+                page.prev_cursor = encode_cursor(first, 'prev') if cursor else None
+        return page
@@ -4,6 +4,9 @@ import base64
 from django.conf import settings
 import logging
 
+from . import oauth_tokens
+from .instrumentation import gateway_call
+
 logger = logging.getLogger(__name__)
 
 
@@ -15,9 +18,15 @@ class PayPalService:
         self.client_secret = settings.PAYPAL_CLIENT_SECRET
         self.api_url = settings.PAYPAL_API_URL
         self.access_token = None
+        self.token_key = oauth_tokens.token_key('paypal', self.api_url, self.client_id)
 
     def get_access_token(self):
-        """Get PayPal OAuth access token"""
+        """PayPal OAuth access token, shared by all workers until shortly before it expires"""
+        self.access_token = oauth_tokens.get_token(self.token_key, self.fetch_access_token)
+        return self.access_token
+
+    def fetch_access_token(self):
+        """Request a new PayPal OAuth access token; returns (token, expires_in seconds)"""
         url = f"{self.api_url}/v1/oauth2/token"
         
         auth = base64.b64encode(
@@ -32,18 +41,24 @@ class PayPalService:
         data = {"grant_type": "client_credentials"}
         
         try:
-            response = requests.post(url, headers=headers, data=data)
+            with gateway_call():
+                response = requests.post(url, headers=headers, data=data)
             response.raise_for_status()
-            self.access_token = response.json()['access_token']
-            return self.access_token
+            token = response.json()
+            return token['access_token'], token['expires_in']
         except Exception as e:
             logger.error(f"Error getting PayPal access token: {str(e)}")
             raise
 
+    def _raise_for_status(self, response):
+        if response.status_code == 401:
+            # Revoked or rotated credentials: the next call fetches a new token
+            oauth_tokens.invalidate(self.token_key)
+        response.raise_for_status()
+
     def create_order(self, amount, currency='USD', order_id=None):
         """Create a PayPal order"""
-        if not self.access_token:
-            self.get_access_token()
+        self.get_access_token()
         
         url = f"{self.api_url}/v2/checkout/orders"
         
@@ -71,8 +86,9 @@ class PayPalService:
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
+            with gateway_call():
+                response = requests.post(url, json=payload, headers=headers)
+            self._raise_for_status(response)
             return response.json()
         except Exception as e:
             logger.error(f"Error creating PayPal order: {str(e)}")
@@ -80,8 +96,7 @@ class PayPalService:
 
     def capture_order(self, paypal_order_id):
         """Capture payment for a PayPal order"""
-        if not self.access_token:
-            self.get_access_token()
+        self.get_access_token()
         
         url = f"{self.api_url}/v2/checkout/orders/{paypal_order_id}/capture"
         
@@ -91,8 +106,9 @@ class PayPalService:
         }
         
         try:
-            response = requests.post(url, headers=headers)
-            response.raise_for_status()
+            with gateway_call():
+                response = requests.post(url, headers=headers)
+            self._raise_for_status(response)
             return response.json()
         except Exception as e:
             logger.error(f"Error capturing PayPal order: {str(e)}")
@@ -100,8 +116,7 @@ class PayPalService:
 
     def get_order_details(self, paypal_order_id):
         """Get details of a PayPal order"""
-        if not self.access_token:
-            self.get_access_token()
+        self.get_access_token()
         
         url = f"{self.api_url}/v2/checkout/orders/{paypal_order_id}"
         
@@ -110,8 +125,9 @@ class PayPalService:
         }
         
         try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
+            with gateway_call():
+                response = requests.get(url, headers=headers)
+            self._raise_for_status(response)
             return response.json()
         except Exception as e:
             logger.error(f"Error getting PayPal order details: {str(e)}")
@@ -119,8 +135,7 @@ class PayPalService:
 
     def refund_payment(self, capture_id, amount=None, currency='USD'):
         """Refund a captured payment"""
-        if not self.access_token:
-            self.get_access_token()
+        self.get_access_token()
         
         url = f"{self.api_url}/v2/payments/captures/{capture_id}/refund"
         
@@ -139,8 +154,9 @@ class PayPalService:
             }
         
         try:
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
+            with gateway_call():
+                response = requests.post(url, json=payload, headers=headers)
+            self._raise_for_status(response)
             return response.json()
         except Exception as e:
             logger.error(f"Error refunding PayPal payment: {str(e)}")
@@ -0,0 +1,219 @@
+# query_audit.py - Replay view traffic and EXPLAIN every query it issues
+import json
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .models import Category, Order, OrderItem, PaymentTransaction, Product
+
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE')
+
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?(?: AS \w+)?$')
+SQLITE_SORT = re.compile(r'^USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY$')
+POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on "?(\w+)"?')
+POSTGRES_SORT = re.compile(r'^(?:->\s*)?Sort\b')
+FROM_TABLE = re.compile(r' FROM "?(\w+)"?')
+ORDER_TERM = re.compile(r'^"\w+"\."\w+"(?: ASC| DESC)?$')
+NEGATED = re.compile(r'NOT \([^()]*\)')
+CLAUSE_END = re.compile(r' (?:ORDER BY|GROUP BY|LIMIT|HAVING) ')
+
+
+@dataclass
+class Finding:
+    view: str
+    kind: str  # 'scan' (table read without an index) or 'sort' (paginated query sorted in memory)
+    sql: str
+    table: str
+    suggestion: str = ''
+
+
+@dataclass
+class ViewReport:
+    view: str
+    status: int
+    queries: int
+    plans: list = field(default_factory=list)
+    findings: list = field(default_factory=list)
+
+
+class _Rollback(Exception):
+    pass
+
+
+def explain(sql):
+    """Return the plan lines of a query on the current database"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[3] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {sql}')
+        return [row[0] for row in cursor.fetchall()]
+
+
+def full_scans(plan):
+    """Tables read without an index according to the plan"""
+    pattern = SQLITE_FULL_SCAN if connection.vendor == 'sqlite' else POSTGRES_FULL_SCAN
+    tables = []
+    for line in plan:
+        match = pattern.search(line.strip())
+        if match:
+            tables.append(match.group(1))
+    return tables
+
+
+def sorts_in_memory(plan):
+    """Whether the ORDER BY is satisfied by sorting rather than by walking an index"""
+    pattern = SQLITE_SORT if connection.vendor == 'sqlite' else POSTGRES_SORT
+    return any(pattern.search(line.strip()) for line in plan)
+
+
+def _clauses(sql):
+    where = order = ''
+    if ' WHERE ' in sql:
+        where = CLAUSE_END.split(sql.split(' WHERE ', 1)[1])[0]
+    if ' ORDER BY ' in sql:
+        order = sql.split(' ORDER BY ', 1)[1].split(' LIMIT ', 1)[0]
+    return where, order
+
+
+def _orders_by_columns(sql):
+    """Only an ORDER BY of plain columns can be served by an index"""
+    _, order = _clauses(sql)
+    return bool(order) and all(ORDER_TERM.match(term.strip()) for term in order.split(','))
+
+
+def inspect(view, sql, plan):
+    """Findings for one query: full scans and in-memory sorts of filtered reads"""
+    if ' WHERE ' not in sql:
+        return []  # unfiltered reads (e.g. the category list) scan by design
+    findings = [
+        Finding(view, 'scan', sql, table, suggest_index(sql, table))
+        for table in full_scans(plan)
+    ]
+    if _orders_by_columns(sql) and sorts_in_memory(plan):
+        match = FROM_TABLE.search(sql)
+        if match:
+            table = match.group(1)
+            findings.append(Finding(view, 'sort', sql, table, suggest_index(sql, table)))
+    return findings
+
+
+def suggest_index(sql, table):
+    """
+    Suggest an index for a table: the columns it is matched on by equality,
+    then the ORDER BY columns, or the range-filtered columns when unordered.
+    Bare boolean filters become a partial index condition instead of a column.
+    """
+    where, order = _clauses(sql)
+    where = NEGATED.sub('', where)
+    column = rf'"{table}"\."(\w+)"'
+    flags = re.findall(column + r'(?=\)| AND|$)', where)
+    equality = re.findall(column + r'(?= = | IN \()', where)
+    ranged = re.findall(column + r' (?:>|<|BETWEEN)', where)
+    ordered = re.findall(column, order)
+    columns = []
+    for name in equality + (ordered or ranged):
+        if name not in columns:
+            columns.append(name)
+    if not columns:
+        return ''
+    condition = ''
+    if flags:
+        condition = ', condition=Q({})'.format(', '.join(f'{name}=True' for name in dict.fromkeys(flags)))
+    return f'Index(fields={columns!r}{condition}) on {table}'
+
+
+def build_fixture():
+    """Rows the replayed requests need; created inside the audit's rollback"""
+    category = Category.objects.create(name='Audit Category', slug='audit-category')
+    product = Product.objects.create(
+        name='Audit Product', slug='audit-product', category=category,
+        description='Query audit fixture', price=Decimal('42.00'), stock=100,
+    )
+    user = User.objects.create_user('query-audit', 'audit@example.com', 'audit-password')
+    order = Order.objects.create(
+        user=user, first_name='Audit', last_name='User', email='audit@example.com',
+        address='1 Audit Way', postal_code='00100', city='Nairobi',
+        payment_method='mpesa', total_amount=Decimal('42.00'), currency='KES', status='processing',
+    )
+    OrderItem.objects.create(order=order, product=product, price=product.price, quantity=1)
+    PaymentTransaction.objects.create(
+        order=order, payment_method='mpesa', transaction_id='audit-checkout-request',
+        amount=order.total_amount, currency='KES', status='pending',
+    )
+    return {'category': category, 'product': product, 'user': user, 'order': order}
+
+
+def audit_requests(fixture):
+    """(view name, method, url, payload, needs login) for every view worth auditing"""
+    product, category, order = fixture['product'], fixture['category'], fixture['order']
+    order_payload = {
+        'payment_method': 'mpesa', 'first_name': 'Audit', 'last_name': 'User',
+        'email': 'audit@example.com', 'address': '1 Audit Way', 'postal_code': '00100', 'city': 'Nairobi',
+        'checkout_request_id': 'audit-order-checkout',
+    }
+    callback_payload = {'Body': {'stkCallback': {
+        'ResultCode': 0, 'CheckoutRequestID': 'audit-checkout-request',
+        'CallbackMetadata': {'Item': [{'Name': 'MpesaReceiptNumber', 'Value': 'AUDIT123'}]},
+    }}}
+    return [
+        ('home', 'get', reverse('home'), None, False),
+        ('product_list', 'get', reverse('product_list'), None, False),
+        ('product_list (search)', 'get', reverse('product_list') + '?q=audit', None, False),
+        ('product_list (facets)', 'get',
+         reverse('product_list') + f'?category={category.slug}&price=25-50&in_stock=1', None, False),
+        ('product_feed', 'get', reverse('product_feed'), None, False),
+        ('product_detail', 'get', reverse('product_detail', args=[product.slug]), None, False),
+        ('category_detail', 'get', reverse('category_detail', args=[category.slug]), None, False),
+        ('add_to_cart', 'get', reverse('add_to_cart', args=[product.id]), None, False),
+        ('cart_view', 'get', reverse('cart'), None, False),
+        ('checkout', 'get', reverse('checkout'), None, False),
+        ('create_order', 'post', reverse('create_order'), order_payload, False),
+        ('mpesa_callback', 'post', reverse('mpesa_callback'), callback_payload, False),
+        ('order_success', 'get', reverse('order_success', args=[order.id]), None, False),
+        ('order_history', 'get', reverse('order_history'), None, True),
+        ('order_detail', 'get', reverse('order_detail', args=[order.id]), None, True),
+    ]
+
+
+def run_audit(only=None):
+    """
+    Replay each view against the current database inside a transaction that is
+    rolled back, with caching disabled so every query is visible, and EXPLAIN
+    what they ran. Returns a list of ViewReport.
+    """
+    reports = []
+    dummy_cache = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    try:
+        with override_settings(CACHES=dummy_cache), transaction.atomic():
+            fixture = build_fixture()
+            anonymous, member = Client(), Client()
+            member.force_login(fixture['user'])
+            for name, method, url, payload, login in audit_requests(fixture):
+                if only and not any(name.startswith(view) for view in only):
+                    continue
+                client = member if login else anonymous
+                with CaptureQueriesContext(connection) as captured:
+                    if method == 'post':
+                        response = client.post(url, data=json.dumps(payload), content_type='application/json')
+                    else:
+                        response = client.get(url)
+                report = ViewReport(view=name, status=response.status_code, queries=len(captured))
+                for query in captured.captured_queries:
+                    sql = query['sql']
+                    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+                        continue
+                    plan = explain(sql)
+                    report.plans.append((sql, plan))
+                    report.findings.extend(inspect(name, sql, plan))
+                reports.append(report)
+            raise _Rollback
+    except _Rollback:
+        pass
+    return reports
@@ -0,0 +1,196 @@
+# recommendations.py - Co-purchase based related products
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import catalog_cache
+from .models import Order, OrderItem, Product, RelatedProduct, RelatedProductsRun
+
+# Orders whose items count as a purchase
+PURCHASED_STATUSES = ('paid', 'shipped', 'delivered')
+
+# Candidates kept per product while counting; pruning beyond this keeps memory bounded
+MAX_CANDIDATES = 50
+
+# Orders with more distinct products than this only contribute their first items,
+# so a single bulk order cannot add a quadratic number of pairs
+MAX_ITEMS_PER_ORDER = 25
+
+
+class CoPurchaseCounter:
+    """Sparse product x product co-occurrence counts with per-row pruning"""
+
+    def __init__(self, max_candidates=MAX_CANDIDATES):
+        self.max_candidates = max_candidates
+        self.counts = defaultdict(Counter)
+
+    def seed(self, product_id, neighbours):
+        self.counts[product_id].update(neighbours)
+
+    def add_basket(self, product_ids):
+        basket = sorted(set(product_ids))[:MAX_ITEMS_PER_ORDER]
+        for a in basket:
+            row = self.counts[a]
+            for b in basket:
+                if a != b:
+                    row[b] += 1
+            if len(row) > self.max_candidates * 2:
+                self.counts[a] = Counter(dict(row.most_common(self.max_candidates)))
+
+    def top(self, product_id, n):
+        return self.counts[product_id].most_common(n)
+
+    def products(self):
+        return self.counts.keys()
+
+
+def iter_baskets(orders, chunk_size=5000):
+    """Yield the product ids of each order, streaming OrderItem rows in order_id order"""
+    rows = (
+        OrderItem.objects.filter(order__in=orders)
+        .order_by('order_id')
+        .values_list('order_id', 'product_id')
+        .iterator(chunk_size=chunk_size)
+    )
+    current_order, basket = None, []
+    for order_id, product_id in rows:
+        if order_id != current_order:
+            if basket:
+                yield basket
+            current_order, basket = order_id, []
+        basket.append(product_id)
+    if basket:
+        yield basket
+
+
+def _write_neighbours(product_ids, counter, top_n, chunk_size=500):
+    """
+    Replace the co-purchase rows of the given products with their current
+    top-N, chunk_size products at a time; only the candidate neighbours of
+    a chunk are checked for availability.
+    """
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[start:start + chunk_size]
+        candidates = {product_id: counter.top(product_id, top_n * 2) for product_id in chunk}
+        available = set(Product.objects.filter(
+            available=True, id__in={pk for top in candidates.values() for pk, _ in top},
+        ).values_list('id', flat=True))
+        rows = []
+        for product_id, top in candidates.items():
+            neighbours = [(pk, score) for pk, score in top if pk in available]
+            for rank, (related_id, score) in enumerate(neighbours[:top_n]):
+                rows.append(RelatedProduct(
+                    product_id=product_id, related_id=related_id,
+                    rank=rank, score=score, source='copurchase'
+                ))
+        RelatedProduct.objects.filter(product_id__in=chunk).delete()
+        RelatedProduct.objects.bulk_create(rows, batch_size=1000)
+
+
+def _fill_from_category(top_n, product_ids=None):
+    """
+    Top up products with fewer than top_n neighbours using newest same-category
+    products, for every product or only the given ones. Returns the number of
+    fallback rows written.
+    """
+    products = Product.objects.filter(available=True)
+    fallback = RelatedProduct.objects.filter(source='category')
+    existing_rows = RelatedProduct.objects.all()
+    if product_ids is not None:
+        if not product_ids:
+            return 0
+        products = products.filter(pk__in=product_ids)
+        fallback = fallback.filter(product_id__in=product_ids)
+        existing_rows = existing_rows.filter(product_id__in=product_ids)
+    fallback.delete()
+    targets = list(products.values_list('id', 'category_id'))
+
+    newest = {
+        category_id: list(
+            Product.objects.filter(available=True, category_id=category_id)
+            .order_by('-created_at', '-id').values_list('id', flat=True)[:top_n + 1]
+        )
+        for category_id in {category_id for _, category_id in targets}
+    }
+
+    existing = defaultdict(list)
+    for product_id, related_id in existing_rows.values_list('product_id', 'related_id'):
+        existing[product_id].append(related_id)
+
+    rows = []
+    for product_id, category_id in targets:
+        have = existing.get(product_id, [])
+        if len(have) >= top_n:
+            continue
+        rank = len(have)
+        for related_id in newest[category_id]:
+            if rank >= top_n:
+                break
+            if related_id != product_id and related_id not in have:
+                rows.append(RelatedProduct(
+                    product_id=product_id, related_id=related_id,
+                    rank=rank, score=0, source='category'
+                ))
+                rank += 1
+    RelatedProduct.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def build_related_products(top_n=8, full=False, chunk_size=5000):
+    """
+    Count co-purchases in orders paid since the previous run (or all of them
+    with full=True) and refresh the RelatedProduct table. Incremental runs
+    start from the stored top neighbours of the affected products, so counts
+    in the long tail beyond MAX_CANDIDATES are approximate; run with full=True
+    periodically for exact numbers.
+    """
+    previous = RelatedProductsRun.objects.filter(finished_at__isnull=False).first()
+    full = full or previous is None
+    run = RelatedProductsRun.objects.create(watermark=timezone.now(), full_rebuild=full)
+
+    orders = Order.objects.filter(status__in=PURCHASED_STATUSES, paid_at__lte=run.watermark)
+    if not full:
+        orders = orders.filter(paid_at__gt=previous.watermark)
+
+    counter = CoPurchaseCounter()
+    for basket in iter_baskets(orders.values('id'), chunk_size=chunk_size):
+        counter.add_basket(basket)
+        run.orders_processed += 1
+
+    touched = list(counter.products())
+    if not full and touched:
+        for product_id, related_id, score in RelatedProduct.objects.filter(
+            product_id__in=touched, source='copurchase'
+        ).values_list('product_id', 'related_id', 'score'):
+            counter.seed(product_id, {related_id: score})
+
+    with transaction.atomic():
+        if full:
+            RelatedProduct.objects.all().delete()
+            _write_neighbours(touched, counter, top_n)
+            filled = _fill_from_category(top_n)
+        else:
+            _write_neighbours(touched, counter, top_n)
+            # Only products whose co-purchase rows changed, plus new products that have no rows yet
+            unlisted = Product.objects.filter(available=True, related_entries__isnull=True).values_list('id', flat=True)
+            filled = _fill_from_category(top_n, set(touched) | set(unlisted))
+
+    if full or touched or filled:
+        # Related products are part of the cached product pages
+        catalog_cache.bump_version()
+    run.products_updated = len(touched)
+    run.finished_at = timezone.now()
+    run.save()
+    return run
+
+
+def get_related_products(product, limit=4):
+    """Precomputed neighbours for product_detail, one indexed query"""
+    return [
+        entry.related for entry in
+        RelatedProduct.objects.filter(product=product, related__available=True)
+        .select_related('related__category')
+        .order_by('rank')[:limit]
+    ]
@@ -0,0 +1,79 @@
+# reservations.py - Stock held for orders while their payment is confirmed
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, StockReservation
+
+
+class OutOfStock(Exception):
+    """An order line asks for more units than the product has free"""
+
+    def __init__(self, product_id, quantity):
+        self.product_id = product_id
+        self.quantity = quantity
+        super().__init__(f'Not enough stock for product {product_id} (wanted {quantity})')
+
+
+def active(now=None):
+    return StockReservation.objects.filter(expires_at__gt=now or timezone.now())
+
+
+def held_quantity(now=None):
+    """Units held by the active reservations of the outer product (0 when none), read from the covering index"""
+    held = (
+        active(now).filter(product=OuterRef('pk')).order_by()
+        .values('product').annotate(total=Sum('quantity')).values('total')
+    )
+    return Coalesce(Subquery(held), 0)
+
+
+def available_stock(product_ids, now=None):
+    """{product id: stock not held by active reservations}"""
+    return dict(
+        Product.objects.filter(pk__in=list(product_ids)).order_by()
+        .annotate(free=F('stock') - held_quantity(now)).values_list('pk', 'free')
+    )
+
+
+def reserve(order, lines, now=None):
+    """
+    Hold [(product_id, quantity), ...] for an unpaid order for
+    STOCK_RESERVATION_SECONDS, all or nothing. The product rows are locked
+    only for this short transaction, never while the customer pays.
+    Raises OutOfStock when a line cannot be held.
+    """
+    now = now or timezone.now()
+    quantities = dict(lines)
+    with transaction.atomic():
+        # Serialize concurrent holds on the same products; a fixed order avoids deadlocks
+        list(Product.objects.select_for_update().filter(pk__in=list(quantities)).order_by('pk').values_list('pk'))
+        free = available_stock(quantities, now)
+        for product_id, quantity in sorted(quantities.items()):
+            if free.get(product_id, 0) < quantity:
+                raise OutOfStock(product_id, quantity)
+        expires_at = now + timedelta(seconds=settings.STOCK_RESERVATION_SECONDS)
+        StockReservation.objects.bulk_create([
+            StockReservation(product_id=product_id, order=order, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in quantities.items()
+        ])
+
+
+def release(order):
+    """Drop an order's holds, e.g. when its payment failed"""
+    return StockReservation.objects.filter(order=order).delete()[0]
+
+
+def release_expired(now=None, batch_size=1000):
+    """Delete expired holds in batches; returns how many were deleted"""
+    expired = StockReservation.objects.filter(expires_at__lte=now or timezone.now())
+    deleted = 0
+    while True:
+        ids = list(expired.order_by('expires_at').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += StockReservation.objects.filter(id__in=ids).delete()[0]
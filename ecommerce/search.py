@@ -0,0 +1,205 @@
+# search.py - Inverted index product search
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Sum, Value, When
+
+from .models import Product, ProductSearchTerm
+
+FTS_TABLE = 'ecommerce_product_fts'
+
+# Relative importance of each indexed field when ranking results
+NAME_WEIGHT = 10
+CATEGORY_WEIGHT = 4
+DESCRIPTION_WEIGHT = 1
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Split text into lowercase search terms"""
+    return [token[:64] for token in TOKEN_RE.findall((text or '').lower())]
+
+
+_fts5_support = {}
+
+
+def fts5_available(conn=None):
+    """Check (once per vendor) whether the SQLite build behind the connection ships FTS5"""
+    conn = conn or connection
+    if conn.vendor != 'sqlite':
+        return False
+    if conn.vendor not in _fts5_support:
+        with conn.cursor() as cursor:
+            try:
+                cursor.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+                cursor.execute("DROP TABLE temp._fts5_probe")
+                _fts5_support[conn.vendor] = True
+            except Exception:
+                _fts5_support[conn.vendor] = False
+    return _fts5_support[conn.vendor]
+
+
+class FTS5SearchBackend:
+    """SQLite FTS5 index keyed by product id (the FTS rowid)"""
+
+    def __init__(self, conn=None):
+        self.connection = conn or connection
+
+    def create_schema(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5(name, description, category, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    def drop_schema(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+    def index_products(self, products):
+        rows = [
+            (product.id, product.name, product.description, product.category.name)
+            for product in products
+        ]
+        if not rows:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, description, category) VALUES (%s, %s, %s, %s)",
+                rows
+            )
+
+    def remove_products(self, product_ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk in product_ids])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+
+    def search(self, query, limit):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Every term must match; the trailing * turns each one into a prefix query
+        match = ' '.join(f'"{term}"*' for term in terms)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, %s, %s, %s) LIMIT %s",
+                [match, NAME_WEIGHT, DESCRIPTION_WEIGHT, CATEGORY_WEIGHT, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class TermSearchBackend:
+    """Portable inverted index stored in the ProductSearchTerm table"""
+
+    def create_schema(self):
+        pass
+
+    def drop_schema(self):
+        pass
+
+    def _terms_for(self, product):
+        weights = defaultdict(int)
+        for field_text, weight in (
+            (product.name, NAME_WEIGHT),
+            (product.category.name, CATEGORY_WEIGHT),
+            (product.description, DESCRIPTION_WEIGHT),
+        ):
+            for term in tokenize(field_text):
+                weights[term] += weight
+        return [
+            ProductSearchTerm(term=term, product_id=product.id, weight=weight)
+            for term, weight in weights.items()
+        ]
+
+    def index_products(self, products):
+        products = list(products)
+        if not products:
+            return
+        ProductSearchTerm.objects.filter(product_id__in=[p.id for p in products]).delete()
+        entries = []
+        for product in products:
+            entries.extend(self._terms_for(product))
+        ProductSearchTerm.objects.bulk_create(entries, batch_size=1000)
+
+    def remove_products(self, product_ids):
+        ProductSearchTerm.objects.filter(product_id__in=list(product_ids)).delete()
+
+    def clear(self):
+        ProductSearchTerm.objects.all().delete()
+
+    def search(self, query, limit):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        scores = None
+        for term in terms:
+            matches = dict(
+                ProductSearchTerm.objects.filter(term__startswith=term)
+                .values('product_id')
+                .annotate(score=Sum('weight'))
+                .values_list('product_id', 'score')
+            )
+            if scores is None:
+                scores = matches
+            else:
+                scores = {pk: scores[pk] + score for pk, score in matches.items() if pk in scores}
+            if not scores:
+                return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [pk for pk, score in ranked[:limit]]
+
+
+def get_backend(conn=None):
+    """Return the configured search backend ('auto' prefers FTS5 when available)"""
+    conn = conn or connection
+    choice = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'auto')
+    if choice == 'fts5' or (choice == 'auto' and fts5_available(conn)):
+        return FTS5SearchBackend(conn)
+    return TermSearchBackend()
+
+
+def index_product(product):
+    get_backend().index_products([product])
+
+
+def remove_product(product_id):
+    get_backend().remove_products([product_id])
+
+
+def rebuild_index(chunk_size=1000):
+    """Rebuild the whole index from the Product table, returns the number of products indexed"""
+    backend = get_backend()
+    backend.create_schema()
+    backend.clear()
+    indexed = 0
+    batch = []
+    for product in Product.objects.select_related('category').order_by('id').iterator(chunk_size=chunk_size):
+        batch.append(product)
+        if len(batch) >= chunk_size:
+            backend.index_products(batch)
+            indexed += len(batch)
+            batch = []
+    backend.index_products(batch)
+    return indexed + len(batch)
+
+
+def search_products(queryset, query, limit=None):
+    """Restrict a Product queryset to search hits, ordered by relevance"""
+    limit = limit or getattr(settings, 'PRODUCT_SEARCH_LIMIT', 500)
+    product_ids = get_backend().search(query, limit)
+    if not product_ids:
+        # Keep the annotation so callers can still order and paginate on it
+        return queryset.annotate(search_rank=Value(0, output_field=IntegerField())).none()
+    ranking = Case(
+        *[When(pk=pk, then=position) for position, pk in enumerate(product_ids)],
+        output_field=IntegerField()
+    )
+    return queryset.filter(pk__in=product_ids).annotate(search_rank=ranking).order_by('search_rank')
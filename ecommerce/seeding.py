@@ -0,0 +1,299 @@
+# seeding.py - Reproducible synthetic users, products, orders and carts at benchmark scale, run through `manage.py seed_data`
+import random
+import string
+import time
+from array import array
+from dataclasses import dataclass
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import catalog_cache, counters, search
+from .models import Cart, CartItem, Category, Order, OrderItem, Product
+
+SAMPLE_CATEGORIES = [
+    {'name': 'Electronics', 'description': 'Latest gadgets and electronic devices'},
+    {'name': 'Clothing', 'description': 'Fashion and apparel for everyone'},
+    {'name': 'Books', 'description': 'Books for all interests and ages'},
+    {'name': 'Home & Kitchen', 'description': 'Everything you need for your home'},
+    {'name': 'Sports & Outdoors', 'description': 'Gear for your active lifestyle'},
+    {'name': 'Beauty & Personal Care', 'description': 'Beauty products and personal care items'},
+    {'name': 'Toys & Games', 'description': 'Fun for kids and adults'},
+    {'name': 'Automotive', 'description': 'Parts and accessories for your vehicle'},
+]
+
+NOUNS = {
+    'Electronics': ['Headphones', 'Power Bank', 'USB-C Hub', 'Gaming Mouse', 'Smart Watch', 'Speaker', 'Keyboard'],
+    'Clothing': ['T-Shirt', 'Jeans', 'Windbreaker', 'Running Shorts', 'Sweater', 'Hoodie', 'Kitenge Dress'],
+    'Books': ['Cookbook', 'Novel', 'Field Guide', 'Atlas', 'Workbook', 'Biography', 'Poetry Collection'],
+    'Home & Kitchen': ['Knife Set', 'Cookware Set', 'Coffee Maker', 'Pillow Set', 'Desk Lamp', 'Jiko', 'Blender'],
+    'Sports & Outdoors': ['Yoga Mat', 'Resistance Bands', 'Tent', 'Dumbbells', 'Water Bottle', 'Football', 'Backpack'],
+    'Beauty & Personal Care': ['Cleansing Brush', 'Hair Dryer', 'Brush Set', 'Toothbrush', 'Diffuser', 'Shea Butter'],
+    'Toys & Games': ['Building Blocks', 'Board Game', 'RC Car', 'Craft Kit', 'Puzzle', 'Bao Set', 'Kite'],
+    'Automotive': ['Phone Mount', 'Emergency Kit', 'Car Vacuum', 'Dash Camera', 'Seat Organizer', 'Tyre Inflator'],
+}
+GENERIC_NOUNS = ['Set', 'Kit', 'Bundle', 'Organizer', 'Accessory']
+ADJECTIVES = [
+    'Classic', 'Compact', 'Deluxe', 'Everyday', 'Lightweight', 'Portable', 'Premium', 'Rugged', 'Slim', 'Smart',
+    'Travel', 'Wireless', 'Eco', 'Pro', 'Essential', 'Heritage',
+]
+COLOURS = ['Black', 'White', 'Navy', 'Red', 'Green', 'Grey', 'Sand', 'Orange', 'Teal', 'Maroon']
+FIRST_NAMES = ['Amina', 'Brian', 'Chebet', 'David', 'Esther', 'Faith', 'George', 'Halima', 'Ian', 'Joy', 'Kamau',
+               'Lilian', 'Mwangi', 'Njeri', 'Otieno', 'Purity', 'Wanjiru', 'Zawadi']
+LAST_NAMES = ['Achieng', 'Kariuki', 'Kiprop', 'Muthoni', 'Mutua', 'Njoroge', 'Odhiambo', 'Omondi', 'Wafula', 'Wambui']
+CITIES = ['Nairobi', 'Mombasa', 'Kisumu', 'Nakuru', 'Eldoret', 'Thika', 'Nyeri', 'Machakos']
+STREETS = ['Moi Avenue', 'Kenyatta Avenue', 'Ngong Road', 'Waiyaki Way', 'Thika Road', 'Oginga Odinga Street']
+# (status, weight); most history is settled, a little is still open or abandoned
+ORDER_STATUSES = [('delivered', 45), ('paid', 25), ('shipped', 12), ('pending', 10), ('cancelled', 5), ('failed', 3)]
+PAYMENT_METHODS = [('mpesa', 60), ('card', 25), ('paypal', 15)]
+SEEDED_PASSWORD = 'seeded-password'
+
+
+@dataclass
+class SeedStats:
+    table: str
+    rows: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _insert(model, objs, stats):
+    """bulk_create one chunk, adding its rows and time to stats"""
+    started = time.perf_counter()
+    model.objects.bulk_create(objs)
+    stats.seconds += time.perf_counter() - started
+    stats.rows += len(objs)
+    return objs
+
+
+def _next_sequence(model):
+    """Numbers above the highest id, so generated suffixes never repeat those of earlier runs"""
+    return (model.objects.aggregate(top=Max('id'))['top'] or 0) + 1
+
+
+def _unique_values(model, field, objs):
+    """
+    Make `field` unique across a chunk of unsaved objects with one lookup of
+    the values already taken; the rare clash gets a counter appended.
+    """
+    taken = set(model.objects.filter(**{f'{field}__in': [getattr(obj, field) for obj in objs]})
+                .values_list(field, flat=True))
+    for obj in objs:
+        value = getattr(obj, field)
+        candidate, n = value, 1
+        while candidate in taken:
+            candidate = f'{value}-{n}'
+            n += 1
+        setattr(obj, field, candidate)
+        taken.add(candidate)
+    return objs
+
+
+def ensure_categories():
+    """The existing categories, creating the sample ones in an empty database"""
+    categories = list(Category.objects.order_by('id'))
+    if not categories:
+        for data in SAMPLE_CATEGORIES:
+            Category.objects.create(**data)
+        categories = list(Category.objects.order_by('id'))
+    return categories
+
+
+def _ids(queryset):
+    """All ids of a queryset, streamed into a compact array"""
+    return array('q', queryset.order_by('id').values_list('id', flat=True).iterator(chunk_size=10000))
+
+
+def product_pool(rng, size):
+    """
+    Up to `size` random available products as (id, name, price), the
+    catalogue orders and carts are drawn from.
+    """
+    ids = _ids(Product.objects.filter(available=True))
+    picked = sorted(rng.sample(ids.tolist(), min(size, len(ids))))
+    pool = []
+    for chunk in chunked(picked, 500):
+        pool.extend(Product.objects.filter(pk__in=chunk).order_by('id').values_list('id', 'name', 'price'))
+    return pool
+
+
+def generate_users(count, rng, chunk_size=1000, progress=None):
+    """Insert `count` shopper accounts sharing one precomputed password hash (SEEDED_PASSWORD)"""
+    stats = SeedStats('users')
+    password = make_password(SEEDED_PASSWORD)
+    start = _next_sequence(User)
+
+    def rows():
+        for n in range(start, start + count):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            yield User(
+                username=f'shopper{n}', email=f'shopper{n}@example.com', password=password,
+                first_name=first, last_name=last,
+            )
+
+    for chunk in chunked(rows(), chunk_size):
+        with transaction.atomic():
+            _insert(User, _unique_values(User, 'username', chunk), stats)
+        if progress:
+            progress(stats)
+    return stats
+
+
+def generate_products(count, rng, chunk_size=1000, progress=None):
+    """
+    Insert `count` products spread over the existing categories, indexing
+    each chunk for search as it goes. Slugs are the slugified name plus a
+    sequence number, checked against existing slugs once per chunk.
+    """
+    stats = SeedStats('products')
+    categories = ensure_categories()
+    backend = search.get_backend()
+    backend.create_schema()
+    start = _next_sequence(Product)
+
+    def rows():
+        for n in range(start, start + count):
+            category = rng.choice(categories)
+            noun = rng.choice(NOUNS.get(category.name, GENERIC_NOUNS))
+            name = f'{rng.choice(ADJECTIVES)} {rng.choice(COLOURS)} {noun}'
+            yield Product(
+                name=name, slug=f'{slugify(name)}-{n}', category=category,
+                description=f'{name} from our {category.name} range. Model {n}, quality checked before dispatch.',
+                price=Decimal(rng.randrange(199, 50000)) / 100, stock=rng.randrange(0, 200),
+                available=rng.random() > 0.05,
+            )
+
+    for chunk in chunked(rows(), chunk_size):
+        with transaction.atomic():
+            _insert(Product, _unique_values(Product, 'slug', chunk), stats)
+            backend.index_products(chunk)
+        if progress:
+            progress(stats)
+    if stats.rows:
+        # bulk_create skips the signals that keep these in step
+        counters.reconcile()
+        catalog_cache.bump_version()
+    return stats
+
+
+def generate_orders(count, rng, chunk_size=1000, pool_size=10000, progress=None):
+    """
+    Insert `count` orders with 1-4 items each from a random pool of products,
+    placed by random existing users (a fifth as guests). Returns the stats
+    for orders and order items.
+    """
+    orders, items = SeedStats('orders'), SeedStats('order items')
+    pool = product_pool(rng, pool_size)
+    if not pool:
+        raise ValueError('Orders need products; seed some with --products first')
+    user_ids = _ids(User.objects.all())
+    now = timezone.now()
+
+    def rows():
+        for _ in range(count):
+            lines = [(product, rng.randint(1, 3)) for product in rng.sample(pool, min(rng.randint(1, 4), len(pool)))]
+            payment_method = _weighted(rng, PAYMENT_METHODS)
+            status = _weighted(rng, ORDER_STATUSES)
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            order = Order(
+                user_id=rng.choice(user_ids) if user_ids and rng.random() > 0.2 else None,
+                first_name=first, last_name=last, email=f'{first}.{last}@example.com'.lower(),
+                phone=f'2547{rng.randrange(10 ** 8):08d}', address=f'{rng.randint(1, 999)} {rng.choice(STREETS)}',
+                postal_code=f'{rng.randrange(100, 90000):05d}', city=rng.choice(CITIES), country='KE',
+                payment_method=payment_method, status=status, currency='KES' if payment_method == 'mpesa' else 'USD',
+                total_amount=sum(price * quantity for (_, _, price), quantity in lines),
+                paid_at=now if status in ('paid', 'shipped', 'delivered') else None,
+                item_count=sum(quantity for _, quantity in lines), first_item_name=lines[0][0][1][:200],
+            )
+            order._seed_lines = lines
+            yield order
+
+    for chunk in chunked(rows(), chunk_size):
+        with transaction.atomic():
+            _insert(Order, chunk, orders)
+            _insert(OrderItem, [
+                OrderItem(order=order, product_id=product_id, price=price, quantity=quantity)
+                for order in chunk for (product_id, _, price), quantity in order._seed_lines
+            ], items)
+        if progress:
+            progress(orders)
+    return orders, items
+
+
+def generate_carts(count, rng, chunk_size=1000, pool_size=10000, progress=None):
+    """
+    Insert `count` carts of 1-5 distinct products: one for each user that
+    has none yet, in random order, then anonymous carts with random session
+    keys. Summaries are computed per chunk. Returns the stats for carts and
+    cart items.
+    """
+    carts, items = SeedStats('carts'), SeedStats('cart items')
+    pool = product_pool(rng, pool_size)
+    if not pool:
+        raise ValueError('Carts need products; seed some with --products first')
+    user_ids = _ids(User.objects.exclude(id__in=Cart.objects.filter(user__isnull=False).values('user_id'))).tolist()
+    rng.shuffle(user_ids)
+    session_chars = string.ascii_lowercase + string.digits
+
+    def rows():
+        for n in range(count):
+            if n < len(user_ids):
+                cart = Cart(user_id=user_ids[n])
+            else:
+                cart = Cart(session_key=''.join(rng.choices(session_chars, k=32)))
+            cart._seed_lines = [
+                (product_id, rng.randint(1, 3)) for product_id, _, _ in rng.sample(pool, min(rng.randint(1, 5), len(pool)))
+            ]
+            yield cart
+
+    for chunk in chunked(rows(), chunk_size):
+        with transaction.atomic():
+            _insert(Cart, chunk, carts)
+            _insert(CartItem, [
+                CartItem(cart=cart, product_id=product_id, quantity=quantity)
+                for cart in chunk for product_id, quantity in cart._seed_lines
+            ], items)
+            # bulk_create skips the signals that maintain item_count and subtotal
+            counters.recalculate_carts(Cart.objects.filter(id__in=[cart.id for cart in chunk]))
+        if progress:
+            progress(carts)
+    return carts, items
+
+
+def seed(users=0, products=0, orders=0, carts=0, seed=0, chunk_size=1000, progress=None):
+    """
+    Generate the requested numbers of rows in dependency order and return
+    their SeedStats. The same seed against the same database state produces
+    the same data.
+    """
+    rng = random.Random(seed)
+    results = []
+    if users:
+        results.append(generate_users(users, rng, chunk_size, progress))
+    if products:
+        results.append(generate_products(products, rng, chunk_size, progress))
+    if orders:
+        results.extend(generate_orders(orders, rng, chunk_size, progress=progress))
+    if carts:
+        results.extend(generate_carts(carts, rng, chunk_size, progress=progress))
+    return results
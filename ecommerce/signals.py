@@ -0,0 +1,146 @@
+# signals.py - Keep derived catalog and cart data in sync with model changes, carry carts across login
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import catalog_cache, counters, search
+from .cart import SESSION_CART_KEY, CookieCart, merge_carts
+from .models import Cart, CartItem, Category, Product
+
+
+@receiver(post_init, sender=Product)
+def remember_counted_state(sender, instance, **kwargs):
+    """Snapshot what the loaded row contributes to the category counters"""
+    if not instance.pk:
+        instance._counted_state = (None, False)
+    elif {'available', 'category_id'} & instance.get_deferred_fields():
+        instance._counted_state = None  # resolved in pre_save, only if the row is saved
+    else:
+        instance._counted_state = counters.counted_state(instance)
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_delete, sender=Product)
+def load_counted_state(sender, instance, raw=False, **kwargs):
+    """Read the stored state of a row that was loaded with those fields deferred"""
+    if raw or getattr(instance, '_counted_state', None) is not None:
+        return
+    stored = Product.objects.filter(pk=instance.pk).values_list('category_id', 'available').first()
+    instance._counted_state = (stored[0], bool(stored[1])) if stored else (None, False)
+
+
+@receiver(post_save, sender=Product)
+def update_category_counters(sender, instance, raw=False, **kwargs):
+    new_state = counters.counted_state(instance)
+    if not raw:
+        counters.product_changed(instance._counted_state, new_state)
+    instance._counted_state = new_state
+
+
+@receiver(post_delete, sender=Product)
+def decrement_category_counter(sender, instance, **kwargs):
+    counters.product_changed(instance._counted_state, (None, False))
+    instance._counted_state = (None, False)
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, raw=False, **kwargs):
+    """Refresh the search index entry for a saved product"""
+    if raw:
+        return
+    search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    """Drop a deleted product from the search index"""
+    search.remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created=False, raw=False, **kwargs):
+    """Category names are denormalized into product search entries and cards"""
+    if raw or created:
+        return
+    search.get_backend().index_products(instance.products.select_related('category'))
+    # Product cards show the category name and are cached on updated_at
+    instance.products.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, raw=False, **kwargs):
+    """Any catalog write moves the cache to a new version"""
+    if not raw:
+        catalog_cache.bump_version()
+
+
+@receiver(post_init, sender=Product)
+def remember_price(sender, instance, **kwargs):
+    """Snapshot the loaded price; carts holding the product are repriced when it changes"""
+    instance._loaded_price = None if 'price' in instance.get_deferred_fields() else instance.price
+
+
+@receiver(post_save, sender=Product)
+def reprice_carts(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    if instance._loaded_price is None or instance._loaded_price != instance.price:
+        counters.product_repriced(instance.pk)
+    instance._loaded_price = instance.price
+
+
+@receiver(post_init, sender=CartItem)
+def remember_line_state(sender, instance, **kwargs):
+    """Snapshot what the loaded row contributes to its cart summary"""
+    if not instance.pk:
+        instance._line_state = (None, None, 0)
+    elif {'cart_id', 'product_id', 'quantity'} & instance.get_deferred_fields():
+        instance._line_state = None  # resolved in pre_save, only if the row is saved
+    else:
+        instance._line_state = counters.cart_line_state(instance)
+
+
+@receiver(pre_save, sender=CartItem)
+@receiver(pre_delete, sender=CartItem)
+def load_line_state(sender, instance, raw=False, **kwargs):
+    """Read the stored state of a row that was loaded with those fields deferred"""
+    if raw or getattr(instance, '_line_state', None) is not None:
+        return
+    stored = CartItem.objects.filter(pk=instance.pk).values_list('cart_id', 'product_id', 'quantity').first()
+    instance._line_state = stored or (None, None, 0)
+
+
+@receiver(post_save, sender=CartItem)
+def update_cart_summary(sender, instance, raw=False, **kwargs):
+    new_state = counters.cart_line_state(instance)
+    if not raw:
+        counters.cart_item_changed(instance._line_state, new_state)
+    instance._line_state = new_state
+
+
+@receiver(post_delete, sender=CartItem)
+def subtract_from_cart_summary(sender, instance, **kwargs):
+    counters.cart_item_changed(instance._line_state, (None, None, 0))
+    instance._line_state = (None, None, 0)
+
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    """Carry the anonymous cart, stored or in the cookie, into the user's Cart when they sign in"""
+    if request is None or not hasattr(request, 'session'):
+        return
+    cookie_cart = CookieCart.for_request(request)
+    session_cart_id = request.session.pop(SESSION_CART_KEY, None)
+    anonymous = Cart.objects.filter(pk=session_cart_id, user__isnull=True).first() if session_cart_id else None
+    if anonymous is None and not cookie_cart.lines:
+        return
+    cart, _ = Cart.objects.get_or_create(user=user)
+    if anonymous is not None:
+        merge_carts(anonymous, cart)
+    cookie_cart.move_to(cart)
+    request._cart = cart
+    request._cart_summary = None
@@ -0,0 +1,23 @@
+# stats.py - Per-process event counters behind the get_stats() / reset_stats() functions
+import threading
+
+
+class StatCounters:
+    """A fixed set of named counters that any thread can bump"""
+
+    def __init__(self, *names):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(names, 0)
+
+    def count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            for name in self._counts:
+                self._counts[name] = 0
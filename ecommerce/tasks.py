@@ -0,0 +1,36 @@
+# tasks.py - Order post-processing run by the job worker (manage.py run_jobs)
+import logging
+
+from django.utils import timezone
+
+from .jobs import task
+from .models import Order
+from .orders import OutOfStock, confirm_payment
+from .reservations import release
+
+logger = logging.getLogger(__name__)
+
+
+@task('mpesa_payment_result')
+def apply_mpesa_result(transaction_id, result_code, receipt=None):
+    """
+    Mark the order paid and take its reserved stock, or fail it and release
+    the stock. The conditional UPDATE is the job's first statement, so on
+    SQLite the write lock is taken up front instead of upgrading a read
+    lock, which fails with "database is locked" under concurrent writers.
+    """
+    orders = Order.objects.filter(transactions__pk=transaction_id)
+    now = timezone.now()
+    if result_code == 0:
+        # Only the first delivery of a success callback touches the order and its stock
+        if not orders.exclude(status='paid').update(
+            status='paid', paid_at=now, mpesa_transaction_id=receipt, updated_at=now,
+        ):
+            return
+        order = orders.get()
+        try:
+            confirm_payment(order)
+        except OutOfStock as e:
+            logger.error(f"Order {order.id} paid after its stock reservation lapsed: {e}")
+    elif orders.filter(status__in=['pending', 'processing']).update(status='failed', updated_at=now):
+        release(orders.get())
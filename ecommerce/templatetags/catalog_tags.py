@@ -0,0 +1,46 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+# Rendered into cached fragments instead of a real token, swapped per request
+CSRF_PLACEHOLDER = '__CARD_CSRF_TOKEN__'
+
+
+def card_cache_key(template_name, product):
+    return f'product_card:{template_name}:{product.pk}:{product.updated_at.timestamp()}'
+
+
+@register.simple_tag(takes_context=True)
+def product_cards(context, products, template_name):
+    """
+    Render a grid of product cards with one cached fragment per product.
+
+    Fragments are keyed on the product id and updated_at, so an edited product
+    gets a new key and stale fragments simply expire. All fragments for the
+    grid are fetched with a single get_many; only the misses are rendered.
+    """
+    products = list(products)
+    keys = [card_cache_key(template_name, product) for product in products]
+    fragments = cache.get_many(keys)
+
+    missing = {}
+    for key, product in zip(keys, products):
+        if key not in fragments and key not in missing:
+            missing[key] = render_to_string(template_name, {
+                'product': product,
+                'csrf_token': CSRF_PLACEHOLDER,
+            })
+    if missing:
+        cache.set_many(missing, settings.PRODUCT_CARD_CACHE_TIMEOUT)
+        fragments.update(missing)
+
+    html = ''.join(fragments[key] for key in keys)
+    request = context.get('request')
+    if CSRF_PLACEHOLDER in html and request is not None:
+        html = html.replace(CSRF_PLACEHOLDER, get_token(request))
+    return mark_safe(html)
@@ -1,3 +1,1016 @@
-from django.test import TestCase
+import json
+import random
+import re
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import Q
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import catalog_cache, counters, jobs, oauth_tokens, recommendations, search
+from .admin import OrderAdmin
+from .cart import add_items, get_cart_summary, resolve_cart
+from .cleanup import purge_expired_sessions, purge_finished_jobs, purge_stale_carts
+from .facets import PRICE_RANGES, FacetEngine, FacetSelection, price_q
+from .loadtest import STEPS, run_load_test
+from .mpesa_service import MPesaService
+from .pagination import encode_cursor
+from .models import (
+    Cart, CartItem, Category, Job, Order, OrderItem, PaymentTransaction, Product, ProductSearchTerm, RelatedProduct,
+    StockReservation,
+)
+from .orders import OutOfStock, place_order, take_stock
+from .reservations import available_stock, release_expired
+from .seeding import seed
+from .templatetags import catalog_tags
+
+
+@override_settings(ANONYMOUS_CART_STORAGE='cookie', REQUEST_METRICS_SAMPLE_RATE=0)
+class CartQueryCountTests(TestCase):
+    """The cart pages must cost the same number of queries whatever the cart holds"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.products = [
+            Product.objects.create(
+                name=f'Shoe {n}', slug=f'shoe-{n}', category=category,
+                description='A shoe', price=Decimal('10.00') + n, stock=50,
+            )
+            for n in range(20)
+        ]
+        cls.user = User.objects.create_user('shopper', 'shopper@example.com', 'secret')
+        add_items(Cart.objects.create(user=cls.user), {product.id: 2 for product in cls.products})
+
+    def test_cart_view(self):
+        self.client.force_login(self.user)
+        # session, user, cart, items with products and categories
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('cart'))
+        self.assertEqual(len(response.context['cart_items']), 20)
+        self.assertContains(response, '<span class="cart-badge">40</span>', html=True)
+
+    def test_checkout(self):
+        self.client.force_login(self.user)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('checkout'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['subtotal'], sum(p.price * 2 for p in self.products))
+
+    def test_anonymous_cookie_cart_view(self):
+        items = [{'product_id': product.id, 'quantity': 1} for product in self.products]
+        self.client.post(reverse('cart_items_bulk'), json.dumps({'items': items}), content_type='application/json')
+        # products with categories; no session or cart rows
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('cart'))
+        self.assertEqual(len(response.context['cart_items']), 20)
+
+    def test_bulk_items_checks_csrf_quantity_and_stock(self):
+        url = reverse('cart_items_bulk')
+        body = lambda *items: json.dumps({'items': [{'product_id': p.id, 'quantity': q} for p, q in items]})
+        csrf_client = Client(enforce_csrf_checks=True)
+        self.assertEqual(csrf_client.post(url, body((self.products[0], 1)), content_type='application/json').status_code, 403)
+
+        response = self.client.post(url, body((self.products[0], 100)), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        # 50 in stock: the second request would take the line to 60
+        response = self.client.post(url, body((self.products[0], 40), (self.products[1], 1)), content_type='application/json')
+        self.assertEqual((response.json()['rejected'], response.json()['cart']['item_count']), ([], 41))
+        response = self.client.post(url, body((self.products[0], 20)), content_type='application/json')
+        self.assertEqual((response.json()['rejected'], response.json()['cart']['item_count']), ([self.products[0].id], 41))
+
+    def test_update_cart_line_json(self):
+        self.client.force_login(self.user)
+        item = Cart.objects.get(user=self.user).items.get(product=self.products[0])
+        response = self.client.post(reverse('cart_item_update', args=[item.id]), {'quantity': 5})
+        data = response.json()
+        self.assertEqual(data['item'], {'id': item.id, 'quantity': 5, 'subtotal': '50.00'})
+        self.assertEqual(data['cart']['item_count'], 43)
+
+        response = self.client.post(reverse('cart_item_remove', args=[item.id]))
+        self.assertIsNone(response.json()['item'])
+        self.assertEqual(response.json()['cart']['item_count'], 38)
+
+    def test_cart_line_json_checks_quantity_and_stock(self):
+        # A cookie cart line is addressed by product id, a stored one by item id
+        cookie_client = self.client_class()
+        cookie_client.post(reverse('add_to_cart', args=[self.products[6].id]))
+        self.client.force_login(self.user)
+        item = Cart.objects.get(user=self.user).items.get(product=self.products[0])
+        for client, item_id, product in (
+            (cookie_client, self.products[6].id, self.products[6]), (self.client, item.id, self.products[0]),
+        ):
+            url = reverse('cart_item_update', args=[item_id])
+            self.assertEqual(client.post(url, {'quantity': 100000}).status_code, 400)
+            # 50 in stock
+            response = client.post(url, {'quantity': 60})
+            self.assertEqual((response.status_code, response.json()['product_id']), (409, product.id))
+            self.assertEqual(client.post(url, {'quantity': 50}).json()['item']['quantity'], 50)
+
+    def test_cart_line_json_only_touches_own_cart(self):
+        other = Cart.objects.create(session_key='someone-else')
+        add_items(other, {self.products[0].id: 1})
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('cart_item_remove', args=[other.items.get().id]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(other.items.count(), 1)
+
+    def test_anonymous_cookie_cart_line_json(self):
+        product = self.products[3]
+        self.client.post(reverse('add_to_cart', args=[product.id]))
+        response = self.client.post(reverse('cart_item_update', args=[product.id]), {'quantity': 3})
+        self.assertEqual(response.json()['item']['subtotal'], str(product.price * 3))
+        self.assertEqual(response.json()['cart']['item_count'], 3)
+
+    def test_anonymous_cart_survives_checkout(self):
+        product = self.products[4]
+        self.client.get(reverse('add_to_cart', args=[product.id]))
+        # Checkout moves the cookie lines into a stored Cart and clears the cookie
+        self.assertEqual(self.client.get(reverse('checkout')).status_code, 200)
+        self.assertEqual(self.client.cookies['cart'].value, '')
+
+        response = self.client.get(reverse('cart'))
+        self.assertEqual([item.product for item in response.context['cart_items']], [product])
+        self.assertContains(response, '<span class="cart-badge">1</span>', html=True)
+        self.assertEqual(self.client.get(reverse('checkout')).status_code, 200)
+
+        self.client.get(reverse('add_to_cart', args=[self.products[5].id]))
+        self.assertEqual(Cart.objects.get(session_key=self.client.session.session_key).item_count, 2)
+
+    def test_resolve_cart_prefers_session_cart(self):
+        self.client.get(reverse('add_to_cart', args=[self.products[6].id]))
+        self.client.get(reverse('checkout'))
+        cart = Cart.objects.get(session_key=self.client.session.session_key)
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = self.client.session
+        # The cookie is gone, so only the session leads to the stored cart
+        self.assertEqual(resolve_cart(request), cart)
+        self.assertEqual(get_cart_summary(request).item_count, 1)
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+class CartMergeTests(TestCase):
+    """Signing in folds the anonymous cart, stored or in the cookie, into the user's cart"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Hats', slug='hats')
+        cls.a, cls.b, cls.c = [
+            Product.objects.create(name=f'Hat {n}', category=category, description='A hat', price=Decimal('5.00'), stock=20)
+            for n in range(3)
+        ]
+        cls.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret', is_staff=True)
+        add_items(Cart.objects.create(user=cls.user), {cls.a.id: 1, cls.c.id: 1})
+
+    def sign_in(self):
+        # The admin login view is the shop's only sign-in form; it runs the real user_logged_in path
+        self.client.post(reverse('admin:login'), {'username': 'buyer', 'password': 'secret'})
+
+    def user_lines(self):
+        return dict(Cart.objects.get(user=self.user).items.values_list('product_id', 'quantity'))
+
+    @override_settings(ANONYMOUS_CART_STORAGE='db')
+    def test_stored_cart_is_merged(self):
+        for product in (self.a, self.a, self.b):
+            self.client.get(reverse('add_to_cart', args=[product.id]))
+        anonymous = Cart.objects.get(user__isnull=True)
+        self.sign_in()
+        self.assertEqual(self.user_lines(), {self.a.id: 3, self.b.id: 1, self.c.id: 1})
+        self.assertEqual(Cart.objects.get(user=self.user).item_count, 5)
+        self.assertFalse(Cart.objects.filter(pk=anonymous.pk).exists())
+
+    @override_settings(ANONYMOUS_CART_STORAGE='cookie')
+    def test_cookie_cart_is_merged(self):
+        for product in (self.a, self.b):
+            self.client.get(reverse('add_to_cart', args=[product.id]))
+        self.sign_in()
+        self.assertEqual(self.user_lines(), {self.a.id: 2, self.b.id: 1, self.c.id: 1})
+        self.assertEqual(self.client.cookies['cart'].value, '')
+        self.assertEqual(Cart.objects.filter(user__isnull=True).count(), 0)
+
+
+class PurgeTests(TestCase):
+    """Expired sessions, finished jobs and stale carts are deleted in batches; live data is kept"""
+
+    def setUp(self):
+        now = timezone.now()
+        category = Category.objects.create(name='Socks', slug='socks')
+        self.product = Product.objects.create(name='Sock', category=category, description='A sock', price=Decimal('2.00'))
+        for n in range(5):
+            Session.objects.create(session_key=f'expired{n}', session_data='', expire_date=now - timedelta(hours=1))
+        Session.objects.create(session_key='live', session_data='', expire_date=now + timedelta(days=1))
+        self.user = User.objects.create_user('owner')
+
+        self.live = self.cart(session_key='live')
+        self.orphaned = self.cart(session_key='expired0')
+        self.idle = self.cart(session_key='live', idle_days=40)
+        self.user_cart = self.cart(user=self.user, idle_days=400)
+
+    def cart(self, idle_days=0, **owner):
+        cart = Cart.objects.create(**owner)
+        add_items(cart, {self.product.id: 2})
+        Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now() - timedelta(days=idle_days))
+        return cart
+
+    def test_purge_sessions_and_carts(self):
+        sessions = purge_expired_sessions(chunk_size=2, pause=0)
+        self.assertEqual((sessions.rows, sessions.batches), (5, 3))
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+
+        carts, items = purge_stale_carts(idle_days=30, chunk_size=2, pause=0)
+        self.assertEqual((carts.rows, items.rows), (2, 2))
+        self.assertEqual(set(Cart.objects.values_list('id', flat=True)), {self.live.id, self.user_cart.id})
+
+        carts, _ = purge_stale_carts(idle_days=30, user_idle_days=365, pause=0)
+        self.assertEqual(list(Cart.objects.values_list('id', flat=True)), [self.live.id])
+        self.assertEqual(CartItem.objects.count(), 1)
+
+    def test_purge_finished_jobs_keeps_dead_and_recent(self):
+        old = timezone.now() - timedelta(days=10)
+        for status, finished_at in (('done', old), ('done', timezone.now()), ('dead', old)):
+            Job.objects.create(kind='noop', status=status, run_at=old, finished_at=finished_at)
+        self.assertEqual(purge_finished_jobs(days=7, pause=0).rows, 1)
+        self.assertEqual(sorted(Job.objects.values_list('status', flat=True)), ['dead', 'done'])
+
+    def test_command_reports_rows_per_second(self):
+        out = StringIO()
+        call_command('purge_stale_carts', '--pause', '0', stdout=out)
+        self.assertIn('django_session: deleted 5 rows in 1 batches', out.getvalue())
+        self.assertIn('ecommerce_cart: deleted 2 rows', out.getvalue())
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+class PlaceOrderTests(TestCase):
+    """Orders are written as one unit and never take more stock than there is"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Hats', slug='hats')
+        cls.hat = Product.objects.create(
+            name='Hat', slug='hat', category=category, description='A hat', price=Decimal('15.00'), stock=3,
+        )
+        cls.scarf = Product.objects.create(
+            name='Scarf', slug='scarf', category=category, description='A scarf', price=Decimal('8.00'), stock=1,
+        )
+        cls.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret')
+
+    def checkout(self, payment_method='card', **headers):
+        return self.client.post(reverse('create_order'), json.dumps({
+            'payment_method': payment_method, 'payment_intent_id': 'pi_test', 'first_name': 'Ann', 'last_name': 'Buyer',
+            'email': 'ann@example.com', 'address': '1 Road', 'postal_code': '00100', 'city': 'Nairobi',
+        }), content_type='application/json', headers=headers)
+
+    def test_paid_order_takes_stock_and_empties_cart(self):
+        cart = Cart.objects.create(user=self.user)
+        add_items(cart, {self.hat.id: 2, self.scarf.id: 1})
+        self.client.force_login(self.user)
+        response = self.checkout()
+        self.assertEqual(response.json()['status'], 'paid')
+        order = Order.objects.get(pk=response.json()['order_id'])
+        self.assertEqual(order.total_amount, Decimal('38.00'))
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(Product.objects.get(pk=self.hat.pk).stock, 1)
+        self.assertEqual(Product.objects.get(pk=self.scarf.pk).stock, 0)
+        cart.refresh_from_db()
+        self.assertEqual((cart.items.count(), cart.item_count), (0, 0))
+
+    def test_catalog_cache_is_bumped_only_on_sell_out(self):
+        catalog_cache.reset_stats()
+        for product, bumps in ((self.hat, 0), (self.scarf, 1)):
+            cart = Cart.objects.create(user=self.user)
+            add_items(cart, {product.id: 1})
+            with self.captureOnCommitCallbacks(execute=True):
+                place_order(cart, self.user, {'status': 'paid'})
+            self.assertEqual(catalog_cache.get_stats()['bumps'], bumps)
+
+    def test_short_line_fails_whole_order(self):
+        cart = Cart.objects.create(user=self.user)
+        add_items(cart, {self.hat.id: 1, self.scarf.id: 2})
+        self.client.force_login(self.user)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['product_id'], self.scarf.id)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.hat.pk).stock, 3)
+        self.assertEqual(cart.items.count(), 2)
+
+    def mpesa_callback(self, order, result_code):
+        PaymentTransaction.objects.create(
+            order=order, payment_method='mpesa', transaction_id=f'ws_CO_{order.id}', amount=order.total_amount,
+            currency='KES', status='pending',
+        )
+        response = self.client.post(reverse('mpesa_callback'), json.dumps({'Body': {'stkCallback': {
+            'ResultCode': result_code, 'CheckoutRequestID': f'ws_CO_{order.id}',
+            'CallbackMetadata': {'Item': [{'Name': 'MpesaReceiptNumber', 'Value': 'QKX123'}]},
+        }}}), content_type='application/json')
+        # The callback only records the result; the worker updates the order and stock
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'processing')
+        with self.assertLogs('ecommerce.jobs'):
+            for job in jobs.claim('test-worker', 10):
+                self.assertEqual(jobs.run(job), 'done')
+        return response
+
+    def test_mpesa_order_holds_stock_until_callback(self):
+        cart = Cart.objects.create(user=self.user)
+        add_items(cart, {self.hat.id: 2})
+        self.client.force_login(self.user)
+        order = Order.objects.get(pk=self.checkout('mpesa').json()['order_id'])
+        self.assertEqual(available_stock([self.hat.id]), {self.hat.id: 1})
+        self.assertEqual(Product.objects.get(pk=self.hat.pk).stock, 3)
+
+        # The held units cannot be sold to anyone else meanwhile
+        other = Cart.objects.create(session_key='other-shopper')
+        add_items(other, {self.hat.id: 2})
+        with self.assertRaises(OutOfStock):
+            place_order(other, None, {'payment_method': 'card', 'status': 'paid'})
+
+        self.mpesa_callback(order, 0)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'paid')
+        self.assertEqual(Order.objects.get(pk=order.pk).mpesa_transaction_id, 'QKX123')
+        self.assertEqual(Product.objects.get(pk=self.hat.pk).stock, 1)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(cart.items.count(), 0)
+
+    def test_confirmed_payment_keeps_items_added_after_the_order(self):
+        cart = Cart.objects.create(user=self.user)
+        add_items(cart, {self.hat.id: 2})
+        self.client.force_login(self.user)
+        order = Order.objects.get(pk=self.checkout('mpesa').json()['order_id'])
+        add_items(cart, {self.hat.id: 1, self.scarf.id: 1})
+        self.mpesa_callback(order, 0)
+        self.assertEqual(dict(cart.items.values_list('product_id', 'quantity')), {self.hat.id: 1, self.scarf.id: 1})
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (2, Decimal('23.00')))
+
+    def test_confirmed_payment_empties_guest_cart(self):
+        self.client.get(reverse('add_to_cart', args=[self.hat.id]))
+        self.client.get(reverse('checkout'))
+        order = Order.objects.get(pk=self.checkout('mpesa').json()['order_id'])
+        self.assertIsNone(order.user)
+        self.mpesa_callback(order, 0)
+        self.assertEqual(self.client.get(reverse('cart')).context['cart_items'], [])
+        # Purging the cart leaves the order in place
+        Session.objects.all().delete()
+        carts, _ = purge_stale_carts(pause=0)
+        self.assertEqual(carts.rows, 1)
+        self.assertIsNone(Order.objects.get(pk=order.pk).cart)
+
+    def test_failed_mpesa_payment_releases_stock(self):
+        cart = Cart.objects.create(user=self.user)
+        add_items(cart, {self.hat.id: 3})
+        self.client.force_login(self.user)
+        order = Order.objects.get(pk=self.checkout('mpesa').json()['order_id'])
+        self.assertEqual(available_stock([self.hat.id]), {self.hat.id: 0})
+        self.mpesa_callback(order, 1032)
+        self.assertEqual(available_stock([self.hat.id]), {self.hat.id: 3})
+
+    def test_expired_reservations_stop_holding_stock(self):
+        cart = Cart.objects.create(user=self.user)
+        add_items(cart, {self.hat.id: 3})
+        self.client.force_login(self.user)
+        self.checkout('mpesa')
+        later = timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_SECONDS + 1)
+        self.assertEqual(available_stock([self.hat.id], now=later), {self.hat.id: 3})
+        self.assertEqual(release_expired(now=later), 1)
+
+    def test_retried_order_with_idempotency_key_is_replayed(self):
+        cart = Cart.objects.create(user=self.user)
+        add_items(cart, {self.hat.id: 1})
+        self.client.force_login(self.user)
+        first = self.checkout(idempotency_key='order-1')
+        add_items(cart, {self.hat.id: 1})  # a retry must not order what the cart holds now
+        with self.assertNumQueries(3):  # session, user, stored response
+            retry = self.checkout(idempotency_key='order-1')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(pk=self.hat.pk).stock, 2)
+
+        reused = self.checkout('mpesa', idempotency_key='order-1')
+        self.assertEqual(reused.status_code, 422)
+
+
+    def test_mpesa_resubmit_reuses_the_page_key(self):
+        cart = Cart.objects.create(user=self.user)
+        add_items(cart, {self.hat.id: 1})
+        self.client.force_login(self.user)
+        page = self.client.get(reverse('checkout'))
+        key = page.context['order_idempotency_key']
+        self.assertContains(page, f"'Idempotency-Key': 'mpesa-order-{key}'")
+        self.assertNotEqual(self.client.get(reverse('checkout')).context['order_idempotency_key'], key)
+        first = self.checkout('mpesa', idempotency_key=f'mpesa-order-{key}')
+        retry = self.checkout('mpesa', idempotency_key=f'mpesa-order-{key}')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Order.objects.count(), 1)
+
+class JobQueueTests(TestCase):
+    """Failed jobs are retried with backoff and dead-lettered when they keep failing"""
+
+    def setUp(self):
+        self.calls = []
+        jobs.TASKS['flaky'] = self.flaky
+        self.addCleanup(jobs.TASKS.pop, 'flaky')
+
+    def flaky(self, fail_times):
+        self.calls.append(fail_times)
+        if len(self.calls) <= fail_times:
+            raise RuntimeError('gateway timeout')
+
+    def run_ready(self, now):
+        Job.objects.filter(status='queued').update(run_at=now)
+        claimed = jobs.claim('test-worker', 10)
+        if not claimed:
+            return []
+        with self.assertLogs('ecommerce.jobs'):
+            return [jobs.run(job) for job in claimed]
+
+    def test_retry_then_succeed(self):
+        job = jobs.enqueue('flaky', {'fail_times': 1})
+        self.assertEqual(self.run_ready(timezone.now()), ['queued'])
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('gateway timeout', job.last_error)
+        self.assertEqual(jobs.claim('test-worker'), [])  # backing off
+        self.assertEqual(self.run_ready(timezone.now()), ['done'])
+        self.assertEqual(jobs.queue_stats()['done'], 1)
+
+    def test_dead_letter_after_max_attempts(self):
+        job = jobs.enqueue('flaky', {'fail_times': 99}, max_attempts=3)
+        outcomes = [self.run_ready(timezone.now()) for _ in range(4)]
+        self.assertEqual(outcomes, [['queued'], ['queued'], ['dead'], []])
+        self.assertEqual(jobs.queue_stats()['dead'], 1)
+        self.assertEqual(jobs.retry_dead([job.pk]), 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'queued')
+
+    def test_claimed_jobs_are_not_claimed_twice(self):
+        for _ in range(3):
+            jobs.enqueue('flaky', {'fail_times': 0})
+        first = jobs.claim('worker-a', 2)
+        second = jobs.claim('worker-b', 2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({job.pk for job in first} & {job.pk for job in second})
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=0, ORDER_HISTORY_PAGE_SIZE=5)
+class OrderHistoryTests(TestCase):
+    """Order pages cost a fixed number of queries however many orders and items a customer has"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Bags', slug='bags')
+        products = [
+            Product.objects.create(
+                name=f'Bag {n}', slug=f'bag-{n}', category=category, description='A bag',
+                price=Decimal('20.00'), stock=1000,
+            )
+            for n in range(4)
+        ]
+        cls.user = User.objects.create_user('regular', 'regular@example.com', 'secret')
+        cart = Cart.objects.create(user=cls.user)
+        for _ in range(12):
+            add_items(cart, {product.id: 2 for product in products})
+            cls.order = place_order(cart, cls.user, {'payment_method': 'card', 'status': 'paid'})
+
+    def test_order_history_pages(self):
+        self.client.force_login(self.user)
+        # session, user, one page of orders, header cart badge
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('order_history'))
+        page = response.context['page']
+        self.assertEqual(len(page), 5)
+        self.assertEqual((page.items[0].item_count, page.items[0].first_item_name), (8, 'Bag 0'))
+
+        seen = [order.id for order in page]
+        while page.has_next:
+            page = self.client.get(page.next_url).context['page']
+            seen += [order.id for order in page]
+        self.assertEqual(seen, list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_order_detail_prefetches_items(self):
+        self.client.force_login(self.user)
+        # session, user, updated_at for the ETag, order, items, products, header cart badge
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('order_detail', args=[self.order.id]))
+        self.assertContains(response, 'Bag 3')
+
+    def test_admin_status_change_refreshes_validators(self):
+        self.client.force_login(self.user)
+        url = reverse('order_detail', args=[self.order.id])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        order_admin = OrderAdmin(Order, admin.site)
+        with mock.patch.object(order_admin, 'message_user'):
+            order_admin.mark_as_shipped(None, Order.objects.filter(pk=self.order.pk))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Shipped')
+
+
+class LoadTestTests(TestCase):
+    def test_flows_complete_and_clean_up(self):
+        with self.assertLogs('ecommerce.jobs'):
+            results = run_load_test(shoppers=3, concurrency=1, products=3)
+        self.assertEqual(results['errors'], 0)
+        self.assertEqual(results['completed_flows'], 3)
+        self.assertEqual({step: results['steps'][step]['count'] for step in STEPS}, dict.fromkeys(STEPS, 3))
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(Job.objects.exists())
+
+
+class SeedDataTests(TestCase):
+    def seed_snapshot(self):
+        with transaction.atomic():
+            results = seed(users=5, products=30, orders=20, carts=8, seed=3, chunk_size=7)
+            snapshot = (
+                list(Product.objects.order_by('id').values_list('name', 'slug', 'price', 'stock')),
+                list(Order.objects.order_by('id').values_list('user_id', 'total_amount', 'item_count', 'first_item_name')),
+                list(Cart.objects.order_by('id').values_list('user_id', 'session_key', 'item_count', 'subtotal')),
+            )
+            transaction.set_rollback(True)
+        return results, snapshot
+
+    def test_same_seed_same_data(self):
+        results, snapshot = self.seed_snapshot()
+        self.assertEqual(
+            {stats.table: stats.rows for stats in results if 'items' not in stats.table},
+            {'users': 5, 'products': 30, 'orders': 20, 'carts': 8},
+        )
+        self.assertEqual(self.seed_snapshot()[1], snapshot)
+
+    def test_counters_and_slugs_stay_consistent(self):
+        seed(users=5, products=30, orders=20, carts=8, seed=3, chunk_size=7)
+        seed(products=30, seed=3, chunk_size=7)
+        self.assertEqual(counters.reconcile(), [])
+        self.assertEqual(counters.reconcile_carts(), 0)
+        self.assertEqual(Product.objects.values('slug').distinct().count(), 60)
+        order = Order.objects.prefetch_related('items').first()
+        self.assertEqual(order.item_count, sum(item.quantity for item in order.items.all()))
+
+
+class OAuthTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        oauth_tokens._local.clear()
+        self.fetches = 0
+
+    def fetch(self, delay=0):
+        def fetch():
+            self.fetches += 1
+            time.sleep(delay)
+            return f'token-{self.fetches}', '3599'
+        return fetch
+
+    def test_services_share_one_token(self):
+        token_response = mock.Mock(status_code=200, json=lambda: {'access_token': 'abc', 'expires_in': '3599'})
+        push_response = mock.Mock(status_code=200, json=lambda: {'ResponseCode': '0'})
+        with mock.patch('ecommerce.mpesa_service.requests') as requests:
+            requests.get.return_value = token_response
+            requests.post.return_value = push_response
+            for _ in range(3):
+                MPesaService().stk_push('0712345678', 10, 'Order 1', 'Payment')
+        self.assertEqual(requests.get.call_count, 1)
+        self.assertEqual(requests.post.call_args.kwargs['headers']['Authorization'], 'Bearer abc')
+
+    def test_concurrent_callers_refresh_once(self):
+        tokens = []
+        fetch = self.fetch(delay=0.2)
+        threads = [
+            threading.Thread(target=lambda: tokens.append(oauth_tokens.get_token('oauth:test', fetch)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual(tokens, ['token-1'] * 8)
+
+    def test_refreshes_ahead_of_expiry(self):
+        now = time.time()
+        cache.set('oauth:test', {'token': 'old', 'expires_at': now + 60, 'refresh_at': now - 1})
+        # While another worker holds the refresh, the old token is still served
+        cache.add('oauth:test:refresh', 'other worker')
+        self.assertEqual(oauth_tokens.get_token('oauth:test', self.fetch()), 'old')
+        cache.delete('oauth:test:refresh')
+        self.assertEqual(oauth_tokens.get_token('oauth:test', self.fetch()), 'token-1')
+        self.assertEqual(oauth_tokens.get_token('oauth:test', self.fetch()), 'token-1')
+        self.assertEqual(self.fetches, 1)
+
+        oauth_tokens.invalidate('oauth:test')
+        self.assertEqual(oauth_tokens.get_token('oauth:test', self.fetch()), 'token-2')
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=0, CATALOG_PAGE_SIZE=2)
+class CursorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Bags')
+        for n in range(3):
+            Product.objects.create(category=category, name=f'Bag {n}', description='Canvas bag', price=Decimal('10.00'))
+
+    def test_valid_cursor_pages(self):
+        page = self.client.get(reverse('product_list')).context['page']
+        response = self.client.get(page.next_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page']), 1)
+
+    def test_tampered_cursor_is_not_found(self):
+        newest = Product.objects.first()
+        for url, values in (
+            (reverse('product_list'), ['yesterday', newest.id]),
+            (reverse('product_list'), [str(newest.created_at), 'abc']),
+            (reverse('product_list'), [str(newest.created_at), None]),
+            (reverse('product_feed'), [str(newest.created_at), 2 ** 70]),
+            (reverse('product_list') + '?q=bag', ['first', newest.id]),
+        ):
+            separator = '&' if '?' in url else '?'
+            response = self.client.get(f'{url}{separator}cursor={encode_cursor(values, "next")}')
+            self.assertEqual(response.status_code, 404, values)
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+class CatalogCacheTests(TestCase):
+    """Catalog pages are cached behind a version, and their validators expire with the cached data"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Lamps', slug='lamps')
+        cls.lamp = Product.objects.create(
+            name='Lamp', slug='lamp', category=cls.category, description='A lamp', price=Decimal('30.00'), stock=5,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def expire(self, name, *parts):
+        cache.delete(catalog_cache.make_key(name, *parts))
+
+    def test_etag_changes_once_the_cached_modification_time_expires(self):
+        url = reverse('product_detail', args=['lamp'])
+        etag = self.client.get(url)['ETag']
+        Product.objects.filter(pk=self.lamp.pk).update(stock=3, updated_at=timezone.now())
+        # Within CATALOG_CACHE_TIMEOUT the cached page is still the one the client has
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.expire('last_modified')
+        self.expire('product_detail', 'lamp')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '3 units available')
+
+    def test_partial_sale_keeps_the_cache_until_it_expires(self):
+        url = reverse('product_detail', args=['lamp'])
+        catalog_cache.reset_stats()
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            take_stock([(self.lamp.id, 2)])
+        self.assertEqual(catalog_cache.get_stats()['bumps'], 0)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.expire('last_modified')
+        self.expire('product_detail', 'lamp')
+        self.assertContains(self.client.get(url, HTTP_IF_NONE_MATCH=etag), '3 units available')
+
+
+    def test_catalog_writes_bump_the_version(self):
+        version = catalog_cache.get_version()
+        for write in (
+            lambda: self.lamp.save(),
+            lambda: self.category.save(),
+            lambda: Product.objects.create(name='Shade', category=self.category, description='A shade', price=1).delete(),
+        ):
+            write()
+            self.assertGreater(catalog_cache.get_version(), version)
+            version = catalog_cache.get_version()
+
+    def test_read_through_counts_hits_and_misses(self):
+        catalog_cache.reset_stats()
+        builds = []
+        build = lambda: builds.append(1) or len(builds)
+        self.assertEqual(catalog_cache.read_through('probe', build, 'a'), 1)
+        self.assertEqual(catalog_cache.read_through('probe', build, 'a'), 1)
+        catalog_cache.bump_version()
+        self.assertEqual(catalog_cache.read_through('probe', build, 'a'), 2)
+        stats = catalog_cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['bumps']), (1, 2, 1))
+
+        # A repeated page view is served from the cache without catalog queries
+        self.client.get(reverse('product_list'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('product_list')).status_code, 200)
+
+    def test_cards_come_from_one_get_many(self):
+        Product.objects.create(name='Shade', category=self.category, description='A shade', price=1, stock=2)
+        with mock.patch.object(catalog_tags, 'render_to_string', wraps=catalog_tags.render_to_string) as render:
+            self.client.get(reverse('home'))
+            self.assertEqual(render.call_count, 2)
+            with mock.patch.object(catalog_tags.cache, 'get_many', wraps=catalog_tags.cache.get_many) as get_many:
+                self.client.get(reverse('home'))
+            self.assertEqual((render.call_count, get_many.call_count), (2, 1))
+
+            # An edited product has a new updated_at, so only its card is rendered again
+            Product.objects.filter(pk=self.lamp.pk).update(updated_at=timezone.now())
+            self.expire('home', '')
+            self.client.get(reverse('home'))
+            self.assertEqual(render.call_count, 3)
+
+    def test_cached_cards_get_each_visitor_their_csrf_token(self):
+        for _ in range(2):
+            client = Client(enforce_csrf_checks=True)
+            response = client.get(reverse('home'))
+            self.assertNotContains(response, catalog_tags.CSRF_PLACEHOLDER)
+            token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()).group(1)
+            add = client.post(reverse('add_to_cart', args=[self.lamp.id]), {'csrfmiddlewaretoken': token})
+            self.assertEqual(add.status_code, 302)
+
+class FacetCountTests(TestCase):
+    """The single grouped query gives the same disjunctive counts as one COUNT per facet value"""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(8)
+        cls.categories = [Category.objects.create(name=f'Cat {n}', slug=f'cat-{n}') for n in range(3)]
+        prices = [Decimal('5'), Decimal('25'), Decimal('49.99'), Decimal('99'), Decimal('250'), Decimal('600')]
+        for n in range(60):
+            Product.objects.create(
+                name=f'Item {n}', category=rng.choice(cls.categories), description='An item',
+                price=rng.choice(prices), stock=rng.choice([0, 0, 3]), available=n % 7 != 0,
+            )
+
+    def naive_counts(self, selection):
+        products = Product.objects.filter(available=True)
+        filters = {
+            'category': Q(category_id__in=selection.category_ids) if selection.category_ids else Q(),
+            'price': Q(),
+            'in_stock': Q(stock__gt=0) if selection.in_stock else Q(),
+        }
+        for key, _, low, high in PRICE_RANGES:
+            if key in selection.price_ranges:
+                filters['price'] |= price_q(low, high)
+
+        def count(skip, extra):
+            return products.filter(extra, *[q for name, q in filters.items() if name != skip]).count()
+
+        return {
+            'categories': [count('category', Q(category=category)) for category in self.categories],
+            'price': [count('price', price_q(low, high)) for _, _, low, high in PRICE_RANGES],
+            'in_stock': count('in_stock', Q(stock__gt=0)),
+            'total': count(None, Q()),
+        }
+
+    def test_counts_match_per_facet_counts(self):
+        first, second = self.categories[0].id, self.categories[1].id
+        for selection in (
+            FacetSelection(),
+            FacetSelection(category_ids=[first]),
+            FacetSelection(category_ids=[first, second], price_ranges=['0-25', '250+']),
+            FacetSelection(price_ranges=['25-50'], in_stock=True),
+            FacetSelection(category_ids=[second], price_ranges=['50-100', '100-250'], in_stock=True),
+        ):
+            engine = FacetEngine(selection, self.categories)
+            with self.assertNumQueries(1):
+                facets, total = engine.counts(Product.objects.filter(available=True))
+            self.assertEqual({
+                'categories': [facet['count'] for facet in facets['categories']],
+                'price': [facet['count'] for facet in facets['price']],
+                'in_stock': facets['in_stock']['count'],
+                'total': total,
+            }, self.naive_counts(selection), selection)
+            self.assertEqual(engine.apply(Product.objects.filter(available=True)).count(), total)
+
+
+class CategoryCounterTests(TestCase):
+    """Category.available_product_count follows every way a product can be saved or deleted"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.shirts = Category.objects.create(name='Shirts', slug='shirts')
+        cls.coats = Category.objects.create(name='Coats', slug='coats')
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+
+    def product(self, name, category=None, **fields):
+        return Product.objects.create(
+            name=name, category=category or self.shirts, description=name, price=Decimal('12.00'), **fields,
+        )
+
+    def assertCounts(self, shirts, coats):
+        self.assertEqual(
+            list(Category.objects.filter(pk__in=[self.shirts.pk, self.coats.pk]).order_by('name')
+                 .values_list('available_product_count', flat=True)),
+            [coats, shirts],
+        )
+
+    def test_create_toggle_move_and_delete(self):
+        shirt = self.product('Shirt')
+        self.product('Hidden shirt', available=False)
+        self.assertCounts(1, 0)
+
+        shirt.available = False
+        shirt.save()
+        self.assertCounts(0, 0)
+        shirt.available = True
+        shirt.category = self.coats
+        shirt.save()
+        self.assertCounts(0, 1)
+        # Saving again without a change must not count the product twice
+        shirt.save()
+        self.assertCounts(0, 1)
+
+        shirt.delete()
+        Product.objects.get(name='Hidden shirt').delete()
+        self.assertCounts(0, 0)
+        self.assertEqual(counters.reconcile(), [])
+
+    def test_saves_with_deferred_fields(self):
+        shirt = self.product('Shirt')
+        Product.objects.only('name').get(pk=shirt.pk).save()
+        self.assertCounts(1, 0)
+
+        moved = Product.objects.defer('category', 'available').get(pk=shirt.pk)
+        moved.category = self.coats
+        moved.save()
+        self.assertCounts(0, 1)
+        hidden = Product.objects.only('id').get(pk=shirt.pk)
+        hidden.available = False
+        hidden.save(update_fields=['available'])
+        self.assertCounts(0, 0)
+        Product.objects.only('id').get(pk=shirt.pk).delete()
+        self.assertCounts(0, 0)
+        self.assertEqual(counters.reconcile(), [])
+
+    def test_admin_list_editable_toggle(self):
+        shirts = [self.product(f'Shirt {n}', stock=4) for n in range(3)]
+        self.client.force_login(self.admin_user)
+        data = {
+            'form-TOTAL_FORMS': '3', 'form-INITIAL_FORMS': '3', 'form-MIN_NUM_FORMS': '0',
+            'form-MAX_NUM_FORMS': '1000', '_save': 'Save',
+        }
+        for n, shirt in enumerate(shirts):
+            data.update({f'form-{n}-id': shirt.pk, f'form-{n}-price': '12.00', f'form-{n}-stock': '4'})
+            if n == 0:
+                data[f'form-{n}-available'] = 'on'
+        response = self.client.post(reverse('admin:ecommerce_product_changelist'), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertCounts(1, 0)
+        self.assertEqual(counters.reconcile(), [])
+
+
+class CartSummaryTests(TestCase):
+    """Cart.item_count and subtotal follow every change to its items and their prices"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Mugs', slug='mugs')
+        cls.mug = Product.objects.create(name='Mug', category=category, description='A mug', price=Decimal('4.00'), stock=9)
+        cls.jug = Product.objects.create(name='Jug', category=category, description='A jug', price=Decimal('10.00'), stock=9)
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+
+    def setUp(self):
+        self.cart = Cart.objects.create(session_key='mugs')
+
+    def assertSummary(self, item_count, subtotal):
+        self.cart.refresh_from_db()
+        self.assertEqual((self.cart.item_count, self.cart.subtotal), (item_count, Decimal(subtotal)))
+
+    def test_item_changes(self):
+        line = CartItem.objects.create(cart=self.cart, product=self.mug, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.jug)
+        self.assertSummary(3, '18.00')
+        line.quantity = 5
+        line.save()
+        line.save()
+        self.assertSummary(6, '30.00')
+
+        deferred = CartItem.objects.only('id').get(pk=line.pk)
+        deferred.quantity = 1
+        deferred.save()
+        self.assertSummary(2, '14.00')
+        CartItem.objects.only('id').get(pk=line.pk).delete()
+        self.assertSummary(1, '10.00')
+        self.assertEqual(counters.reconcile_carts(), 0)
+
+    def test_reprice(self):
+        add_items(self.cart, {self.mug.id: 2, self.jug.id: 1})
+        mug = Product.objects.get(pk=self.mug.pk)
+        mug.price = Decimal('5.00')
+        mug.save()
+        self.assertSummary(3, '20.00')
+        # A save that does not load the price reprices too
+        jug = Product.objects.only('name').get(pk=self.jug.pk)
+        jug.price = Decimal('11.00')
+        jug.save()
+        self.assertSummary(3, '21.00')
+
+    def test_admin_list_editable_reprice(self):
+        add_items(self.cart, {self.mug.id: 2})
+        self.client.force_login(self.admin_user)
+        response = self.client.post(reverse('admin:ecommerce_product_changelist'), {
+            'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '1', 'form-MIN_NUM_FORMS': '0', 'form-MAX_NUM_FORMS': '1000',
+            'form-0-id': self.mug.pk, 'form-0-price': '6.50', 'form-0-stock': '9', 'form-0-available': 'on',
+            '_save': 'Save',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertSummary(2, '13.00')
+
+    def test_cart_save_keeps_the_stored_summary(self):
+        stale = Cart.objects.get(pk=self.cart.pk)
+        add_items(self.cart, {self.jug.id: 2})
+        stale.session_key = 'renamed'
+        stale.save()
+        self.assertSummary(2, '20.00')
+        self.assertEqual(self.cart.session_key, 'renamed')
+
+
+class SearchTests(TestCase):
+    """The index ranks, prefix matches and follows product and category changes"""
+    backend = 'fts5'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kitchen = Category.objects.create(name='Kitchen', slug='kitchen')
+        garden = Category.objects.create(name='Garden', slug='garden')
+        for name, category, description in (
+            ('Red Kettle', cls.kitchen, 'Boils water fast'),
+            ('Teapot', cls.kitchen, 'Pairs well with a kettle'),
+            ('Watering Can', garden, 'Holds five litres of water'),
+        ):
+            Product.objects.create(name=name, category=category, description=description, price=Decimal('9.00'))
+
+    def setUp(self):
+        self.enterContext(override_settings(PRODUCT_SEARCH_BACKEND=self.backend))
+        search.rebuild_index()
+
+    def search(self, query):
+        return list(search.search_products(Product.objects.all(), query).values_list('name', flat=True))
+
+    def test_ranking_prefixes_and_category_names(self):
+        self.assertEqual(self.search('kettle'), ['Red Kettle', 'Teapot'])
+        self.assertEqual(self.search('KETT'), ['Red Kettle', 'Teapot'])
+        self.assertEqual(self.search('red kett'), ['Red Kettle'])
+        self.assertEqual(self.search('wat'), ['Watering Can', 'Red Kettle'])
+        self.assertEqual(sorted(self.search('kitchen')), ['Red Kettle', 'Teapot'])
+        self.assertEqual(self.search('toaster'), [])
+
+    def test_index_follows_saves_renames_and_deletes(self):
+        product = Product.objects.get(name='Teapot')
+        product.name = 'Samovar'
+        product.save()
+        self.assertEqual(self.search('samovar'), ['Samovar'])
+        self.assertEqual(self.search('teapot'), [])
+
+        self.kitchen.name = 'Scullery'
+        self.kitchen.save()
+        self.assertEqual(sorted(self.search('scullery')), ['Red Kettle', 'Samovar'])
+
+        product.delete()
+        self.assertEqual(self.search('samovar'), [])
+        self.assertEqual(self.search('kettle'), ['Red Kettle'])
+
+
+class TermSearchTests(SearchTests):
+    """The portable index behind PRODUCT_SEARCH_BACKEND='terms' behaves the same"""
+    backend = 'terms'
+
+    def test_terms_backend_is_used(self):
+        self.assertIsInstance(search.get_backend(), search.TermSearchBackend)
+        self.assertTrue(ProductSearchTerm.objects.filter(term='kettle').exists())
+
+
+class RelatedProductsTests(TestCase):
+    """Co-purchase neighbours are written in chunks and skip unavailable products"""
+
+    def test_neighbours_skip_unavailable_products(self):
+        category = Category.objects.create(name='Pens', slug='pens')
+        pens = [
+            Product.objects.create(name=f'Pen {n}', category=category, description='A pen', price=Decimal('1.00'))
+            for n in range(4)
+        ]
+        for basket in ([0, 1, 2], [0, 1], [0, 3]):
+            order = Order.objects.create(total_amount=1, status='paid', paid_at=timezone.now())
+            OrderItem.objects.bulk_create([OrderItem(order=order, product=pens[n], price=1) for n in basket])
+        Product.objects.filter(pk=pens[2].pk).update(available=False)
+
+        with mock.patch.object(recommendations, '_write_neighbours', partial(recommendations._write_neighbours, chunk_size=1)):
+            recommendations.build_related_products(top_n=2, full=True)
+        self.assertEqual(
+            list(RelatedProduct.objects.filter(product=pens[0]).order_by('rank').values_list('related_id', 'source')),
+            [(pens[1].id, 'copurchase'), (pens[3].id, 'copurchase')],
+        )
+        self.assertNotIn(pens[2].id, RelatedProduct.objects.values_list('related_id', flat=True))
@@ -4,12 +4,16 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('products/', views.product_list, name='product_list'),
+    path('products/feed/', views.product_feed, name='product_feed'),
     path('product/<slug:slug>/', views.product_detail, name='product_detail'),
     path('category/<slug:slug>/', views.category_detail, name='category_detail'),
     path('cart/', views.cart_view, name='cart'),
     path('add-to-cart/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('update-cart/<int:item_id>/', views.update_cart, name='update_cart'),
     path('remove-from-cart/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('cart/items/', views.cart_items_bulk, name='cart_items_bulk'),
+    path('cart/items/<int:item_id>/', views.cart_item_update, name='cart_item_update'),
+    path('cart/items/<int:item_id>/remove/', views.cart_item_remove, name='cart_item_remove'),
     path('checkout/', views.checkout, name='checkout'),
     # Checkout and order
     path('checkout/', views.checkout, name='checkout'),
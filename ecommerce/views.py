@@ -1,88 +1,189 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
-from .models import Product, Category, Cart, CartItem, Order, OrderItem
+from django.views.decorators.http import require_http_methods
+from . import catalog_cache, counters
+from .cart import CookieCart, add_items, cookie_mode, resolve_cart
+from .facets import FacetEngine, FacetSelection
+from .conditional import catalog_conditional, order_conditional, order_success_conditional
+from .models import Product, Category, CartItem, Order
+from .recommendations import get_related_products
+from .reservations import held_quantity
+from .pagination import InvalidCursor, KeysetPaginator, get_page_size
+from .search import search_products
 import json
-from django.db import models
-from django.db.models import Q
+from django.db.models import F
+
+CATALOG_ORDERING = ('-created_at', '-id')
+SEARCH_ORDERING = ('search_rank', 'id')
 
 
+def paginate_products(request, products, ordering=CATALOG_ORDERING, page_size=None):
+    """Return one keyset page of products for the request's ?cursor="""
+    paginator = KeysetPaginator(
+        products.select_related('category'),
+        ordering=ordering,
+        page_size=page_size or get_page_size(request),
+    )
+    try:
+        return paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404('Invalid page cursor')
+
+
+def catalog_cache_params(request):
+    """The request parameters that select a catalog page, used in cache keys"""
+    return (
+        tuple(sorted(request.GET.getlist('category'))),
+        tuple(sorted(request.GET.getlist('price'))),
+        request.GET.get('in_stock', ''),
+        request.GET.get('q', '').strip(),
+        request.GET.get('cursor', ''),
+        get_page_size(request),
+    )
+
+
+def filter_catalog(request, products, categories):
+    """
+    Apply the ?q= search to products and parse the facet filters
+    (?category=, ?price=, ?in_stock=). Returns the facet engine, the
+    searched (not yet facet-filtered) products and the page ordering.
+    """
+    engine = FacetEngine(FacetSelection.from_request(request, categories), categories)
+    query = request.GET.get('q', '').strip()
+    if query:
+        return engine, search_products(products, query), query, SEARCH_ORDERING
+    return engine, products, query, CATALOG_ORDERING
+
+
+def product_payload(product):
+    """JSON representation of a product card"""
+    return {
+        'id': product.id,
+        'name': product.name,
+        'slug': product.slug,
+        'url': reverse('product_detail', args=[product.slug]),
+        'price': str(product.price),
+        'stock': product.stock,
+        'category': product.category.name,
+        'image': product.image.url if product.image else None,
+    }
+
+
+@catalog_conditional
 def home(request):
     """Home page with featured products"""
-    products = Product.objects.filter(available=True)[:8]
-    categories = Category.objects.all()
-    context = {
-        'products': products,
-        'categories': categories,
-    }
+    def build():
+        return {
+            'page': paginate_products(request, Product.objects.filter(available=True), page_size=8),
+            'categories': list(Category.objects.all()),
+        }
+    
+    context = catalog_cache.read_through('home', build, request.GET.get('cursor', ''))
+    context['page'].build_urls(request)
+    context['products'] = context['page'].items
     return render(request, 'home.html', context)
 
 
+@catalog_conditional
 def product_list(request):
-    """List all products"""
-    products = Product.objects.filter(available=True)
-    categories = Category.objects.all()
-    
-    category_slug = request.GET.get('category')
-    if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category=category)
+    """List all products with search and faceted filters"""
+    def build():
+        categories = list(Category.objects.all())
+        engine, products, query, ordering = filter_catalog(
+            request, Product.objects.filter(available=True), categories
+        )
+        # Every facet count and the filtered total come from one aggregate query
+        facets, total_count = engine.counts(products)
+        
+        return {
+            'page': paginate_products(request, engine.apply(products), ordering),
+            'total_count': total_count,
+            'catalog_total': counters.catalog_total(categories),
+            'categories': categories,
+            'facets': facets,
+            'filters_active': engine.selection.active,
+            'query': query,
+        }
     
-    context = {
-        'products': products,
-        'categories': categories,
-    }
+    context = catalog_cache.read_through('product_list', build, *catalog_cache_params(request))
+    context['page'].build_urls(request)
+    context['products'] = context['page'].items
     return render(request, 'product_list.html', context)
 
 
+@catalog_conditional
+def product_feed(request):
+    """JSON product pages for infinite scroll (accepts the same filters as product_list)"""
+    def build():
+        engine, products, query, ordering = filter_catalog(
+            request, Product.objects.filter(available=True), list(Category.objects.all())
+        )
+        page = paginate_products(request, engine.apply(products), ordering)
+        return {
+            'products': [product_payload(product) for product in page.items],
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor,
+            'page_size': page.page_size,
+        }
+    
+    return JsonResponse(catalog_cache.read_through('product_feed', build, *catalog_cache_params(request)))
+
+
+@catalog_conditional
 def product_detail(request, slug):
     """Product detail page"""
-    product = get_object_or_404(Product, slug=slug, available=True)
-    related_products = Product.objects.filter(
-        category=product.category, 
-        available=True
-    ).exclude(id=product.id)[:4]
+    def build():
+        product = get_object_or_404(Product.objects.select_related('category'), slug=slug, available=True)
+        related_products = get_related_products(product, limit=4)
+        if not related_products:
+            # Product added since the last build_related_products run
+            related_products = list(Product.objects.filter(
+                category=product.category, 
+                available=True
+            ).exclude(id=product.id)[:4])
+        return {
+            'product': product,
+            'related_products': related_products,
+        }
     
-    context = {
-        'product': product,
-        'related_products': related_products,
-    }
+    context = catalog_cache.read_through('product_detail', build, slug)
     return render(request, 'product_detail.html', context)
 
 
+@catalog_conditional
 def category_detail(request, slug):
     """Category page with products"""
-    category = get_object_or_404(Category, slug=slug)
-    products = Product.objects.filter(category=category, available=True)
+    def build():
+        category = get_object_or_404(Category, slug=slug)
+        products = Product.objects.filter(category=category, available=True)
+        return {
+            'category': category,
+            'page': paginate_products(request, products),
+            'total_count': category.available_product_count,
+        }
     
-    context = {
-        'category': category,
-        'products': products,
-    }
+    context = catalog_cache.read_through('category_detail', build, slug, *catalog_cache_params(request)[2:])
+    context['page'].build_urls(request)
+    context['products'] = context['page'].items
     return render(request, 'category_detail.html', context)
 
 
 def get_or_create_cart(request):
     """Get or create cart for user or session"""
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-    else:
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-        cart, created = Cart.objects.get_or_create(session_key=session_key)
-    return cart
+    return resolve_cart(request, create=True)
 
 
 def cart_view(request):
     """View cart"""
-    cart = get_or_create_cart(request)
+    cart = request.cart
     context = {
         'cart': cart,
-        'cart_items': cart.items.all(),
+        'cart_items': cart.get_items(),
     }
     return render(request, 'cart.html', context)
 
@@ -90,16 +191,14 @@ def cart_view(request):
 def add_to_cart(request, product_id):
     """Add product to cart"""
     product = get_object_or_404(Product, id=product_id)
-    cart = get_or_create_cart(request)
-    
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        product=product
-    )
-    
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
+    cart = request.cart
+
+    if isinstance(cart, CookieCart):
+        if not cart.add(product):
+            messages.warning(request, 'Your cart is full. Please check out or sign in to add more items.')
+            return redirect('cart')
+    else:
+        add_items(cart, {product.id: 1})
     
     messages.success(request, f'{product.name} added to cart!')
     return redirect('cart')
@@ -107,7 +206,17 @@ def add_to_cart(request, product_id):
 
 def update_cart(request, item_id):
     """Update cart item quantity"""
-    if request.method == 'POST':
+    if request.method == 'POST' and cookie_mode(request):
+        # Cookie cart items are identified by their product id
+        quantity = int(request.POST.get('quantity', 1))
+        cart = CookieCart.for_request(request)
+        if quantity > 0:
+            cart.update(item_id, quantity)
+            messages.success(request, 'Cart updated!')
+        else:
+            cart.remove(item_id)
+            messages.success(request, 'Item removed from cart!')
+    elif request.method == 'POST':
         cart_item = get_object_or_404(CartItem, id=item_id)
         quantity = int(request.POST.get('quantity', 1))
         
@@ -124,26 +233,169 @@ def update_cart(request, item_id):
 
 def remove_from_cart(request, item_id):
     """Remove item from cart"""
-    cart_item = get_object_or_404(CartItem, id=item_id)
-    cart_item.delete()
+    if cookie_mode(request):
+        CookieCart.for_request(request).remove(item_id)
+    else:
+        cart_item = get_object_or_404(CartItem, id=item_id)
+        cart_item.delete()
     messages.success(request, 'Item removed from cart!')
     return redirect('cart')
 
 
+def _check_cart_lines(cart, quantities, replace=False):
+    """
+    Check what {product id: quantity} would leave in the cart's lines, added
+    to them or replacing them. Returns (over_cap, rejected): whether a line
+    would go over CART_MAX_QUANTITY, and the products whose line would go
+    over the stock not held for other orders or that are unavailable.
+    Lines being removed are never rejected.
+    """
+    if isinstance(cart, CookieCart):
+        held = cart.lines
+    else:
+        held = dict(CartItem.objects.filter(cart=cart, product_id__in=list(quantities)).values_list('product_id', 'quantity'))
+    totals = {
+        product_id: quantity if replace else quantity + held.get(product_id, 0)
+        for product_id, quantity in quantities.items()
+    }
+    if any(total > settings.CART_MAX_QUANTITY for total in totals.values()):
+        return True, []
+    free = dict(
+        Product.objects.filter(id__in=list(quantities), available=True)
+        .annotate(free=F('stock') - held_quantity()).values_list('id', 'free')
+    )
+    return False, sorted(product_id for product_id, total in totals.items() if total and total > free.get(product_id, 0))
+
+
+def _over_cap_response():
+    return JsonResponse({'error': f'At most {settings.CART_MAX_QUANTITY} of one product per cart'}, status=400)
+
+
+@require_http_methods(["POST"])
+def cart_items_bulk(request):
+    """
+    Add or set many cart lines in one request and one transaction.
+    Body: {"items": [{"product_id": 1, "quantity": 2}, ...], "mode": "add" | "set"}
+    With mode "set" a quantity of 0 removes the line. Like the other cart
+    views it needs the CSRF token (X-CSRFToken header). Lines whose product
+    is unavailable or would go over the stock not held for other orders are
+    returned in "rejected".
+    """
+    try:
+        data = json.loads(request.body)
+        mode = data.get('mode', 'add')
+        quantities = {}
+        for entry in data.get('items', []):
+            quantities[int(entry['product_id'])] = int(entry.get('quantity', 1))
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({'error': 'Expected {"items": [{"product_id": ..., "quantity": ...}]}'}, status=400)
+
+    if mode not in ('add', 'set'):
+        return JsonResponse({'error': 'mode must be "add" or "set"'}, status=400)
+    if not quantities:
+        return JsonResponse({'error': 'No items given'}, status=400)
+    if len(quantities) > settings.CART_BULK_MAX_ITEMS:
+        return JsonResponse({'error': f'At most {settings.CART_BULK_MAX_ITEMS} items per request'}, status=400)
+    if any(quantity < 0 or (mode == 'add' and quantity == 0) for quantity in quantities.values()):
+        return JsonResponse({'error': 'Quantities must be positive'}, status=400)
+
+    cart = request.cart
+    over_cap, rejected = _check_cart_lines(cart, quantities, replace=(mode == 'set'))
+    if over_cap:
+        return _over_cap_response()
+    accepted = {product_id: qty for product_id, qty in quantities.items() if product_id not in rejected}
+
+    if isinstance(cart, CookieCart):
+        products = Product.objects.in_bulk(list(accepted))
+        for product_id, quantity in accepted.items():
+            if mode == 'set' and quantity == 0:
+                cart.remove(product_id)
+            elif mode == 'set' and product_id in cart.lines:
+                cart.update(product_id, quantity)
+            elif not cart.add(products[product_id], quantity):
+                rejected.append(product_id)
+    else:
+        add_items(cart, accepted, replace=(mode == 'set'))
+
+    return JsonResponse({
+        'success': True,
+        'rejected': rejected,
+        'cart': {'item_count': cart.item_count, 'subtotal': str(cart.subtotal)},
+    })
+
+
+def _change_cart_line(request, item_id, quantity):
+    """Set one line of the visitor's cart (0 removes it) and describe the result as JSON"""
+    cart = request.cart
+    if isinstance(cart, CookieCart):
+        if item_id not in cart.lines:
+            return JsonResponse({'error': 'Item not in cart'}, status=404)
+        product_id = item_id
+    else:
+        item = CartItem.objects.select_related('product').filter(cart=cart, id=item_id).first()
+        if item is None:
+            return JsonResponse({'error': 'Item not in cart'}, status=404)
+        product_id = item.product_id
+
+    if quantity:
+        over_cap, rejected = _check_cart_lines(cart, {product_id: quantity}, replace=True)
+        if over_cap:
+            return _over_cap_response()
+        if rejected:
+            return JsonResponse({'error': 'Not enough stock', 'product_id': product_id}, status=409)
+
+    if isinstance(cart, CookieCart):
+        if quantity:
+            cart.update(item_id, quantity)
+        else:
+            cart.remove(item_id)
+        item = next((line for line in cart.get_items() if line.id == item_id), None)
+    else:
+        add_items(cart, {product_id: quantity}, replace=True)
+        item.quantity = quantity
+
+    return JsonResponse({
+        'success': True,
+        'item': {
+            'id': item.id, 'quantity': item.quantity, 'subtotal': str(item.get_subtotal()),
+        } if item and quantity else None,
+        'cart': {'item_count': cart.item_count, 'subtotal': str(cart.subtotal)},
+    })
+
+
+@require_http_methods(["POST"])
+def cart_item_update(request, item_id):
+    """JSON version of update_cart: returns the changed line and the new cart totals"""
+    try:
+        quantity = int(request.POST.get('quantity', ''))
+    except ValueError:
+        return JsonResponse({'error': 'quantity must be a whole number'}, status=400)
+    return _change_cart_line(request, item_id, max(quantity, 0))
+
+
+@require_http_methods(["POST"])
+def cart_item_remove(request, item_id):
+    """JSON version of remove_from_cart"""
+    return _change_cart_line(request, item_id, 0)
+
+
 # views.py - Updated with multiple payment methods
 import json
+import uuid
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
-from django.conf import settings
 from decimal import Decimal
 
-from .models import Cart, CartItem, Order, OrderItem, Product, PaymentTransaction
+from .models import CartItem, Order, Product, PaymentTransaction
 from .paypal_service import PayPalService
 from .mpesa_service import MPesaService
+from .idempotency import idempotent
+from .instrumentation import gateway_call
+from .orders import OutOfStock, place_order, record_mpesa_callback
 
 
 import logging
@@ -152,21 +404,17 @@ logger = logging.getLogger(__name__)
 
 def get_or_create_cart(request):
     """Get or create cart for user or session"""
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-    else:
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-        cart, created = Cart.objects.get_or_create(session_key=session_key)
-    return cart
+    return resolve_cart(request, create=True)
 
 
 def checkout(request):
     """Checkout page with multiple payment options"""
+    if cookie_mode(request) and not CookieCart.for_request(request).lines:
+        messages.warning(request, 'Your cart is empty!')
+        return redirect('cart')
+
     cart = get_or_create_cart(request)
-    cart_items = cart.items.all()
+    cart_items = cart.get_items()
     
     if not cart_items:
         messages.warning(request, 'Your cart is empty!')
@@ -194,87 +442,68 @@ def checkout(request):
         'shipping': shipping,
         'tax': tax,
         'total': total,
+        # One key per rendered page, so resubmitting after a network failure replays the first order
+        'order_idempotency_key': uuid.uuid4().hex,
     }
     return render(request, 'checkout.html', context)
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@idempotent('create_order')
 def create_order(request):
     """Create order after payment (handles all payment methods)"""
     try:
         data = json.loads(request.body)
         
         cart = get_or_create_cart(request)
-        cart_items = cart.items.all()
+        cart_items = cart.get_items()
         
         if not cart_items:
             return JsonResponse({'error': 'Cart is empty'}, status=400)
         
         payment_method = data.get('payment_method', 'paypal')
+        fields = {
+            'first_name': data.get('first_name', ''),
+            'last_name': data.get('last_name', ''),
+            'email': data.get('email', ''),
+            'phone': data.get('phone', ''),
+            'address': data.get('address', ''),
+            'postal_code': data.get('postal_code', ''),
+            'city': data.get('city', ''),
+            'country': data.get('country', 'KE'),
+            'payment_method': payment_method,
+            'currency': data.get('currency', 'USD'),
+            'status': 'processing',
+        }
+        payment = None
         
-        # Create order
-        order = Order.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            first_name=data.get('first_name', ''),
-            last_name=data.get('last_name', ''),
-            email=data.get('email', ''),
-            phone=data.get('phone', ''),
-            address=data.get('address', ''),
-            postal_code=data.get('postal_code', ''),
-            city=data.get('city', ''),
-            country=data.get('country', 'KE'),
-            payment_method=payment_method,
-            total_amount=cart.get_total(),
-            currency=data.get('currency', 'USD'),
-            status='processing'
-        )
-        
-        # Create order items
-        for item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                price=item.product.price,
-                quantity=item.quantity
-            )
-        
-        # Update payment-specific fields
+        # Payment-specific fields
         if payment_method == 'paypal':
-            order.paypal_order_id = data.get('paypal_order_id', '')
-            order.status = 'paid'
-            order.paid_at = timezone.now()
-            
-            # Create transaction record
-            PaymentTransaction.objects.create(
-                order=order,
-                payment_method='paypal',
-                transaction_id=data.get('paypal_order_id', ''),
-                amount=order.total_amount,
-                currency=order.currency,
-                status='completed',
-                response_data=data.get('payment_details', {})
-            )
+            fields.update(paypal_order_id=data.get('paypal_order_id', ''), status='paid', paid_at=timezone.now())
+            payment = {
+                'payment_method': 'paypal',
+                'transaction_id': data.get('paypal_order_id', ''),
+                'amount': cart.get_total(),
+                'currency': fields['currency'],
+                'status': 'completed',
+                'response_data': data.get('payment_details', {}),
+            }
             
         elif payment_method == 'mpesa':
-            order.mpesa_checkout_request_id = data.get('checkout_request_id', '')
             # M-Pesa payment will be confirmed via callback
+            fields['mpesa_checkout_request_id'] = data.get('checkout_request_id', '')
             
         elif payment_method == 'card':
-            order.stripe_payment_intent_id = data.get('payment_intent_id', '')
-            order.status = 'paid'
-            order.paid_at = timezone.now()
+            fields.update(stripe_payment_intent_id=data.get('payment_intent_id', ''), status='paid', paid_at=timezone.now())
         
-        order.save()
-        
-        # Update stock if payment is confirmed
-        if order.status == 'paid':
-            for item in cart_items:
-                item.product.stock -= item.quantity
-                item.product.save()
-            
-            # Clear cart
-            cart_items.delete()
+        # Order, items, stock and cart change together or not at all
+        try:
+            order = place_order(
+                cart, request.user if request.user.is_authenticated else None, fields, payment=payment,
+            )
+        except OutOfStock as e:
+            return JsonResponse({'error': 'Some items are out of stock', 'product_id': e.product_id}, status=409)
         
         return JsonResponse({
             'success': True,
@@ -289,6 +518,7 @@ def create_order(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@idempotent('initiate_mpesa_payment')
 def initiate_mpesa_payment(request):
     """Initiate M-Pesa STK push"""
     try:
@@ -358,46 +588,15 @@ def mpesa_callback(request):
             logger.error(f"Transaction not found for CheckoutRequestID: {checkout_request_id}")
             return JsonResponse({'ResultCode': 1, 'ResultDesc': 'Transaction not found'})
         
-        order = transaction.order
+        # Extract M-Pesa receipt number
+        receipt = None
+        callback_metadata = data.get('Body', {}).get('stkCallback', {}).get('CallbackMetadata', {})
+        for item in callback_metadata.get('Item', []):
+            if item.get('Name') == 'MpesaReceiptNumber':
+                receipt = item.get('Value')
         
-        if result_code == 0:
-            # Payment successful
-            transaction.status = 'completed'
-            transaction.response_data = data
-            transaction.save()
-            
-            # Update order
-            order.status = 'paid'
-            order.paid_at = timezone.now()
-            
-            # Extract M-Pesa receipt number
-            callback_metadata = data.get('Body', {}).get('stkCallback', {}).get('CallbackMetadata', {})
-            items = callback_metadata.get('Item', [])
-            for item in items:
-                if item.get('Name') == 'MpesaReceiptNumber':
-                    order.mpesa_transaction_id = item.get('Value')
-            
-            order.save()
-            
-            # Update stock
-            cart = Cart.objects.filter(
-                models.Q(user=order.user) if order.user else models.Q(session_key=request.session.session_key)
-            ).first()
-            
-            if cart:
-                for item in cart.items.all():
-                    item.product.stock -= item.quantity
-                    item.product.save()
-                cart.items.all().delete()
-            
-        else:
-            # Payment failed
-            transaction.status = 'failed'
-            transaction.response_data = data
-            transaction.save()
-            
-            order.status = 'failed'
-            order.save()
+        # Store the callback and leave the order, stock and cart updates to the job worker
+        record_mpesa_callback(transaction, result_code, receipt, data)
         
         return JsonResponse({'ResultCode': 0, 'ResultDesc': 'Success'})
         
@@ -422,11 +621,12 @@ def create_stripe_payment_intent(request):
             return JsonResponse({'error': 'Amount is required'}, status=400)
         
         # Create payment intent
-        intent = stripe.PaymentIntent.create(
-            amount=int(float(amount) * 100),  # Convert to cents
-            currency=currency.lower(),
-            metadata={'order_id': data.get('order_id')}
-        )
+        with gateway_call():
+            intent = stripe.PaymentIntent.create(
+                amount=int(float(amount) * 100),  # Convert to cents
+                currency=currency.lower(),
+                metadata={'order_id': data.get('order_id')}
+            )
         
         return JsonResponse({
             'success': True,
@@ -438,6 +638,7 @@ def create_stripe_payment_intent(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@order_success_conditional
 def order_success(request, order_id):
     """Order success page"""
     order = get_object_or_404(Order, id=order_id)
@@ -465,18 +666,28 @@ def query_mpesa_status(request, checkout_request_id):
 
 @login_required
 def order_history(request):
-    """User's order history"""
-    orders = Order.objects.filter(user=request.user)
+    """User's order history, one keyset page at a time"""
+    paginator = KeysetPaginator(
+        Order.objects.filter(user=request.user),
+        ordering=('-created_at', '-id'),
+        page_size=get_page_size(request, default=settings.ORDER_HISTORY_PAGE_SIZE),
+    )
+    try:
+        page = paginator.page(request.GET.get('cursor')).build_urls(request)
+    except InvalidCursor:
+        raise Http404('Invalid page cursor')
     context = {
-        'orders': orders,
+        'orders': page,
+        'page': page,
     }
     return render(request, 'order_history.html', context)
 
 
 @login_required
+@order_conditional
 def order_detail(request, order_id):
     """Order detail page"""
-    order = get_object_or_404(Order, id=order_id, user=request.user)
+    order = get_object_or_404(Order.objects.prefetch_related('items__product'), id=order_id, user=request.user)
     context = {
         'order': order,
     }
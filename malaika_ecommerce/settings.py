@@ -31,12 +31,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ecommerce.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'ecommerce.middleware.CartMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -44,7 +46,7 @@ ROOT_URLCONF = 'malaika_ecommerce.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'ecommerce.instrumentation.TimedDjangoTemplates',
         'DIRS': ['templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -52,6 +54,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'ecommerce.context_processors.cart_summary',
             ],
         },
     },
@@ -122,6 +125,84 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 SESSION_COOKIE_AGE = 86400  # 24 hours
 
+# Product search ('auto' uses SQLite FTS5 when available, 'terms' forces the portable index)
+PRODUCT_SEARCH_BACKEND = 'auto'
+PRODUCT_SEARCH_LIMIT = 500
+
+# Cache (set CACHE_BACKEND=file to share the cache between worker processes)
+if os.environ.get('CACHE_BACKEND') == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / '.cache')),
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'malaika',
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
+CATALOG_CACHE_TIMEOUT = 300  # seconds; entries are also invalidated by catalog version bumps
+
+PRODUCT_CARD_CACHE_TIMEOUT = 86400  # card fragments are keyed on updated_at, so they never go stale
+
+# Catalog pagination
+CATALOG_PAGE_SIZE = 24
+CATALOG_PAGE_SIZE_MAX = 96
+ORDER_HISTORY_PAGE_SIZE = 20
+
+# Anonymous carts: 'cookie' keeps them in a signed cookie until checkout or login,
+# 'db' stores a session and Cart row for every visitor who opens the cart
+ANONYMOUS_CART_STORAGE = os.environ.get('ANONYMOUS_CART_STORAGE', 'cookie')
+CART_COOKIE_AGE = 60 * 60 * 24 * 30  # 30 days
+CART_COOKIE_MAX_LINES = 100  # keeps the signed cookie well under the 4KB browser limit
+CART_BULK_MAX_ITEMS = 100  # lines accepted by one cart_items_bulk request
+CART_MAX_QUANTITY = 99  # units of one product a cart_items_bulk line may hold
+
+# Stock held for an order awaiting payment confirmation (M-Pesa callbacks take 30-90 seconds)
+STOCK_RESERVATION_SECONDS = 60 * 10
+
+# How long a response to a request with an Idempotency-Key is replayed to retries
+IDEMPOTENCY_KEY_SECONDS = 60 * 60 * 24
+
+# Background jobs (manage.py run_jobs)
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BASE_SECONDS = 10  # retry n waits base * 2 ** (n - 1), capped at JOB_RETRY_MAX_SECONDS
+JOB_RETRY_MAX_SECONDS = 60 * 60
+JOB_LOCK_TIMEOUT_SECONDS = 60 * 5  # running jobs older than this belong to a dead worker and are requeued
+
+# Payment gateway OAuth tokens, shared through the cache (use CACHE_BACKEND=file so workers share them)
+OAUTH_TOKEN_REFRESH_MARGIN = 60 * 5  # refresh this long before expiry, while the old token still works
+OAUTH_TOKEN_LOCK_SECONDS = 30  # how long one worker may hold the refresh, and others wait for it
+
+# Request metrics (Server-Timing header and a JSON log line per sampled request)
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', '1.0' if DEBUG else '0.05'))
+REQUEST_METRICS_N_PLUS_ONE_THRESHOLD = 5  # same SQL with different parameters this often in one request
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'ecommerce.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_METRICS_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        'ecommerce.jobs': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # Messages
 from django.contrib.messages import constants as messages
 MESSAGE_TAGS = {
@@ -202,6 +202,99 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // ==============================================
+    // CART QUANTITY & REMOVAL WITHOUT PAGE RELOADS
+    // ==============================================
+    // The JSON endpoints return only the changed line and the new totals;
+    // the page is patched in place. On any failure fall back to the plain
+    // form post / link so the cart still works.
+    function postCartChange(url, data) {
+        const token = document.querySelector('[name=csrfmiddlewaretoken]');
+        return fetch(url, {
+            method: 'POST',
+            headers: {'X-CSRFToken': token ? token.value : ''},
+            body: data,
+            credentials: 'same-origin'
+        }).then(response => {
+            if (response.status === 400 || response.status === 409) {
+                // Over the per-product cap or the stock left: nothing was changed
+                return response.json().then(data => {
+                    const error = new Error(data.error);
+                    error.rejected = true;
+                    throw error;
+                });
+            }
+            if (!response.ok) {
+                throw new Error('Cart update failed: ' + response.status);
+            }
+            return response.json();
+        });
+    }
+
+    function applyCartChange(card, data) {
+        if (data.item) {
+            card.querySelector('.qty-input').value = data.item.quantity;
+            card.querySelector('.subtotal-amount').textContent = '$' + data.item.subtotal;
+        } else {
+            card.remove();
+        }
+
+        const lines = document.querySelectorAll('.cart-item-card').length;
+        if (lines === 0) {
+            // Let the server render the empty cart page
+            window.location.reload();
+            return;
+        }
+        const cartCount = document.querySelector('.cart-count');
+        if (cartCount) {
+            cartCount.textContent = lines + ' item' + (lines === 1 ? '' : 's') + ' in your cart';
+        }
+        document.querySelectorAll('[data-cart-lines]').forEach(el => el.textContent = lines);
+        document.querySelectorAll('[data-cart-subtotal]').forEach(el => el.textContent = '$' + data.cart.subtotal);
+        updateCartBadge(data.cart.item_count);
+    }
+
+    document.querySelectorAll('.cart-item-card[data-update-url]').forEach(card => {
+        const form = card.querySelector('form');
+        const input = card.querySelector('.qty-input');
+        const buttons = card.querySelectorAll('.qty-btn');
+
+        buttons.forEach(button => {
+            button.addEventListener('click', function() {
+                const value = parseInt(input.value) + parseInt(this.dataset.qtyStep);
+                if (value < 1 || value > parseInt(input.max)) {
+                    return;
+                }
+                const previous = input.value;
+                input.value = value;
+                buttons.forEach(b => b.disabled = true);
+                postCartChange(card.dataset.updateUrl, new FormData(form))
+                    .then(data => applyCartChange(card, data))
+                    .catch(error => {
+                        if (!error.rejected) {
+                            form.submit();
+                            return;
+                        }
+                        input.value = previous;
+                        alert(error.message);
+                    })
+                    .finally(() => buttons.forEach(b => b.disabled = false));
+            });
+        });
+
+        const removeButton = card.querySelector('.remove-btn');
+        removeButton.addEventListener('click', function(e) {
+            e.preventDefault();
+            if (!confirm('Remove this item from cart?')) {
+                return;
+            }
+            card.style.opacity = '0.5';
+            postCartChange(card.dataset.removeUrl, new FormData(form))
+                .then(data => applyCartChange(card, data))
+                .catch(() => window.location.href = removeButton.href);
+        });
+    });
+
     // ==============================================
     // CONSOLE INFO
     // ==============================================